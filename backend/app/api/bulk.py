@@ -0,0 +1,97 @@
+import json
+from typing import Any, Dict, List, Tuple, Type
+from fastapi import HTTPException, Request, status
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError
+from app.db.mongodb import mongodb
+
+MAX_BULK_RECORDS = 5000
+
+async def read_bulk_records(request: Request) -> Tuple[List[Tuple[int, Any]], List[dict]]:
+    # Accepts either a JSON array or one JSON document per line (NDJSON)
+    body = await request.body()
+    records, errors = [], []
+    if "ndjson" in request.headers.get("content-type", ""):
+        try:
+            text = body.decode()
+        except UnicodeDecodeError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"NDJSON body is not valid UTF-8: {exc}"
+            )
+        lines = [line for line in text.splitlines() if line.strip()]
+        for index, line in enumerate(lines):
+            try:
+                records.append((index, json.loads(line)))
+            except ValueError as exc:
+                errors.append({"index": index, "detail": f"Invalid JSON: {exc}"})
+    else:
+        try:
+            payload = json.loads(body or b"[]")
+        except ValueError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid JSON: {exc}"
+            )
+        if not isinstance(payload, list):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Expected a JSON array of records"
+            )
+        records = list(enumerate(payload))
+
+    if len(records) + len(errors) > MAX_BULK_RECORDS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_BULK_RECORDS} records per request"
+        )
+    return records, errors
+
+def _format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+def validate_records(
+    records: List[Tuple[int, Any]], model: Type[BaseModel]
+) -> Tuple[Dict[int, BaseModel], List[dict]]:
+    valid, errors = {}, []
+    for index, record in records:
+        try:
+            valid[index] = model.model_validate(record)
+        except ValidationError as exc:
+            errors.append({"index": index, "detail": _format_validation_error(exc)})
+    return valid, errors
+
+async def insert_records(collection, documents: Dict[int, dict]) -> Tuple[List[int], List[dict]]:
+    # Unordered, so one bad row doesn't stop the rest of the batch
+    if not documents:
+        return [], []
+
+    indices = list(documents)
+    failed = {}
+    try:
+        await collection.insert_many([documents[index] for index in indices], ordered=False)
+    except BulkWriteError as exc:
+        for write_error in exc.details.get("writeErrors", []):
+            failed[indices[write_error["index"]]] = write_error.get("errmsg", "Write failed")
+
+    inserted = [index for index in indices if index not in failed]
+    errors = [{"index": index, "detail": detail} for index, detail in failed.items()]
+    return inserted, errors
+
+def partition_records(documents: Dict[int, dict]) -> Dict[str, Dict[int, dict]]:
+    # Rows of one batch can belong to MRFs in different partitions; each group is
+    # inserted into its own database, keeping the original indices
+    groups = {}
+    for index, document in documents.items():
+        groups.setdefault(mongodb.partition_of(document.get("mrf_id")), {})[index] = document
+    return groups
+
+def bulk_result(received: int, inserted: List[int], errors: List[dict]) -> dict:
+    return {
+        "received": received,
+        "inserted": len(inserted),
+        "errors": sorted(errors, key=lambda error: error["index"])
+    }
@@ -1,35 +1,126 @@
-from typing import Generator, Optional
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt
-from pydantic import ValidationError
+from pymongo.errors import PyMongoError
+from bson import ObjectId
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.core.security import verify_token
-from app.models.user import User
+from app.core.security import is_token_revoked, revocation_time, token_revocations, verify_token
+from app.models.user import User, UserClaims
 from app.db.mongodb import mongodb
 
+logger = logging.getLogger(__name__)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
-    credentials_exception = HTTPException(
+# Users resolved from tokens, keyed by user id
+user_cache = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def _token_payload(token: str) -> dict:
     payload = verify_token(token)
     if payload is None:
-        raise credentials_exception
+        raise _credentials_exception()
     
     user_id: str = payload.get("sub")
-    if user_id is None:
-        raise credentials_exception
+    if user_id is None or not ObjectId.is_valid(user_id):
+        raise _credentials_exception()
+    if is_token_revoked(payload):
+        raise _credentials_exception()
+    return payload
+
+async def _load_user(user_id: str) -> User:
+    cached_user = user_cache.get(user_id)
+    if cached_user is not None:
+        return cached_user
     
-    user = await mongodb.get_db()["users"].find_one({"_id": user_id})
+    user = await mongodb.get_db()["users"].find_one({"_id": ObjectId(user_id)})
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     
-    return User(**user)
+    current_user = User(**user)
+    user_cache.set(user_id, current_user)
+    return current_user
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    payload = _token_payload(token)
+    return await _load_user(payload["sub"])
+
+async def get_current_claims(token: str = Depends(oauth2_scheme)) -> UserClaims:
+    # Read-only endpoints authorize from the token alone
+    payload = _token_payload(token)
+    if "role" not in payload:
+        # Tokens issued before claims were embedded need the user record
+        user = await _load_user(payload["sub"])
+        return UserClaims(id=user.id, role=user.role, mrf_id=user.mrf_id, is_active=user.is_active)
+    return UserClaims(
+        id=payload["sub"],
+        role=payload["role"],
+        mrf_id=payload.get("mrf_id"),
+        is_active=payload.get("is_active", True),
+    )
+
+def token_claims(user: dict) -> dict:
+    return {
+        "sub": str(user["_id"]),
+        "role": user["role"],
+        "mrf_id": user.get("mrf_id"),
+        "is_active": user.get("is_active", True),
+    }
+
+async def revoke_user_tokens(user_id: str) -> None:
+    # Tokens issued so far carry stale claims; the user has to log in again
+    now = datetime.utcnow()
+    # Truncated to what MongoDB stores, so every worker compares against the same instant
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    await mongodb.get_db()["users"].update_one(
+        {"_id": ObjectId(user_id)}, {"$set": {"tokens_valid_after": now}}
+    )
+    token_revocations[user_id] = revocation_time(now)
+    user_cache.invalidate(user_id)
+
+async def load_token_revocations() -> None:
+    users = mongodb.get_db()["users"].find(
+        {"tokens_valid_after": {"$exists": True}}, {"tokens_valid_after": 1}
+    )
+    revocations = {
+        str(user["_id"]): revocation_time(user["tokens_valid_after"])
+        async for user in users
+    }
+    token_revocations.clear()
+    token_revocations.update(revocations)
+
+async def refresh_token_revocations() -> None:
+    # Picks up revocations made by other workers
+    while True:
+        await asyncio.sleep(settings.TOKEN_REVOCATION_REFRESH_SECONDS)
+        try:
+            await load_token_revocations()
+        except PyMongoError as exc:
+            logger.error("Could not refresh token revocations: %s", exc)
+
+async def watch_user_changes() -> None:
+    # Drop cached users that another worker has modified
+    try:
+        async with mongodb.get_db()["users"].watch(full_document="updateLookup") as stream:
+            async for change in stream:
+                user_id = str(change["documentKey"]["_id"])
+                user_cache.invalidate(user_id)
+                user = change.get("fullDocument") or {}
+                if "tokens_valid_after" in user:
+                    token_revocations[user_id] = revocation_time(user["tokens_valid_after"])
+    except PyMongoError as exc:
+        logger.warning("User cache change stream stopped: %s", exc)
+        user_cache.clear()
 
 async def get_current_active_user(
     current_user: User = Depends(get_current_user),
@@ -38,6 +129,13 @@ async def get_current_active_user(
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+async def get_current_active_claims(
+    current_user: UserClaims = Depends(get_current_claims),
+) -> UserClaims:
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
+
 def get_current_active_manager(
     current_user: User = Depends(get_current_active_user),
 ) -> User:
@@ -49,11 +147,19 @@ def get_current_active_manager(
     return current_user
 
 def get_current_active_panchayat(
-    current_user: User = Depends(get_current_active_user),
-) -> User:
+    current_user: UserClaims = Depends(get_current_active_claims),
+) -> UserClaims:
     if current_user.role != "panchayat":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="The user doesn't have enough privileges",
         )
-    return current_user 
\ No newline at end of file
+    return current_user 
+
+def require_mrf_scope(mrf_ids: Optional[List[str]], current_user: UserClaims) -> None:
+    # Data across every MRF is for panchayat officials, like the panchayat report
+    if not mrf_ids and current_user.role != "panchayat":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="The user doesn't have enough privileges",
+        )
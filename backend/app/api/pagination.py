@@ -0,0 +1,87 @@
+import base64
+import binascii
+from typing import Optional, Sequence, Type
+from bson import json_util
+from fastapi import HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from app.api.serialization import encode_row, rows_response
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(document: dict, keys: Sequence[str]) -> str:
+    values = [document.get(key) for key in keys]
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str, keys: Sequence[str]) -> list:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        values = None
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return values
+
+def keyset_query(query: dict, cursor: Optional[str], keys: Sequence[str]) -> dict:
+    if not cursor:
+        return query
+    return keyset_after(query, decode_cursor(cursor, keys), keys)
+
+def keyset_after(query: dict, values: Sequence, keys: Sequence[str]) -> dict:
+    # Everything strictly after values in (keys...) order
+    after = []
+    for i, key in enumerate(keys):
+        clause = {keys[j]: values[j] for j in range(i)}
+        clause[key] = {"$gt": values[i]}
+        after.append(clause)
+    return {"$and": [query, {"$or": after}]}
+
+async def fetch_page(
+    collection,
+    query: dict,
+    model: Type[BaseModel],
+    limit: Optional[int],
+    cursor: Optional[str],
+    keys: Sequence[str] = ("date", "_id"),
+) -> Response:
+    limit = limit or DEFAULT_PAGE_SIZE
+    documents = await collection.find(keyset_query(query, cursor, keys)).sort(
+        [(key, 1) for key in keys]
+    ).limit(limit + 1).to_list(length=limit + 1)
+
+    # The extra row only tells us whether another page exists
+    headers = {}
+    if len(documents) > limit:
+        documents = documents[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(documents[-1], keys)
+    return rows_response(model, documents, headers)
+
+def stream_ndjson(
+    collection,
+    query: dict,
+    model: Type[BaseModel],
+    cursor: Optional[str] = None,
+    keys: Sequence[str] = ("date", "_id"),
+) -> StreamingResponse:
+    mongo_cursor = collection.find(keyset_query(query, cursor, keys)).sort(
+        [(key, 1) for key in keys]
+    ).batch_size(STREAM_BATCH_SIZE)
+
+    async def rows():
+        # Only one batch of rows is held in memory at a time
+        batch = []
+        async for document in mongo_cursor:
+            batch.append(encode_row(model, document))
+            if len(batch) >= STREAM_BATCH_SIZE:
+                yield b"\n".join(batch) + b"\n"
+                batch = []
+        if batch:
+            yield b"\n".join(batch) + b"\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
@@ -0,0 +1,68 @@
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+import orjson
+from bson import ObjectId
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from app.core.config import settings
+
+def _default(value: Any) -> Any:
+    # orjson encodes datetimes, enums and numpy values itself; only BSON types need help
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+@lru_cache(maxsize=None)
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    # Building a TypeAdapter compiles a validator, so there is one per model
+    return TypeAdapter(List[model])
+
+@lru_cache(maxsize=None)
+def row_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(model)
+
+@lru_cache(maxsize=None)
+def _fields(model: Type[BaseModel]) -> Tuple[Tuple[str, Any, Optional[Callable[[], Any]]], ...]:
+    # (output key, default, default factory) per model field
+    return tuple(
+        (field.alias or name, None if field.is_required() else field.default, field.default_factory)
+        for name, field in model.model_fields.items()
+    )
+
+def trusted_row(model: Type[BaseModel], document: dict) -> dict:
+    # Only the model's fields, so stored-only ones such as hashed_password stay out. A
+    # missing field gets what validation would give it, default_factory included
+    return {
+        key: document[key] if key in document else (factory() if factory else default)
+        for key, default, factory in _fields(model)
+    }
+
+def encode_rows(model: Type[BaseModel], documents: List[dict]) -> bytes:
+    # Each row is validated once and serialized by pydantic-core, instead of building
+    # models that FastAPI then validates and encodes again; trusted reads skip validation
+    if settings.TRUST_DB_READS:
+        return dumps([trusted_row(model, document) for document in documents])
+    adapter = list_adapter(model)
+    return adapter.dump_json(adapter.validate_python(documents), by_alias=True)
+
+def encode_row(model: Type[BaseModel], document: dict) -> bytes:
+    if settings.TRUST_DB_READS:
+        return dumps(trusted_row(model, document))
+    adapter = row_adapter(model)
+    return adapter.dump_json(adapter.validate_python(document), by_alias=True)
+
+def jsonable_rows(model: Type[BaseModel], documents: List[dict]) -> List[dict]:
+    # Same as encode_rows, for rows that go inside a larger response
+    if settings.TRUST_DB_READS:
+        return [trusted_row(model, document) for document in documents]
+    adapter = list_adapter(model)
+    return adapter.dump_python(adapter.validate_python(documents), mode="json", by_alias=True)
+
+def rows_response(
+    model: Type[BaseModel], documents: List[dict], headers: Optional[Dict[str, str]] = None
+) -> Response:
+    # A Response returned from a handler bypasses response_model, which stays for the docs
+    return Response(content=encode_rows(model, documents), media_type="application/json", headers=headers)
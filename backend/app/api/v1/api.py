@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import auth, users, waste, sales, reports
+from app.api.v1.endpoints import auth, users, waste, sales, reports, export, inventory, events, sync
 
 api_router = APIRouter()
  
@@ -7,4 +7,8 @@ api_router.include_router(auth.router, prefix="/auth", tags=["authentication"])
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(waste.router, prefix="/waste", tags=["waste management"])
 api_router.include_router(sales.router, prefix="/sales", tags=["sales"])
-api_router.include_router(reports.router, prefix="/reports", tags=["reports"]) 
\ No newline at end of file
+api_router.include_router(reports.router, prefix="/reports", tags=["reports"])
+api_router.include_router(export.router, prefix="/export", tags=["export"])
+api_router.include_router(inventory.router, prefix="/inventory", tags=["inventory"])
+api_router.include_router(events.router, prefix="/events", tags=["events"])
+api_router.include_router(sync.router, prefix="/sync", tags=["sync"]) 
\ No newline at end of file
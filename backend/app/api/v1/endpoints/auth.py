@@ -3,10 +3,12 @@ from typing import Any
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from app.core.config import settings
-from app.core.security import create_access_token, get_password_hash, verify_password
+from app.core.security import create_access_token, get_password_hash_async, verify_password_async
 from app.models.user import User, UserCreate, UserInDB
+from app.api.deps import token_claims
 from app.db.mongodb import mongodb
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 router = APIRouter()
 
@@ -15,7 +17,7 @@ async def login(
     form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     user = await mongodb.get_db()["users"].find_one({"email": form_data.username})
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    if not user or not await verify_password_async(form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -24,7 +26,7 @@ async def login(
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": str(user["_id"])}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     
     return {
@@ -35,20 +37,20 @@ async def login(
 
 @router.post("/register", response_model=User)
 async def register(user_in: UserCreate) -> Any:
-    # Check if user already exists
-    if await mongodb.get_db()["users"].find_one({"email": user_in.email}):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered",
-        )
-    
     # Create new user
     user_dict = user_in.dict()
-    user_dict["hashed_password"] = get_password_hash(user_in.password)
+    user_dict["hashed_password"] = await get_password_hash_async(user_in.password)
     del user_dict["password"]
     
     user = UserInDB(**user_dict)
-    result = await mongodb.get_db()["users"].insert_one(user.dict(by_alias=True))
+    user_doc = user.dict(by_alias=True)
     
-    created_user = await mongodb.get_db()["users"].find_one({"_id": result.inserted_id})
-    return User(**created_user) 
\ No newline at end of file
+    # The unique email index rejects existing users
+    try:
+        await mongodb.get_db()["users"].insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered",
+        )
+    return User(**user_doc) 
\ No newline at end of file
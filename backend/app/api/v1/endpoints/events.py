@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.core.events import TooManySubscribers, event_broker, format_event
+from app.models.user import UserClaims
+from app.api.deps import get_current_active_claims, require_mrf_scope
+from app.db.mongodb import mongodb
+from app.db.rollups import ROLLUP_COLLECTION, ROLLUP_FIELDS, day_start
+
+router = APIRouter()
+
+async def seed_totals(mrf_id: Optional[str]) -> datetime:
+    # Today's totals so far come from the rollups; the broker keeps them current from here
+    today = day_start(datetime.utcnow())
+    query = {"day": today}
+    if mrf_id:
+        query["mrf_id"] = mrf_id
+    totals = {mrf_id: {}} if mrf_id else {}
+    partitions = [mongodb.partition_of(mrf_id)] if mrf_id else mongodb.partition_names()
+    for partition in partitions:
+        async for row in mongodb.get_partition_db(partition)[ROLLUP_COLLECTION].find(query, {"_id": 0}):
+            counters = totals.setdefault(row["mrf_id"], {})
+            for field in ROLLUP_FIELDS:
+                if field in row:
+                    counters[field] = counters.get(field, 0) + row[field]
+    event_broker.seed_totals(today, totals)
+    return today
+
+@router.get("/stream")
+async def stream_events(
+    mrf_id: Optional[str] = None,
+    current_user: UserClaims = Depends(get_current_active_claims)
+) -> Any:
+    # Server-Sent Events: a "snapshot" of today's totals, then one "ledger" event per change
+    require_mrf_scope([mrf_id] if mrf_id else None, current_user)
+    try:
+        subscription = event_broker.subscribe(mrf_id)
+    except TooManySubscribers:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many live subscribers, please retry later"
+        )
+    try:
+        today = await seed_totals(mrf_id)
+    except BaseException:
+        event_broker.unsubscribe(subscription)
+        raise
+
+    async def events():
+        try:
+            snapshot = event_broker.day_totals(today)
+            if mrf_id:
+                snapshot = {mrf_id: snapshot.get(mrf_id)}
+            yield format_event("snapshot", {"day": today, "totals": snapshot})
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=settings.EVENTS_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if subscription.lagged:
+                    subscription.lagged = False
+                    yield format_event("resync", {"dropped": subscription.dropped})
+                yield message
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
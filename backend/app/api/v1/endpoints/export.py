@@ -0,0 +1,153 @@
+import csv
+import io
+import logging
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Any, AsyncIterator, List, Tuple
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from app.models.user import UserClaims
+from app.api.deps import get_current_active_claims
+from app.db.archive import LEDGER_COLUMNS, arrow_schema, column_value, columns_of
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_COLUMNS = LEDGER_COLUMNS
+
+class ExportCollection(str, Enum):
+    waste_intake = "waste_intake"
+    sorted_waste = "sorted_waste"
+    waste_sales = "waste_sales"
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    arrow = "arrow"
+    parquet = "parquet"
+
+MEDIA_TYPES = {
+    ExportFormat.csv: "text/csv",
+    ExportFormat.arrow: "application/vnd.apache.arrow.stream",
+    ExportFormat.parquet: "application/vnd.apache.parquet",
+}
+
+class _ChunkSink(io.RawIOBase):
+    # File-like target for Arrow/Parquet writers that hands back what was written so far
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+async def _batches(cursor, stats: dict) -> AsyncIterator[List[dict]]:
+    while True:
+        batch = await cursor.to_list(length=EXPORT_BATCH_SIZE)
+        if not batch:
+            return
+        stats["rows"] += len(batch)
+        yield batch
+
+async def _csv_chunks(cursor, columns: List[Tuple[str, str]], stats: dict) -> AsyncIterator[bytes]:
+    names = [name for name, _ in columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    async for batch in _batches(cursor, stats):
+        for document in batch:
+            writer.writerow([
+                value.isoformat() if isinstance(value, datetime) else ("" if value is None else value)
+                for value in (column_value(document.get(name)) for name in names)
+            ])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+async def _arrow_chunks(
+    cursor, columns: List[Tuple[str, str]], stats: dict, parquet: bool
+) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(pa, columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if parquet else pa.ipc.new_stream(sink, schema)
+    # One record batch (a Parquet row group) per Mongo batch keeps memory bounded
+    async for batch in _batches(cursor, stats):
+        writer.write_batch(pa.record_batch(list(columns_of(batch, columns).values()), schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+async def _timed(chunks: AsyncIterator[bytes], collection: str, stats: dict) -> AsyncIterator[bytes]:
+    started = time.perf_counter()
+    async for chunk in chunks:
+        yield chunk
+    elapsed = time.perf_counter() - started
+    rows = stats["rows"]
+    logger.info(
+        "Exported %d %s rows in %.2fs (%.0f rows/s)",
+        rows, collection, elapsed, rows / elapsed if elapsed else 0.0
+    )
+
+@router.get("/{collection}")
+async def export_collection(
+    collection: ExportCollection,
+    mrf_id: str,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    format: ExportFormat = ExportFormat.csv,
+    current_user: UserClaims = Depends(get_current_active_claims)
+) -> Any:
+    if format != ExportFormat.csv:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Arrow and Parquet exports need pyarrow installed"
+            )
+
+    query = {"mrf_id": mrf_id}
+    if start_date and end_date:
+        query["date"] = {"$gte": start_date, "$lte": end_date}
+
+    columns = EXPORT_COLUMNS[collection.value]
+    stats = {"rows": 0}
+
+    # Raw documents go straight into columns; no model is built per row
+    cursor = mongodb.get_tenant_report_db(mrf_id)[collection.value].find(
+        query, {name: 1 for name, _ in columns}
+    ).sort([("date", 1), ("_id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+
+    if format == ExportFormat.csv:
+        chunks = _csv_chunks(cursor, columns, stats)
+    else:
+        chunks = _arrow_chunks(cursor, columns, stats, parquet=format == ExportFormat.parquet)
+
+    filename = f"{collection.value}-{mrf_id}.{format.value}"
+    return StreamingResponse(
+        _timed(chunks, collection.value, stats),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
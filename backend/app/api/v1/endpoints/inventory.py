@@ -0,0 +1,46 @@
+from typing import List, Any
+from fastapi import APIRouter, Depends, HTTPException, status
+from app.models.waste import InventoryItem
+from app.models.user import User, UserClaims
+from app.api.deps import get_current_active_claims, get_current_active_manager
+from app.api.serialization import rows_response
+from app.db.mongodb import mongodb
+from app.db.inventory import INVENTORY_COLLECTION, verify_inventory
+
+router = APIRouter()
+
+@router.get("/", response_model=List[InventoryItem])
+async def get_inventory(
+    mrf_id: str,
+    current_user: UserClaims = Depends(get_current_active_claims)
+) -> Any:
+    items = await mongodb.get_tenant_db(mrf_id)[INVENTORY_COLLECTION].find(
+        {"mrf_id": mrf_id}
+    ).sort("category", 1).to_list(length=None)
+    return rows_response(InventoryItem, items)
+
+@router.get("/drift", response_model=dict)
+async def get_inventory_drift(
+    current_user: User = Depends(get_current_active_manager)
+) -> Any:
+    mismatches = []
+    for partition in mongodb.partition_names():
+        mismatches += await verify_inventory(mongodb.get_partition_db(partition), partition)
+    return {"mismatches": mismatches, "count": len(mismatches)}
+
+@router.get("/{category}", response_model=InventoryItem)
+async def get_category_stock(
+    category: str,
+    mrf_id: str,
+    current_user: UserClaims = Depends(get_current_active_claims)
+) -> Any:
+    # One lookup on the unique (mrf_id, category) index
+    item = await mongodb.get_tenant_db(mrf_id)[INVENTORY_COLLECTION].find_one(
+        {"mrf_id": mrf_id, "category": category}
+    )
+    if not item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No stock recorded for this category"
+        )
+    return InventoryItem(**item)
@@ -1,206 +1,914 @@
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.models.user import User
-from app.api.deps import get_current_active_user, get_current_active_panchayat
-from app.db.mongodb import mongodb
+import asyncio
+import hashlib
+import heapq
+import time
+from collections import defaultdict
+from itertools import chain
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from app.api.serialization import dumps
+from app.core.cache import report_cache
+from app.core.config import settings
+from app.models.user import UserClaims
+from app.api.deps import get_current_active_claims, get_current_active_panchayat, require_mrf_scope
+from app.db.mongodb import DEFAULT_PARTITION, mongodb
+from app.db.archive import archive_store
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.db.rollups import MONTHLY_ROLLUP_COLLECTION, ROLLUP_COLLECTION, ROLLUP_FIELDS, ROLLUP_KEY, day_start, month_start, naive_utc
 from datetime import datetime, timedelta
 from bson import ObjectId
 
 router = APIRouter()
 
-@router.get("/daily", response_model=dict)
-async def get_daily_report(
-    mrf_id: str,
-    date: datetime,
-    current_user: User = Depends(get_current_active_user)
-) -> Any:
-    # Get waste intake for the day
-    intake_pipeline = [
-        {
-            "$match": {
-                "mrf_id": mrf_id,
-                "date": {
-                    "$gte": datetime.combine(date.date(), datetime.min.time()),
-                    "$lte": datetime.combine(date.date(), datetime.max.time())
-                }
-            }
-        },
-        {
-            "$group": {
-                "_id": None,
-                "total_weight": {"$sum": "$weight"},
-                "count": {"$sum": 1}
-            }
-        }
-    ]
-    
-    intake_summary = await mongodb.get_db()["waste_intake"].aggregate(intake_pipeline).to_list(length=None)
-    
-    # Get sorted waste for the day
-    sorted_pipeline = [
-        {
-            "$match": {
-                "date": {
-                    "$gte": datetime.combine(date.date(), datetime.min.time()),
-                    "$lte": datetime.combine(date.date(), datetime.max.time())
-                }
-            }
-        },
-        {
-            "$group": {
-                "_id": "$category",
-                "total_weight": {"$sum": "$weight"}
-            }
-        }
+async def run_stages(response: Response, stages: Dict[str, Awaitable]) -> Dict[str, Any]:
+    # Run independent report queries concurrently under one deadline; on timeout or
+    # failure the remaining stages are cancelled, and maxTimeMS stops them server-side
+    timings = {}
+
+    async def timed(name: str, stage: Awaitable) -> Any:
+        started = time.perf_counter()
+        try:
+            return await stage
+        finally:
+            timings[name] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    tasks = {name: asyncio.ensure_future(timed(name, stage)) for name, stage in stages.items()}
+    done, pending = await asyncio.wait(
+        tasks.values(),
+        timeout=settings.REPORT_TIMEOUT_SECONDS,
+        return_when=asyncio.FIRST_EXCEPTION
+    )
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    if settings.DEBUG:
+        timings["total"] = (time.perf_counter() - started) * 1000
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={duration:.1f}" for name, duration in timings.items()
+        )
+
+    for task in done:
+        if task.exception() is not None:
+            raise task.exception()
+    if pending:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Report took too long to compute"
+        )
+    return {name: task.result() for name, task in tasks.items()}
+
+def partition_stages(
+    mrf_ids: Optional[List[str]], build: Callable[[Any, Optional[List[str]]], Dict[str, Awaitable]]
+) -> Dict[str, Awaitable]:
+    # Scatter: build(report_db, mrf_ids of that partition) for every partition holding
+    # one of mrf_ids (every partition when None), all run concurrently by run_stages;
+    # stages outside the default partition are named "stage@partition"
+    stages = {}
+    for partition, partition_mrf_ids in mongodb.tenant_groups(mrf_ids).items():
+        for name, stage in build(mongodb.get_partition_report_db(partition), partition_mrf_ids).items():
+            stages[name if partition == DEFAULT_PARTITION else f"{name}@{partition}"] = stage
+    return stages
+
+def gathered(results: Dict[str, Any], name: str) -> list:
+    # Gather: the rows of one stage across every partition
+    return [row for stage, rows in results.items() if stage.split("@", 1)[0] == name for row in rows]
+
+def max_time_ms() -> int:
+    return int(settings.REPORT_TIMEOUT_SECONDS * 1000)
+
+async def cached_report(
+    request: Request,
+    response: Response,
+    key: str,
+    scope: tuple,
+    compute: Callable[[], Awaitable[dict]],
+) -> Response:
+    # scope is (mrf_id or None for all MRFs, first day, last day); writes to any
+    # day inside it evict the entry, see rollups.apply_rollups
+    scope_mrf, first, last = scope
+    scope = (scope_mrf, naive_utc(first), naive_utc(last))
+    entry = await report_cache.get(key)
+    if entry is None:
+        generation = await report_cache.generation()
+        body = dumps(await compute())
+        entry = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+        await report_cache.set(key, entry, scope, generation)
+
+    etag, body = entry
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if "server-timing" in response.headers:
+        headers["Server-Timing"] = response.headers["server-timing"]
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def merge_rollups(rows: Iterable[dict]) -> List[dict]:
+    # Archived rows and rows written to an archived month afterwards share keys; they add up
+    merged = {}
+    for row in rows:
+        key = tuple(row.get(field) for field in ROLLUP_KEY)
+        if key not in merged:
+            merged[key] = dict(row)
+            continue
+        for field in ROLLUP_FIELDS:
+            merged[key][field] = merged[key].get(field, 0) + row.get(field, 0)
+    return list(merged.values())
+
+def summarize_rollups(rollups: List[dict]) -> dict:
+    # Shape one day's rollup rows like the per-collection aggregations used to
+    intake_weight = sum(row.get("intake_weight", 0) for row in rollups)
+    intake_count = sum(row.get("intake_count", 0) for row in rollups)
+    if intake_count:
+        waste_intake = {"_id": None, "total_weight": intake_weight, "count": intake_count}
+    else:
+        waste_intake = {"total_weight": 0, "count": 0}
+
+    sorted_waste = [
+        {"_id": row["category"], "total_weight": row.get("sorted_weight", 0)}
+        for row in rollups
+        if row.get("category") is not None and row.get("sorted_count", 0)
     ]
-    
-    sorted_summary = await mongodb.get_db()["sorted_waste"].aggregate(sorted_pipeline).to_list(length=None)
-    
-    # Get sales for the day
-    sales_pipeline = [
-        {
-            "$match": {
-                "mrf_id": mrf_id,
-                "date": {
-                    "$gte": datetime.combine(date.date(), datetime.min.time()),
-                    "$lte": datetime.combine(date.date(), datetime.max.time())
-                }
-            }
-        },
+    sales = [
         {
-            "$group": {
-                "_id": "$category",
-                "total_weight": {"$sum": "$weight"},
-                "total_amount": {"$sum": "$total_amount"},
-                "count": {"$sum": 1}
-            }
+            "_id": row["category"],
+            "total_weight": row.get("sales_weight", 0),
+            "total_amount": row.get("sales_amount", 0),
+            "count": row.get("sales_count", 0)
         }
+        for row in rollups
+        if row.get("category") is not None and row.get("sales_count", 0)
     ]
-    
-    sales_summary = await mongodb.get_db()["waste_sales"].aggregate(sales_pipeline).to_list(length=None)
-    
+
     return {
-        "date": date.date(),
-        "waste_intake": intake_summary[0] if intake_summary else {"total_weight": 0, "count": 0},
-        "sorted_waste": sorted_summary,
-        "sales": sales_summary
+        "waste_intake": waste_intake,
+        "sorted_waste": sorted_waste,
+        "sales": sales
     }
 
+@router.get("/daily", response_model=dict)
+async def get_daily_report(
+    request: Request,
+    response: Response,
+    mrf_id: str,
+    date: datetime,
+    current_user: UserClaims = Depends(get_current_active_claims)
+) -> Any:
+    day = day_start(naive_utc(date))
+
+    async def compute() -> dict:
+        stages = {
+            "rollups": mongodb.get_tenant_report_db(mrf_id)[ROLLUP_COLLECTION].find(
+                {"mrf_id": mrf_id, "day": day}
+            ).max_time_ms(max_time_ms()).to_list(length=None)
+        }
+        if archive_store.covers(day, day):
+            stages["archive"] = asyncio.to_thread(
+                archive_store.rows, ROLLUP_COLLECTION, day, day, {"mrf_id": [mrf_id]}
+            )
+        results = await run_stages(response, stages)
+        return {"date": day.date(), **summarize_rollups(merge_rollups(chain(*results.values())))}
+
+    return await cached_report(
+        request, response, f"daily:{mrf_id}:{day.date()}", (mrf_id, day, day), compute
+    )
+
 @router.get("/monthly", response_model=dict)
 async def get_monthly_report(
+    request: Request,
+    response: Response,
     mrf_id: str,
     year: int,
     month: int,
-    current_user: User = Depends(get_current_active_user)
+    current_user: UserClaims = Depends(get_current_active_claims)
 ) -> Any:
     start_date = datetime(year, month, 1)
     if month == 12:
-        end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
+        next_month = datetime(year + 1, 1, 1)
     else:
-        end_date = datetime(year, month + 1, 1) - timedelta(days=1)
-    
-    # Get daily summaries for the month
-    daily_summaries = []
-    current_date = start_date
-    while current_date <= end_date:
-        daily_report = await get_daily_report(mrf_id, current_date, current_user)
-        daily_summaries.append(daily_report)
-        current_date += timedelta(days=1)
-    
-    # Calculate monthly totals
-    monthly_totals = {
-        "total_intake_weight": sum(day["waste_intake"]["total_weight"] for day in daily_summaries),
-        "total_intake_count": sum(day["waste_intake"]["count"] for day in daily_summaries),
-        "total_sales_amount": sum(
-            sum(category["total_amount"] for category in day["sales"])
-            for day in daily_summaries
-        ),
-        "total_sales_weight": sum(
-            sum(category["total_weight"] for category in day["sales"])
-            for day in daily_summaries
-        )
-    }
-    
-    return {
-        "year": year,
-        "month": month,
-        "daily_summaries": daily_summaries,
-        "monthly_totals": monthly_totals
+        next_month = datetime(year, month + 1, 1)
+
+    async def compute() -> dict:
+        stages = {
+            "rollups": mongodb.get_tenant_report_db(mrf_id)[ROLLUP_COLLECTION].find(
+                {"mrf_id": mrf_id, "day": {"$gte": start_date, "$lt": next_month}}
+            ).max_time_ms(max_time_ms()).to_list(length=None)
+        }
+        last_day = next_month - timedelta(days=1)
+        if archive_store.covers(start_date, last_day):
+            stages["archive"] = asyncio.to_thread(
+                archive_store.rows, ROLLUP_COLLECTION, start_date, last_day, {"mrf_id": [mrf_id]}
+            )
+        results = await run_stages(response, stages)
+
+        rollups_by_day = defaultdict(list)
+        for row in merge_rollups(chain(*results.values())):
+            rollups_by_day[row["day"]].append(row)
+
+        # Fill in days without any records so every day of the month is present
+        daily_summaries = []
+        current_date = start_date
+        while current_date < next_month:
+            daily_summaries.append({
+                "date": current_date.date(),
+                **summarize_rollups(rollups_by_day.get(current_date, []))
+            })
+            current_date += timedelta(days=1)
+
+        # Calculate monthly totals
+        monthly_totals = {
+            "total_intake_weight": sum(day["waste_intake"]["total_weight"] for day in daily_summaries),
+            "total_intake_count": sum(day["waste_intake"]["count"] for day in daily_summaries),
+            "total_sales_amount": sum(
+                sum(category["total_amount"] for category in day["sales"])
+                for day in daily_summaries
+            ),
+            "total_sales_weight": sum(
+                sum(category["total_weight"] for category in day["sales"])
+                for day in daily_summaries
+            )
+        }
+
+        return {
+            "year": year,
+            "month": month,
+            "daily_summaries": daily_summaries,
+            "monthly_totals": monthly_totals
+        }
+
+    return await cached_report(
+        request, response, f"monthly:{mrf_id}:{year}-{month:02d}",
+        (mrf_id, start_date, next_month - timedelta(days=1)), compute
+    )
+
+MAX_RANKING_SIZE = 50
+
+class PanchayatMetric(str, Enum):
+    total_intake_weight = "total_intake_weight"
+    intake_count = "intake_count"
+    total_sorted_weight = "total_sorted_weight"
+    sorted_count = "sorted_count"
+    total_sales_amount = "total_sales_amount"
+    total_sales_weight = "total_sales_weight"
+    transaction_count = "transaction_count"
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+# Rollup counter behind each per-MRF metric
+PANCHAYAT_FIELDS = {
+    PanchayatMetric.total_intake_weight: "intake_weight",
+    PanchayatMetric.intake_count: "intake_count",
+    PanchayatMetric.total_sorted_weight: "sorted_weight",
+    PanchayatMetric.sorted_count: "sorted_count",
+    PanchayatMetric.total_sales_amount: "sales_amount",
+    PanchayatMetric.total_sales_weight: "sales_weight",
+    PanchayatMetric.transaction_count: "sales_count",
+}
+CATEGORY_FIELDS = [field for field in ROLLUP_FIELDS if not field.startswith("intake_")]
+
+def panchayat_spans(start_date: datetime, end_date: datetime) -> Tuple[Optional[tuple], List[tuple]]:
+    # Whole calendar months in the range are read from monthly rollups as [first, end);
+    # the partial months at either edge from daily rollups as [first, last]
+    first_day, last_day = day_start(start_date), day_start(end_date)
+    first_month = month_start(first_day)
+    if first_month < first_day:
+        first_month += relativedelta(months=1)
+    end_month = month_start(last_day + timedelta(days=1))
+    if first_month >= end_month:
+        return None, [(first_day, last_day)]
+
+    edges = []
+    if first_day < first_month:
+        edges.append((first_day, first_month - timedelta(days=1)))
+    if end_month <= last_day:
+        edges.append((end_month, last_day))
+    return (first_month, end_month), edges
+
+def panchayat_pipelines(start_date: datetime, end_date: datetime, mrf_ids: Optional[List[str]]) -> Dict[str, tuple]:
+    # (collection, pipeline) per stage, each grouped to one row per MRF and category, so
+    # the work depends on the number of MRFs and months rather than on the transactions
+    months, edges = panchayat_spans(start_date, end_date)
+    group = {
+        "$group": {
+            "_id": {"mrf_id": "$mrf_id", "category": "$category"},
+            **{field: {"$sum": f"${field}"} for field in ROLLUP_FIELDS}
+        }
     }
 
+    def match(query: dict) -> dict:
+        if mrf_ids:
+            query["mrf_id"] = {"$in": mrf_ids}
+        return {"$match": query}
+
+    pipelines = {}
+    if months:
+        pipelines["months"] = (MONTHLY_ROLLUP_COLLECTION, [
+            match({"month": {"$gte": months[0], "$lt": months[1]}}), group
+        ])
+    if edges:
+        pipelines["days"] = (ROLLUP_COLLECTION, [
+            match({"$or": [{"day": {"$gte": first, "$lte": last}} for first, last in edges]}), group
+        ])
+    return pipelines
+
+def archived_panchayat_rows(start_date: datetime, end_date: datetime, mrf_ids: Optional[List[str]]) -> List[dict]:
+    # The same spans as panchayat_pipelines, answered from archived rollups
+    months, edges = panchayat_spans(start_date, end_date)
+    keys, sums = ("mrf_id", "category"), {field: field for field in ROLLUP_FIELDS}
+    rows = []
+    if months:
+        rows += archive_store.aggregate(
+            MONTHLY_ROLLUP_COLLECTION, months[0], months[1] - timedelta(days=1), {"mrf_id": mrf_ids}, keys, sums
+        )
+    for first, last in edges:
+        rows += archive_store.aggregate(ROLLUP_COLLECTION, first, last, {"mrf_id": mrf_ids}, keys, sums)
+    return rows
+
+def merge_panchayat_rows(rows: Iterable[dict]) -> Dict[Optional[str], dict]:
+    # Per-MRF totals with a per-category breakdown; an MRF appears as soon as it has
+    # any activity, whether intake, sorting or sales
+    mrfs = {}
+    for row in rows:
+        mrf_id, category = row["_id"].get("mrf_id"), row["_id"].get("category")
+        entry = mrfs.get(mrf_id)
+        if entry is None:
+            entry = mrfs[mrf_id] = {"mrf_id": mrf_id, **{metric.value: 0 for metric in PanchayatMetric}, "categories": {}}
+        for metric, field in PANCHAYAT_FIELDS.items():
+            entry[metric.value] += row.get(field, 0) or 0
+        if category is not None:
+            counters = entry["categories"].setdefault(category, dict.fromkeys(CATEGORY_FIELDS, 0))
+            for field in CATEGORY_FIELDS:
+                counters[field] += row.get(field, 0) or 0
+    return mrfs
+
 @router.get("/panchayat", response_model=dict)
 async def get_panchayat_report(
+    request: Request,
+    response: Response,
     start_date: datetime,
     end_date: datetime,
-    current_user: User = Depends(get_current_active_panchayat)
+    mrf_id: List[str] = Query(None),
+    sort_by: PanchayatMetric = PanchayatMetric.total_intake_weight,
+    order: SortOrder = SortOrder.desc,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    top: int = Query(5, ge=0, le=MAX_RANKING_SIZE),
+    include_categories: bool = True,
+    current_user: UserClaims = Depends(get_current_active_panchayat)
 ) -> Any:
     # Only panchayat officials can access this report
-    pipeline = [
-        {
-            "$match": {
-                "date": {"$gte": start_date, "$lte": end_date}
+    start_date, end_date = naive_utc(start_date), naive_utc(end_date)
+
+    def partition(db, mrf_ids: Optional[List[str]]) -> Dict[str, Awaitable]:
+        return {
+            name: db[collection].aggregate(pipeline, maxTimeMS=max_time_ms()).to_list(length=None)
+            for name, (collection, pipeline) in panchayat_pipelines(start_date, end_date, mrf_ids).items()
+        }
+
+    async def compute() -> dict:
+        # Every MRF is summarised where it lives; the per-MRF rows merge as they are
+        stages = partition_stages(mrf_id, partition)
+        if archive_store.covers(day_start(start_date), end_date):
+            stages["archive"] = asyncio.to_thread(archived_panchayat_rows, start_date, end_date, mrf_id)
+        results = await run_stages(response, stages)
+        mrfs = merge_panchayat_rows(row for rows in results.values() for row in rows)
+
+        ordered = sorted(
+            mrfs.values(),
+            key=lambda entry: (entry[sort_by.value], entry["mrf_id"] or ""),
+            reverse=order == SortOrder.desc
+        )
+        page = ordered[skip:skip + limit]
+
+        category_totals = {}
+        for entry in mrfs.values():
+            for category, counters in entry["categories"].items():
+                totals = category_totals.setdefault(category, dict.fromkeys(CATEGORY_FIELDS, 0))
+                for field in CATEGORY_FIELDS:
+                    totals[field] += counters[field]
+
+        def total(metric: PanchayatMetric) -> float:
+            return sum(entry[metric.value] for entry in mrfs.values())
+
+        return {
+            "start_date": start_date,
+            "end_date": end_date,
+            "sort_by": sort_by,
+            "order": order,
+            "skip": skip,
+            "limit": limit,
+            "total_mrfs": len(mrfs),
+            "mrf_summary": {
+                entry["mrf_id"]: {
+                    name: value for name, value in entry.items()
+                    if name != "mrf_id" and (include_categories or name != "categories")
+                }
+                for entry in page
+            },
+            # Ties break on mrf_id like the page order, whichever partition answered first
+            "rankings": {
+                metric.value: [
+                    {"mrf_id": entry["mrf_id"], "value": entry[metric.value]}
+                    for entry in heapq.nlargest(
+                        top, mrfs.values(), key=lambda ranked: (ranked[metric.value], ranked["mrf_id"] or "")
+                    )
+                ]
+                for metric in PanchayatMetric
+            } if top else {},
+            "category_totals": category_totals,
+            "overall_totals": {
+                "total_intake_weight": total(PanchayatMetric.total_intake_weight),
+                "total_intake_count": total(PanchayatMetric.intake_count),
+                "total_sorted_weight": total(PanchayatMetric.total_sorted_weight),
+                "total_sorted_count": total(PanchayatMetric.sorted_count),
+                "total_sales_amount": total(PanchayatMetric.total_sales_amount),
+                "total_sales_weight": total(PanchayatMetric.total_sales_weight),
+                "total_transactions": total(PanchayatMetric.transaction_count)
             }
-        },
-        {
-            "$group": {
-                "_id": "$mrf_id",
-                "total_intake_weight": {"$sum": "$weight"},
-                "intake_count": {"$sum": 1}
+        }
+
+    key = ":".join([
+        "panchayat", start_date.isoformat(), end_date.isoformat(), ",".join(sorted(mrf_id or [])),
+        sort_by.value, order.value, str(skip), str(limit), str(top), str(include_categories)
+    ])
+    return await cached_report(request, response, key, (None, day_start(start_date), end_date), compute)
+
+MAX_TIMESERIES_BUCKETS = 2000
+
+class Granularity(str, Enum):
+    hour = "hour"
+    day = "day"
+    week = "week"
+    month = "month"
+
+class Metric(str, Enum):
+    weight = "weight"
+    amount = "amount"
+    count = "count"
+
+# Series produced per metric; intake has no category and sorting has no amount
+METRIC_SERIES = {
+    Metric.weight: ["intake_weight", "sorted_weight", "sales_weight"],
+    Metric.amount: ["sales_amount"],
+    Metric.count: ["intake_count", "sorted_count", "sales_count"],
+}
+
+def bucket_start(date: datetime, granularity: Granularity) -> datetime:
+    # Same boundaries as $dateTrunc (weeks start on Monday)
+    if granularity == Granularity.hour:
+        return date.replace(minute=0, second=0, microsecond=0)
+    day = day_start(date)
+    if granularity == Granularity.week:
+        return day - timedelta(days=day.weekday())
+    if granularity == Granularity.month:
+        return day.replace(day=1)
+    return day
+
+def bucket_starts(start_date: datetime, end_date: datetime, granularity: Granularity) -> List[datetime]:
+    step = {
+        Granularity.hour: relativedelta(hours=1),
+        Granularity.day: relativedelta(days=1),
+        Granularity.week: relativedelta(weeks=1),
+        Granularity.month: relativedelta(months=1),
+    }[granularity]
+    buckets = []
+    current = bucket_start(start_date, granularity)
+    while current <= end_date:
+        if len(buckets) == MAX_TIMESERIES_BUCKETS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {MAX_TIMESERIES_BUCKETS} buckets per request, use a coarser granularity"
+            )
+        buckets.append(current)
+        current += step
+    return buckets
+
+def date_trunc(field: str, granularity: Granularity) -> dict:
+    trunc = {"date": f"${field}", "unit": granularity.value}
+    if granularity == Granularity.week:
+        trunc["startOfWeek"] = "monday"
+    return {"$dateTrunc": trunc}
+
+def timeseries_pipelines(
+    granularity: Granularity,
+    start_date: datetime,
+    end_date: datetime,
+    mrf_ids: Optional[List[str]],
+    categories: Optional[List[str]]
+) -> Dict[str, tuple]:
+    # (collection, pipeline) per stage. Daily rollups already hold every field, so day and
+    # coarser buckets are one grouping over them; hourly buckets need the raw collections
+    def match(date_field: str, start: datetime, by_category: bool) -> dict:
+        query = {date_field: {"$gte": start, "$lte": end_date}}
+        if mrf_ids:
+            query["mrf_id"] = {"$in": mrf_ids}
+        if categories and by_category:
+            query["category"] = {"$in": categories}
+        return {"$match": query}
+
+    if granularity != Granularity.hour:
+        match_stage = match("day", day_start(start_date), by_category=False)
+        if categories:
+            # Intake rows (category None) stay in, so the recovery ratio keeps its denominator
+            match_stage["$match"]["category"] = {"$in": [None, *categories]}
+        return {
+            "rollups": (ROLLUP_COLLECTION, [
+                match_stage,
+                {
+                    "$group": {
+                        "_id": date_trunc("day", granularity),
+                        **{field: {"$sum": f"${field}"} for field in ROLLUP_FIELDS}
+                    }
+                }
+            ])
+        }
+
+    def grouped(collection: str, by_category: bool, sums: Dict[str, Any]) -> tuple:
+        return (collection, [
+            match("date", start_date, by_category),
+            {"$group": {"_id": date_trunc("date", granularity), **{
+                field: {"$sum": value} for field, value in sums.items()
+            }}}
+        ])
+
+    return {
+        "intake": grouped("waste_intake", False, {"intake_weight": "$weight", "intake_count": 1}),
+        "sorted": grouped("sorted_waste", True, {"sorted_weight": "$weight", "sorted_count": 1}),
+        "sales": grouped("waste_sales", True, {
+            "sales_weight": "$weight", "sales_amount": "$total_amount", "sales_count": 1
+        }),
+    }
+
+def archived_timeseries_rows(
+    granularity: Granularity,
+    start_date: datetime,
+    end_date: datetime,
+    mrf_ids: Optional[List[str]],
+    categories: Optional[List[str]]
+) -> List[dict]:
+    # The same buckets as timeseries_pipelines, answered from archived rollups or, for
+    # hourly buckets, archived ledgers
+    if granularity != Granularity.hour:
+        filters = {"mrf_id": mrf_ids, "category": [None, *categories] if categories else None}
+        sources = [(ROLLUP_COLLECTION, day_start(start_date), filters, {field: field for field in ROLLUP_FIELDS})]
+    else:
+        by_category = {"mrf_id": mrf_ids, "category": categories}
+        sources = [
+            ("waste_intake", start_date, {"mrf_id": mrf_ids}, {"intake_weight": "weight", "intake_count": None}),
+            ("sorted_waste", start_date, by_category, {"sorted_weight": "weight", "sorted_count": None}),
+            ("waste_sales", start_date, by_category, {
+                "sales_weight": "weight", "sales_amount": "total_amount", "sales_count": None
+            }),
+        ]
+
+    rows = []
+    for collection, start, filters, sums in sources:
+        field = "day" if collection == ROLLUP_COLLECTION else "date"
+        for row in archive_store.aggregate(collection, start, end_date, filters, (field,), sums, floor=granularity.value):
+            row["_id"] = row["_id"][field]
+            rows.append(row)
+    return rows
+
+def align_series(buckets: List[datetime], rows: List[dict]) -> Dict[str, np.ndarray]:
+    # One float array per field, indexed like buckets; buckets without rows stay zero
+    positions = {bucket: index for index, bucket in enumerate(buckets)}
+    series = {field: np.zeros(len(buckets)) for field in ROLLUP_FIELDS}
+    hits = [(positions[row["_id"]], row) for row in rows if row["_id"] in positions]
+    if hits:
+        index = np.fromiter((position for position, _ in hits), dtype=np.intp, count=len(hits))
+        for field in ROLLUP_FIELDS:
+            values = np.fromiter((row.get(field, 0) or 0 for _, row in hits), dtype=float, count=len(hits))
+            np.add.at(series[field], index, values)
+    return series
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    # Trailing mean; the first window - 1 buckets average over what is available
+    cumulative = np.cumsum(values)
+    lagged = np.zeros_like(cumulative)
+    lagged[window:] = cumulative[:-window]
+    return (cumulative - lagged) / np.minimum(np.arange(1, len(values) + 1), window)
+
+@router.get("/timeseries", response_model=dict)
+async def get_timeseries_report(
+    request: Request,
+    response: Response,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: Granularity = Granularity.day,
+    mrf_id: List[str] = Query(None),
+    category: List[str] = Query(None),
+    metrics: List[Metric] = Query([Metric.weight, Metric.amount, Metric.count]),
+    window: int = Query(7, ge=1, le=MAX_TIMESERIES_BUCKETS),
+    current_user: UserClaims = Depends(get_current_active_claims)
+) -> Any:
+    require_mrf_scope(mrf_id, current_user)
+    start_date, end_date = naive_utc(start_date), naive_utc(end_date)
+    buckets = bucket_starts(start_date, end_date, granularity)
+
+    def partition(db, mrf_ids: Optional[List[str]]) -> Dict[str, Awaitable]:
+        pipelines = timeseries_pipelines(granularity, start_date, end_date, mrf_ids, category)
+        return {
+            name: db[collection].aggregate(pipeline, maxTimeMS=max_time_ms()).to_list(length=None)
+            for name, (collection, pipeline) in pipelines.items()
+        }
+
+    async def compute() -> dict:
+        # Buckets from different partitions add up in align_series
+        stages = partition_stages(mrf_id, partition)
+        if archive_store.covers(start_date, end_date):
+            stages["archive"] = asyncio.to_thread(
+                archived_timeseries_rows, granularity, start_date, end_date, mrf_id, category
+            )
+        results = await run_stages(response, stages)
+        series = align_series(buckets, [row for rows in results.values() for row in rows])
+
+        names = [name for metric in dict.fromkeys(metrics) for name in METRIC_SERIES[metric]]
+        recovery_ratio = np.divide(
+            series["sales_weight"], series["intake_weight"],
+            out=np.zeros(len(buckets)), where=series["intake_weight"] > 0
+        )
+        return {
+            "granularity": granularity,
+            "start_date": start_date,
+            "end_date": end_date,
+            "mrf_ids": mrf_id,
+            "categories": category,
+            "buckets": buckets,
+            "series": {name: series[name].tolist() for name in names},
+            "derived": {
+                "recovery_ratio": recovery_ratio.tolist(),
+                "moving_average": {name: moving_average(series[name], window).tolist() for name in names},
+                "cumulative": {name: np.cumsum(series[name]).tolist() for name in names}
             }
         }
-    ]
-    
-    mrf_summary = await mongodb.get_db()["waste_intake"].aggregate(pipeline).to_list(length=None)
-    
-    # Get sales summary for each MRF
-    sales_pipeline = [
-        {
-            "$match": {
-                "date": {"$gte": start_date, "$lte": end_date}
+
+    key = ":".join([
+        "timeseries", granularity.value, start_date.isoformat(), end_date.isoformat(),
+        ",".join(sorted(mrf_id or [])), ",".join(sorted(category or [])),
+        ",".join(metric.value for metric in dict.fromkeys(metrics)), str(window)
+    ])
+    scope_mrf = mrf_id[0] if mrf_id and len(mrf_id) == 1 else None
+    return await cached_report(request, response, key, (scope_mrf, day_start(start_date), end_date), compute)
+
+def reconciliation_pipeline(query: dict, limit: int, unsorted_only: bool) -> List[dict]:
+    # One pass over the intakes: join their sorted rows through the intake_id index,
+    # then fan out into per-intake rows and per-MRF / per-category totals
+    intake_rows = [{"$match": {"residual_weight": {"$gt": 0}}}] if unsorted_only else []
+    facets = {
+        "mrfs": [
+            {
+                "$group": {
+                    "_id": "$mrf_id",
+                    "intake_weight": {"$sum": "$weight"},
+                    "intake_count": {"$sum": 1},
+                    "sorted_weight": {"$sum": "$sorted_weight"},
+                    "residual_weight": {"$sum": "$residual_weight"},
+                    "unsorted_count": {"$sum": {"$cond": [{"$gt": ["$residual_weight", 0]}, 1, 0]}}
+                }
             }
-        },
+        ],
+        "categories": [
+            {"$unwind": "$sorted"},
+            {
+                "$group": {
+                    "_id": {"mrf_id": "$mrf_id", "category": "$sorted.category"},
+                    "sorted_weight": {"$sum": "$sorted.weight"}
+                }
+            }
+        ]
+    }
+    # limit=0 asks for the totals alone, and $limit must be positive
+    if limit:
+        facets["intakes"] = intake_rows + [
+            {"$sort": {"date": 1, "_id": 1}},
+            {"$limit": limit},
+            {
+                "$project": {
+                    "mrf_id": 1, "date": 1, "weight": 1, "sorted_weight": 1,
+                    "residual_weight": 1, "sorted": 1
+                }
+            }
+        ]
+    return [
+        {"$match": query},
+        {"$addFields": {"intake_key": {"$toString": "$_id"}}},
         {
-            "$group": {
-                "_id": "$mrf_id",
-                "total_sales_amount": {"$sum": "$total_amount"},
-                "total_sales_weight": {"$sum": "$weight"},
-                "transaction_count": {"$sum": 1}
+            "$lookup": {
+                "from": "sorted_waste",
+                "localField": "intake_key",
+                "foreignField": "intake_id",
+                "pipeline": [{"$project": {"_id": 0, "category": 1, "weight": 1}}],
+                "as": "sorted"
             }
-        }
+        },
+        {"$addFields": {"sorted_weight": {"$sum": "$sorted.weight"}}},
+        {"$addFields": {"residual_weight": {"$subtract": ["$weight", "$sorted_weight"]}}},
+        {"$facet": facets}
     ]
-    
-    sales_summary = await mongodb.get_db()["waste_sales"].aggregate(sales_pipeline).to_list(length=None)
-    
-    # Combine the summaries
-    mrf_data = {}
-    for mrf in mrf_summary:
-        mrf_id = mrf["_id"]
-        mrf_data[mrf_id] = {
-            "total_intake_weight": mrf["total_intake_weight"],
-            "intake_count": mrf["intake_count"],
-            "total_sales_amount": 0,
-            "total_sales_weight": 0,
-            "transaction_count": 0
-        }
-    
-    for sale in sales_summary:
-        mrf_id = sale["_id"]
-        if mrf_id in mrf_data:
-            mrf_data[mrf_id].update({
-                "total_sales_amount": sale["total_sales_amount"],
-                "total_sales_weight": sale["total_sales_weight"],
-                "transaction_count": sale["transaction_count"]
+
+MRF_FACET_FIELDS = ("intake_weight", "intake_count", "sorted_weight", "residual_weight", "unsorted_count")
+
+def reconciliation_facets(intakes: List[dict], sorted_rows: List[dict], limit: int, unsorted_only: bool) -> dict:
+    # What reconciliation_pipeline returns, computed in Python for archived intakes
+    sorted_by_intake = defaultdict(list)
+    for row in sorted_rows:
+        sorted_by_intake[row["intake_id"]].append({"category": row.get("category"), "weight": row.get("weight", 0)})
+
+    mrfs, categories, rows = {}, defaultdict(float), []
+    for intake in intakes:
+        sorted_waste = sorted_by_intake.get(str(intake["_id"]), [])
+        sorted_weight = sum(row["weight"] for row in sorted_waste)
+        residual_weight = intake["weight"] - sorted_weight
+        mrf = mrfs.setdefault(intake["mrf_id"], {"_id": intake["mrf_id"], **dict.fromkeys(MRF_FACET_FIELDS, 0)})
+        mrf["intake_weight"] += intake["weight"]
+        mrf["intake_count"] += 1
+        mrf["sorted_weight"] += sorted_weight
+        mrf["residual_weight"] += residual_weight
+        mrf["unsorted_count"] += residual_weight > 0
+        for row in sorted_waste:
+            categories[(intake["mrf_id"], row["category"])] += row["weight"]
+        if residual_weight > 0 or not unsorted_only:
+            rows.append({
+                "_id": intake["_id"], "mrf_id": intake["mrf_id"], "date": intake["date"], "weight": intake["weight"],
+                "sorted_weight": sorted_weight, "residual_weight": residual_weight, "sorted": sorted_waste
             })
-    
+
+    rows.sort(key=lambda row: (row["date"], str(row["_id"])))
+    return {
+        "intakes": rows[:limit],
+        "mrfs": list(mrfs.values()),
+        "categories": [
+            {"_id": {"mrf_id": mrf_id, "category": category}, "sorted_weight": weight}
+            for (mrf_id, category), weight in categories.items()
+        ]
+    }
+
+async def archived_reconciliation(
+    start_date: datetime, end_date: datetime, mrf_ids: Optional[List[str]], limit: int, unsorted_only: bool
+) -> dict:
+    def read() -> Tuple[List[dict], List[dict]]:
+        intakes = archive_store.rows("waste_intake", start_date, end_date, {"mrf_id": mrf_ids})
+        # Sorting can happen in a later month than the intake, so later segments count too
+        sorted_rows = archive_store.rows(
+            "sorted_waste", start_date, datetime.max, {"intake_id": [str(intake["_id"]) for intake in intakes]}
+        )
+        return intakes, sorted_rows
+
+    intakes, sorted_rows = await asyncio.to_thread(read)
+    if intakes:
+        # Intakes from the newest archived month may have been sorted after it, while
+        # that month is still live
+        newest = month_start(max(intake["date"] for intake in intakes))
+        recent = {}
+        for intake in intakes:
+            if intake["date"] >= newest:
+                recent.setdefault(mongodb.partition_of(intake["mrf_id"]), []).append(str(intake["_id"]))
+        results = await asyncio.gather(*(
+            mongodb.get_partition_report_db(partition)["sorted_waste"].find(
+                {"intake_id": {"$in": intake_ids}, "date": {"$gte": newest + relativedelta(months=1)}},
+                {"_id": 0, "intake_id": 1, "category": 1, "weight": 1}
+            ).max_time_ms(max_time_ms()).to_list(length=None)
+            for partition, intake_ids in recent.items()
+        ))
+        sorted_rows += chain.from_iterable(results)
+    return reconciliation_facets(intakes, sorted_rows, limit, unsorted_only)
+
+def merge_reconciliation_facets(facets: Iterable[dict], limit: int) -> dict:
+    mrfs, categories, intakes = {}, {}, []
+    for facet in facets:
+        for row in facet.get("mrfs", []):
+            mrf = mrfs.setdefault(row["_id"], {"_id": row["_id"], **dict.fromkeys(MRF_FACET_FIELDS, 0)})
+            for field in MRF_FACET_FIELDS:
+                mrf[field] += row[field]
+        for row in facet.get("categories", []):
+            key = (row["_id"]["mrf_id"], row["_id"]["category"])
+            categories[key] = categories.get(key, 0) + row["sorted_weight"]
+        intakes += facet.get("intakes", [])
+
+    intakes.sort(key=lambda row: (row["date"], str(row["_id"])))
     return {
-        "start_date": start_date,
-        "end_date": end_date,
-        "mrf_summary": mrf_data,
-        "overall_totals": {
-            "total_intake_weight": sum(mrf["total_intake_weight"] for mrf in mrf_data.values()),
-            "total_intake_count": sum(mrf["intake_count"] for mrf in mrf_data.values()),
-            "total_sales_amount": sum(mrf["total_sales_amount"] for mrf in mrf_data.values()),
-            "total_sales_weight": sum(mrf["total_sales_weight"] for mrf in mrf_data.values()),
-            "total_transactions": sum(mrf["transaction_count"] for mrf in mrf_data.values())
+        "intakes": intakes[:limit],
+        "mrfs": list(mrfs.values()),
+        "categories": [
+            {"_id": {"mrf_id": mrf_id, "category": category}, "sorted_weight": weight}
+            for (mrf_id, category), weight in categories.items()
+        ]
+    }
+
+def category_weights(rows: List[dict]) -> Dict[str, float]:
+    weights = defaultdict(float)
+    for row in rows:
+        weights[row.get("category")] += row.get("weight", 0)
+    return dict(weights)
+
+@router.get("/reconciliation", response_model=dict)
+async def get_reconciliation_report(
+    request: Request,
+    response: Response,
+    start_date: datetime,
+    end_date: datetime,
+    mrf_id: List[str] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=0, le=MAX_PAGE_SIZE),
+    unsorted_only: bool = False,
+    current_user: UserClaims = Depends(get_current_active_claims)
+) -> Any:
+    require_mrf_scope(mrf_id, current_user)
+    start_date, end_date = naive_utc(start_date), naive_utc(end_date)
+
+    def partition(db, mrf_ids: Optional[List[str]]) -> Dict[str, Awaitable]:
+        intake_query = {"date": {"$gte": start_date, "$lte": end_date}}
+        rollup_query = {"day": {"$gte": day_start(start_date), "$lte": end_date}, "category": {"$ne": None}}
+        if mrf_ids:
+            intake_query["mrf_id"] = {"$in": mrf_ids}
+            rollup_query["mrf_id"] = {"$in": mrf_ids}
+        return {
+            "intakes": db["waste_intake"].aggregate(
+                reconciliation_pipeline(intake_query, limit, unsorted_only), maxTimeMS=max_time_ms()
+            ).to_list(length=None),
+            # Sorted and sold weight by the day the work happened, for the stock balance
+            "flows": db[ROLLUP_COLLECTION].aggregate([
+                {"$match": rollup_query},
+                {
+                    "$group": {
+                        "_id": {"mrf_id": "$mrf_id", "category": "$category"},
+                        "sorted_weight": {"$sum": "$sorted_weight"},
+                        "sales_weight": {"$sum": "$sales_weight"}
+                    }
+                }
+            ], maxTimeMS=max_time_ms()).to_list(length=None)
         }
-    } 
\ No newline at end of file
+
+    async def compute() -> dict:
+        stages = partition_stages(mrf_id, partition)
+        if archive_store.covers(start_date, end_date):
+            stages["archived_intakes"] = archived_reconciliation(start_date, end_date, mrf_id, limit, unsorted_only)
+            stages["archived_flows"] = asyncio.to_thread(
+                archive_store.aggregate, ROLLUP_COLLECTION, day_start(start_date), end_date, {"mrf_id": mrf_id},
+                ("mrf_id", "category"), {"sorted_weight": "sorted_weight", "sales_weight": "sales_weight"}
+            )
+        results = await run_stages(response, stages)
+        facets = merge_reconciliation_facets(
+            gathered(results, "intakes") + [results.get("archived_intakes", {})], limit
+        )
+        flows = gathered(results, "flows") + [
+            row for row in results.get("archived_flows", []) if row["_id"]["category"] is not None
+        ]
+
+        # MRFs with sorting or sales but no intake in the range get the same keys, zeroed
+        mrf_data = {}
+
+        def mrf_entry(mrf: str) -> dict:
+            return mrf_data.setdefault(mrf, {**dict.fromkeys(MRF_FACET_FIELDS, 0), "categories": {}})
+
+        for mrf in facets.get("mrfs", []):
+            mrf_entry(mrf["_id"]).update({field: mrf[field] for field in MRF_FACET_FIELDS})
+
+        def category_entry(mrf: str, category: str) -> dict:
+            return mrf_entry(mrf)["categories"].setdefault(category, {
+                "sorted_from_intakes": 0,
+                "sorted_weight": 0,
+                "sales_weight": 0
+            })
+
+        for row in facets.get("categories", []):
+            category_entry(row["_id"]["mrf_id"], row["_id"]["category"])["sorted_from_intakes"] = row["sorted_weight"]
+        for row in flows:
+            entry = category_entry(row["_id"]["mrf_id"], row["_id"]["category"])
+            entry["sorted_weight"] += row["sorted_weight"]
+            entry["sales_weight"] += row["sales_weight"]
+        for mrf in mrf_data.values():
+            for entry in mrf["categories"].values():
+                # Negative means more was sold than sorted in the range
+                entry["unsold_weight"] = entry["sorted_weight"] - entry["sales_weight"]
+
+        return {
+            "start_date": start_date,
+            "end_date": end_date,
+            "mrf_summary": mrf_data,
+            "intakes": [
+                {
+                    "id": str(intake["_id"]),
+                    "mrf_id": intake["mrf_id"],
+                    "date": intake["date"],
+                    "weight": intake["weight"],
+                    "sorted_weight": intake["sorted_weight"],
+                    "residual_weight": intake["residual_weight"],
+                    "sorted_by_category": category_weights(intake["sorted"])
+                }
+                for intake in facets.get("intakes", [])
+            ]
+        }
+
+    key = ":".join([
+        "reconciliation", start_date.isoformat(), end_date.isoformat(),
+        ",".join(sorted(mrf_id or [])), str(limit), str(unsorted_only)
+    ])
+    scope_mrf = mrf_id[0] if mrf_id and len(mrf_id) == 1 else None
+    # Intakes in the range can still be sorted later, so any newer write evicts the entry
+    return await cached_report(request, response, key, (scope_mrf, day_start(start_date), datetime.max), compute)
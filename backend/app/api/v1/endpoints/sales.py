@@ -1,14 +1,35 @@
-from typing import List, Any
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from typing import List, Any, Optional
+from itertools import chain
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from app.models.waste import WasteSale
-from app.models.user import User
-from app.api.deps import get_current_active_user, get_current_active_manager
+from app.models.user import User, UserClaims
+from app.api.deps import get_current_active_claims, get_current_active_user, get_current_active_manager
+from app.api.bulk import bulk_result, insert_records, partition_records, read_bulk_records, validate_records
+from app.api.pagination import MAX_PAGE_SIZE, fetch_page, stream_ndjson
+from app.api.serialization import rows_response
+from app.core.config import settings
 from app.db.mongodb import mongodb
+from app.db.archive import archive_store
+from app.db.categories import RejectedSale, sale_unit_price
+from app.db.inventory import (
+    InsufficientStock,
+    apply_stock,
+    release_sale_stock,
+    sale_change_stock,
+    sale_stock,
+    take_sale_stock,
+)
+from app.db.rollups import apply_rollups, record_sale, record_sale_update, sale_increments
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
 
 router = APIRouter()
 
+MRF_REQUIRED = "A sale needs the mrf_id it was made at"
+
 @router.post("/", response_model=WasteSale)
 async def create_sale(
     sale: WasteSale,
@@ -19,14 +40,94 @@ async def create_sale(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to create sales records"
         )
+    if not sale.mrf_id:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=MRF_REQUIRED
+        )
     
-    # Calculate total amount
+    # Calculate total amount at the price SALE_PRICE_POLICY allows
+    sale.unit_price = await sale_unit_price(sale.category, sale.unit_price)
     sale.total_amount = sale.weight * sale.unit_price
     sale.operator_id = str(current_user.id)
+    # /sync watermarks on updated_at, so the timestamps are the server's rather than the client's
+    sale.created_at = sale.updated_at = datetime.utcnow()
+    
+    sale_doc = sale.dict(by_alias=True)
+    db = mongodb.get_tenant_db(sale.mrf_id)
+    # Stock is taken first so a sale that would overdraw it is never recorded
+    await take_sale_stock(db, sale_doc)
+    try:
+        await db["waste_sales"].insert_one(sale_doc)
+    except PyMongoError:
+        await release_sale_stock(db, sale_doc)
+        raise
+    await record_sale(db, sale_doc)
+    return sale
+
+@router.post("/bulk", response_model=dict)
+async def create_sales_bulk(
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+) -> Any:
+    if current_user.role not in ["operator", "manager"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to create sales records"
+        )
     
-    result = await mongodb.get_db()["waste_sales"].insert_one(sale.dict(by_alias=True))
-    created_sale = await mongodb.get_db()["waste_sales"].find_one({"_id": result.inserted_id})
-    return WasteSale(**created_sale)
+    records, errors = await read_bulk_records(request)
+    sales, validation_errors = validate_records(records, WasteSale)
+    enforce = settings.INVENTORY_ENFORCE_STOCK
+    now = datetime.utcnow()
+    
+    documents = {}
+    for index, sale in sales.items():
+        if not sale.mrf_id:
+            validation_errors.append({"index": index, "detail": MRF_REQUIRED})
+            continue
+        try:
+            sale.unit_price = await sale_unit_price(sale.category, sale.unit_price)
+        except RejectedSale as exc:
+            validation_errors.append({"index": index, "detail": str(exc)})
+            continue
+        sale.total_amount = sale.weight * sale.unit_price
+        sale.operator_id = str(current_user.id)
+        sale.created_at = sale.updated_at = now
+        sale_doc = sale.dict(by_alias=True)
+        if enforce:
+            # Each row's stock is taken with its own conditional $inc, so a shortfall only rejects that row
+            try:
+                await take_sale_stock(mongodb.get_tenant_db(sale.mrf_id), sale_doc)
+            except InsufficientStock as exc:
+                validation_errors.append({"index": index, "detail": str(exc)})
+                continue
+        documents[index] = sale_doc
+    
+    inserted, write_errors = [], []
+    for partition, group in partition_records(documents).items():
+        db = mongodb.get_partition_db(partition)
+        group_inserted, group_errors = await insert_records(db["waste_sales"], group)
+        if enforce:
+            # Give back the stock taken for rows the database rejected
+            await apply_stock(
+                db,
+                chain.from_iterable(sale_stock(group[error["index"]], sign=-1) for error in group_errors),
+                enforce=False
+            )
+        else:
+            await apply_stock(
+                db,
+                chain.from_iterable(sale_stock(group[index]) for index in group_inserted),
+                enforce=False
+            )
+        await apply_rollups(
+            db,
+            chain.from_iterable(sale_increments(group[index]) for index in group_inserted)
+        )
+        inserted += group_inserted
+        write_errors += group_errors
+    return bulk_result(len(records) + len(errors), inserted, errors + validation_errors + write_errors)
 
 @router.get("/", response_model=List[WasteSale])
 async def get_sales(
@@ -34,7 +135,10 @@ async def get_sales(
     start_date: datetime = None,
     end_date: datetime = None,
     category: str = None,
-    current_user: User = Depends(get_current_active_user)
+    limit: Optional[int] = Query(None, gt=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: UserClaims = Depends(get_current_active_claims)
 ) -> Any:
     query = {"mrf_id": mrf_id}
     if start_date and end_date:
@@ -42,15 +146,21 @@ async def get_sales(
     if category:
         query["category"] = category
     
-    sales = await mongodb.get_db()["waste_sales"].find(query).to_list(length=None)
-    return [WasteSale(**sale) for sale in sales]
+    collection = mongodb.get_tenant_db(mrf_id)["waste_sales"]
+    if stream:
+        return stream_ndjson(collection, query, WasteSale, cursor)
+    if limit or cursor:
+        return await fetch_page(collection, query, WasteSale, limit, cursor)
+    
+    sales = await collection.find(query).to_list(length=None)
+    return rows_response(WasteSale, sales)
 
 @router.get("/summary", response_model=dict)
 async def get_sales_summary(
     mrf_id: str,
     start_date: datetime = None,
     end_date: datetime = None,
-    current_user: User = Depends(get_current_active_user)
+    current_user: UserClaims = Depends(get_current_active_claims)
 ) -> Any:
     match_query = {"mrf_id": mrf_id}
     if start_date and end_date:
@@ -68,7 +178,7 @@ async def get_sales_summary(
         }
     ]
     
-    summary = await mongodb.get_db()["waste_sales"].aggregate(pipeline).to_list(length=None)
+    summary = await mongodb.get_tenant_report_db(mrf_id)["waste_sales"].aggregate(pipeline).to_list(length=None)
     
     # Calculate overall totals
     total_weight = sum(item["total_weight"] for item in summary)
@@ -91,21 +201,43 @@ async def update_sale(
     current_user: User = Depends(get_current_active_manager)
 ) -> Any:
     # Only managers can update sales records
-    existing_sale = await mongodb.get_db()["waste_sales"].find_one({"_id": ObjectId(sale_id)})
-    if not existing_sale:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Sale record not found"
-        )
-    
     # Update total amount
+    sale_update.unit_price = await sale_unit_price(sale_update.category, sale_update.unit_price)
     sale_update.total_amount = sale_update.weight * sale_update.unit_price
     sale_update.updated_at = datetime.utcnow()
+    update_data = sale_update.dict(exclude_unset=True)
     
-    await mongodb.get_db()["waste_sales"].update_one(
-        {"_id": ObjectId(sale_id)},
-        {"$set": sale_update.dict(exclude_unset=True)}
+    query = {"_id": ObjectId(sale_id)}
+    db = await mongodb.find_tenant_db("waste_sales", query)
+    # Stock and rollups are kept per partition, so a sale cannot change partitions
+    if mongodb.get_tenant_db(sale_update.mrf_id) is not db:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A sale cannot be moved to an MRF in another partition"
+        )
+    
+    # The previous version is needed for the rollup delta; the new one is known locally
+    existing_sale = await db["waste_sales"].find_one_and_update(
+        query,
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
     )
+    if not existing_sale:
+        if await asyncio.to_thread(archive_store.archived_ids, "waste_sales", [sale_id]):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Sale record is in an archived month and can no longer be changed"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sale record not found"
+        )
     
-    updated_sale = await mongodb.get_db()["waste_sales"].find_one({"_id": ObjectId(sale_id)})
+    updated_sale = {**existing_sale, **update_data}
+    try:
+        await apply_stock(db, sale_change_stock(existing_sale, updated_sale))
+    except InsufficientStock:
+        await db["waste_sales"].replace_one({"_id": existing_sale["_id"]}, existing_sale)
+        raise
+    await record_sale_update(db, existing_sale, updated_sale)
     return WasteSale(**updated_sale) 
\ No newline at end of file
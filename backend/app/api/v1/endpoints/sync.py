@@ -0,0 +1,115 @@
+import asyncio
+import base64
+import binascii
+import heapq
+from datetime import datetime, timedelta
+from enum import Enum
+from itertools import islice
+from typing import Any, Dict, List, Optional
+from bson import json_util
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from app.core.config import settings
+from app.models.user import UserClaims
+from app.models.waste import InventoryItem, SortedWaste, WasteCategory, WasteIntake, WasteSale
+from app.api.deps import get_current_active_claims, require_mrf_scope
+from app.api.pagination import MAX_PAGE_SIZE, keyset_after
+from app.api.serialization import dumps, jsonable_rows
+from app.db.mongodb import mongodb
+from app.db.sync import GLOBAL_COLLECTIONS, SYNC_KEYS
+
+router = APIRouter()
+
+class SyncCollection(str, Enum):
+    waste_intake = "waste_intake"
+    sorted_waste = "sorted_waste"
+    waste_sales = "waste_sales"
+    inventory = "inventory"
+    waste_categories = "waste_categories"
+
+SYNC_MODELS = {
+    SyncCollection.waste_intake: WasteIntake,
+    SyncCollection.sorted_waste: SortedWaste,
+    SyncCollection.waste_sales: WasteSale,
+    SyncCollection.inventory: InventoryItem,
+    SyncCollection.waste_categories: WasteCategory,
+}
+
+def encode_watermark(mrf_id: Optional[str], marks: Dict[str, list]) -> str:
+    return base64.urlsafe_b64encode(json_util.dumps({"mrf_id": mrf_id, "marks": marks}).encode()).decode()
+
+def decode_watermark(watermark: Optional[str], mrf_id: Optional[str]) -> Dict[str, list]:
+    if not watermark:
+        return {}
+    try:
+        value = json_util.loads(base64.urlsafe_b64decode(watermark.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        value = None
+    # A watermark only holds for the MRF it was issued for
+    if not isinstance(value, dict) or value.get("mrf_id") != mrf_id or not isinstance(value.get("marks"), dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid watermark"
+        )
+    return value["marks"]
+
+async def changes_since(
+    collection: SyncCollection, mrf_id: Optional[str], mark: Optional[list], until: datetime, limit: int
+) -> List[dict]:
+    query = {"updated_at": {"$lte": until}}
+    if collection.value in GLOBAL_COLLECTIONS:
+        dbs = [mongodb.get_db()]
+    elif mrf_id:
+        query["mrf_id"] = mrf_id
+        dbs = [mongodb.get_tenant_db(mrf_id)]
+    else:
+        dbs = [mongodb.get_partition_db(partition) for partition in mongodb.partition_names()]
+    if mark:
+        query = keyset_after(query, mark, SYNC_KEYS)
+    results = await asyncio.gather(*(
+        db[collection.value].find(query).sort(
+            [(key, 1) for key in SYNC_KEYS]
+        ).limit(limit + 1).to_list(length=limit + 1)
+        for db in dbs
+    ))
+    if len(results) == 1:
+        return results[0]
+    # The watermark is global, so every partition's changes interleave into one order
+    return list(islice(
+        heapq.merge(*results, key=lambda document: tuple(document.get(key) for key in SYNC_KEYS)), limit + 1
+    ))
+
+@router.get("/", response_model=dict)
+async def get_changes(
+    mrf_id: Optional[str] = None,
+    collection: List[SyncCollection] = Query(list(SyncCollection)),
+    watermark: Optional[str] = None,
+    limit: Optional[int] = Query(None, gt=0, le=MAX_PAGE_SIZE),
+    current_user: UserClaims = Depends(get_current_active_claims)
+) -> Any:
+    # Rows created or changed since the watermark, oldest first, at most limit per
+    # collection; the work is proportional to the changes rather than to the collections
+    require_mrf_scope([mrf_id] if mrf_id else None, current_user)
+    marks = decode_watermark(watermark, mrf_id)
+    limit = limit or settings.SYNC_BATCH_SIZE
+    until = datetime.utcnow() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+
+    collections = list(dict.fromkeys(collection))
+    results = await asyncio.gather(*(
+        changes_since(name, mrf_id, marks.get(name.value), until, limit) for name in collections
+    ))
+
+    changes, has_more = {}, False
+    for name, documents in zip(collections, results):
+        if len(documents) > limit:
+            documents = documents[:limit]
+            has_more = True
+        if documents:
+            marks[name.value] = [documents[-1].get(key) for key in SYNC_KEYS]
+        changes[name.value] = jsonable_rows(SYNC_MODELS[name], documents)
+
+    return Response(content=dumps({
+        "changes": changes,
+        "watermark": encode_watermark(mrf_id, marks),
+        "has_more": has_more,
+        "until": until
+    }), media_type="application/json")
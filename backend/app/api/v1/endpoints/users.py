@@ -1,13 +1,29 @@
 from typing import List, Any
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.models.user import User, UserCreate, UserInDB
-from app.api.deps import get_current_active_user, get_current_active_manager
-from app.core.security import get_password_hash
+from app.api.deps import (
+    get_current_active_manager,
+    get_current_active_user,
+    revoke_user_tokens,
+    token_claims,
+    user_cache,
+)
+from app.api.serialization import rows_response
+from app.core.security import get_password_hash_async
 from app.db.mongodb import mongodb
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 router = APIRouter()
 
+async def _refresh_user_tokens(user_id: str, before: dict, after: dict) -> None:
+    # Tokens embed role, mrf_id and is_active, so changing any of them revokes the old ones
+    if token_claims(before) != token_claims(after):
+        await revoke_user_tokens(user_id)
+    else:
+        user_cache.invalidate(user_id)
+
 @router.get("/me", response_model=User)
 async def read_user_me(
     current_user: User = Depends(get_current_active_user)
@@ -22,18 +38,24 @@ async def update_user_me(
     # Only allow updating certain fields
     update_data = user_update.dict(exclude_unset=True)
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+        update_data["hashed_password"] = await get_password_hash_async(update_data.pop("password"))
     
     # Don't allow role changes through this endpoint
     if "role" in update_data:
         del update_data["role"]
     
-    await mongodb.get_db()["users"].update_one(
+    existing_user = await mongodb.get_db()["users"].find_one_and_update(
         {"_id": ObjectId(current_user.id)},
-        {"$set": update_data}
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
     )
-    
-    updated_user = await mongodb.get_db()["users"].find_one({"_id": ObjectId(current_user.id)})
+    if not existing_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    updated_user = {**existing_user, **update_data}
+    await _refresh_user_tokens(current_user.id, existing_user, updated_user)
     return User(**updated_user)
 
 @router.get("/", response_model=List[User])
@@ -48,30 +70,36 @@ async def read_users(
         query["mrf_id"] = mrf_id
     
     users = await mongodb.get_db()["users"].find(query).skip(skip).limit(limit).to_list(length=None)
-    return [User(**user) for user in users]
+    return rows_response(User, users)
 
 @router.post("/", response_model=User)
 async def create_user(
     user_in: UserCreate,
     current_user: User = Depends(get_current_active_manager)
 ) -> Any:
-    # Check if user already exists
-    if await mongodb.get_db()["users"].find_one({"email": user_in.email}):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
     # Create new user
     user_dict = user_in.dict()
-    user_dict["hashed_password"] = get_password_hash(user_in.password)
+    user_dict["hashed_password"] = await get_password_hash_async(user_in.password)
     del user_dict["password"]
     
     user = UserInDB(**user_dict)
-    result = await mongodb.get_db()["users"].insert_one(user.dict(by_alias=True))
+    user_doc = user.dict(by_alias=True)
     
-    created_user = await mongodb.get_db()["users"].find_one({"_id": result.inserted_id})
-    return User(**created_user)
+    # The unique email index rejects existing users
+    try:
+        await mongodb.get_db()["users"].insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    return User(**user_doc)
+
+@router.get("/cache/stats", response_model=dict)
+async def read_user_cache_stats(
+    current_user: User = Depends(get_current_active_manager)
+) -> Any:
+    return user_cache.stats()
 
 @router.get("/{user_id}", response_model=User)
 async def read_user(
@@ -92,23 +120,22 @@ async def update_user(
     user_update: UserCreate,
     current_user: User = Depends(get_current_active_manager)
 ) -> Any:
-    user = await mongodb.get_db()["users"].find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
     update_data = user_update.dict(exclude_unset=True)
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+        update_data["hashed_password"] = await get_password_hash_async(update_data.pop("password"))
     
-    await mongodb.get_db()["users"].update_one(
+    existing_user = await mongodb.get_db()["users"].find_one_and_update(
         {"_id": ObjectId(user_id)},
-        {"$set": update_data}
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
     )
-    
-    updated_user = await mongodb.get_db()["users"].find_one({"_id": ObjectId(user_id)})
+    if not existing_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    updated_user = {**existing_user, **update_data}
+    await _refresh_user_tokens(user_id, existing_user, updated_user)
     return User(**updated_user)
 
 @router.delete("/{user_id}", response_model=User)
@@ -116,17 +143,17 @@ async def delete_user(
     user_id: str,
     current_user: User = Depends(get_current_active_manager)
 ) -> Any:
-    user = await mongodb.get_db()["users"].find_one({"_id": ObjectId(user_id)})
+    # Soft delete - just mark as inactive
+    user = await mongodb.get_db()["users"].find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$set": {"is_active": False}},
+        return_document=ReturnDocument.BEFORE
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
+    await revoke_user_tokens(user_id)
     
-    # Soft delete - just mark as inactive
-    await mongodb.get_db()["users"].update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"is_active": False}}
-    )
-    
-    return User(**user) 
\ No newline at end of file
+    return User(**{**user, "is_active": False}) 
\ No newline at end of file
@@ -1,14 +1,35 @@
-from typing import List, Any
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from typing import List, Any, Optional
+from itertools import chain
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from pymongo.errors import DuplicateKeyError
 from app.models.waste import WasteIntake, SortedWaste, WasteCategory
-from app.models.user import User
-from app.api.deps import get_current_active_user
+from app.models.user import User, UserClaims
+from app.api.deps import get_current_active_claims, get_current_active_user
+from app.api.bulk import bulk_result, insert_records, partition_records, read_bulk_records, validate_records
+from app.api.pagination import MAX_PAGE_SIZE, fetch_page, stream_ndjson
+from app.api.serialization import encode_rows, rows_response
 from app.db.mongodb import mongodb
-from datetime import datetime, timedelta
+from app.db.archive import archive_store
+from app.db.categories import CATEGORY_COLLECTION, category_catalog
+from app.db.inventory import apply_stock, record_sorted_stock, sorted_stock
+from app.db.rollups import (
+    apply_rollups,
+    intake_increments,
+    record_intake,
+    record_sorted,
+    sorted_increments,
+)
+from datetime import datetime
 from bson import ObjectId
 
 router = APIRouter()
 
+INTAKE_ARCHIVED = "Waste intake record is in an archived month and can no longer be sorted"
+
+# The category list as sent, encoded once per catalog version
+_encoded_categories = {"version": None, "body": b""}
+
 @router.post("/intake", response_model=WasteIntake)
 async def create_waste_intake(
     intake: WasteIntake,
@@ -21,23 +42,69 @@ async def create_waste_intake(
         )
     
     intake.operator_id = str(current_user.id)
-    result = await mongodb.get_db()["waste_intake"].insert_one(intake.dict(by_alias=True))
-    created_intake = await mongodb.get_db()["waste_intake"].find_one({"_id": result.inserted_id})
-    return WasteIntake(**created_intake)
+    # /sync watermarks on updated_at, so the timestamps are the server's rather than the client's
+    intake.created_at = intake.updated_at = datetime.utcnow()
+    intake_doc = intake.dict(by_alias=True)
+    db = mongodb.get_tenant_db(intake.mrf_id)
+    await db["waste_intake"].insert_one(intake_doc)
+    await record_intake(db, intake_doc)
+    return intake
+
+@router.post("/intake/bulk", response_model=dict)
+async def create_waste_intakes_bulk(
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+) -> Any:
+    if current_user.role not in ["operator", "manager"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to create waste intake records"
+        )
+    
+    records, errors = await read_bulk_records(request)
+    intakes, validation_errors = validate_records(records, WasteIntake)
+    now = datetime.utcnow()
+    
+    documents = {}
+    for index, intake in intakes.items():
+        intake.operator_id = str(current_user.id)
+        intake.created_at = intake.updated_at = now
+        documents[index] = intake.dict(by_alias=True)
+    
+    inserted, write_errors = [], []
+    for partition, group in partition_records(documents).items():
+        db = mongodb.get_partition_db(partition)
+        group_inserted, group_errors = await insert_records(db["waste_intake"], group)
+        await apply_rollups(
+            db,
+            chain.from_iterable(intake_increments(group[index]) for index in group_inserted)
+        )
+        inserted += group_inserted
+        write_errors += group_errors
+    return bulk_result(len(records) + len(errors), inserted, errors + validation_errors + write_errors)
 
 @router.get("/intake", response_model=List[WasteIntake])
 async def get_waste_intakes(
     mrf_id: str,
     start_date: datetime = None,
     end_date: datetime = None,
-    current_user: User = Depends(get_current_active_user)
+    limit: Optional[int] = Query(None, gt=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: UserClaims = Depends(get_current_active_claims)
 ) -> Any:
     query = {"mrf_id": mrf_id}
     if start_date and end_date:
         query["date"] = {"$gte": start_date, "$lte": end_date}
     
-    intakes = await mongodb.get_db()["waste_intake"].find(query).to_list(length=None)
-    return [WasteIntake(**intake) for intake in intakes]
+    collection = mongodb.get_tenant_db(mrf_id)["waste_intake"]
+    if stream:
+        return stream_ndjson(collection, query, WasteIntake, cursor)
+    if limit or cursor:
+        return await fetch_page(collection, query, WasteIntake, limit, cursor)
+    
+    intakes = await collection.find(query).to_list(length=None)
+    return rows_response(WasteIntake, intakes)
 
 @router.post("/sort", response_model=SortedWaste)
 async def create_sorted_waste(
@@ -50,35 +117,130 @@ async def create_sorted_waste(
             detail="Not authorized to create sorted waste records"
         )
     
-    # Verify that the intake exists
-    intake = await mongodb.get_db()["waste_intake"].find_one({"_id": ObjectId(sorted_waste.intake_id)})
+    # Verify that the intake exists; its MRF decides where the sorted row goes
+    db, intake = await mongodb.find_tenant_document("waste_intake", {"_id": ObjectId(sorted_waste.intake_id)})
     if not intake:
+        if await asyncio.to_thread(archive_store.archived_ids, "waste_intake", [sorted_waste.intake_id]):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=INTAKE_ARCHIVED
+            )
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Waste intake record not found"
         )
     
     sorted_waste.operator_id = str(current_user.id)
-    result = await mongodb.get_db()["sorted_waste"].insert_one(sorted_waste.dict(by_alias=True))
-    created_sorted = await mongodb.get_db()["sorted_waste"].find_one({"_id": result.inserted_id})
-    return SortedWaste(**created_sorted)
+    sorted_waste.mrf_id = intake["mrf_id"]
+    sorted_waste.created_at = sorted_waste.updated_at = datetime.utcnow()
+    sorted_doc = sorted_waste.dict(by_alias=True)
+    await db["sorted_waste"].insert_one(sorted_doc)
+    await record_sorted(db, sorted_doc)
+    await record_sorted_stock(db, sorted_doc)
+    return sorted_waste
+
+@router.post("/sort/bulk", response_model=dict)
+async def create_sorted_waste_bulk(
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+) -> Any:
+    if current_user.role not in ["operator", "manager"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to create sorted waste records"
+        )
+    
+    records, errors = await read_bulk_records(request)
+    sorted_wastes, validation_errors = validate_records(records, SortedWaste)
+    
+    # Verify every referenced intake with a single $in query
+    intake_ids = {
+        ObjectId(sorted_waste.intake_id)
+        for sorted_waste in sorted_wastes.values()
+        if ObjectId.is_valid(sorted_waste.intake_id)
+    }
+    intakes = await mongodb.find_in_partitions(
+        "waste_intake", {"_id": {"$in": list(intake_ids)}}, {"mrf_id": 1}
+    )
+    intake_mrfs = {str(intake["_id"]): intake["mrf_id"] for intake in intakes}
+    missing = [str(intake_id) for intake_id in intake_ids if str(intake_id) not in intake_mrfs]
+    archived = await asyncio.to_thread(archive_store.archived_ids, "waste_intake", missing)
+    
+    now = datetime.utcnow()
+    documents = {}
+    for index, sorted_waste in sorted_wastes.items():
+        if sorted_waste.intake_id in archived:
+            validation_errors.append({"index": index, "detail": INTAKE_ARCHIVED})
+            continue
+        if sorted_waste.intake_id not in intake_mrfs:
+            validation_errors.append({"index": index, "detail": "Waste intake record not found"})
+            continue
+        sorted_waste.operator_id = str(current_user.id)
+        sorted_waste.mrf_id = intake_mrfs[sorted_waste.intake_id]
+        sorted_waste.created_at = sorted_waste.updated_at = now
+        documents[index] = sorted_waste.dict(by_alias=True)
+    
+    inserted, write_errors = [], []
+    for partition, group in partition_records(documents).items():
+        db = mongodb.get_partition_db(partition)
+        group_inserted, group_errors = await insert_records(db["sorted_waste"], group)
+        await apply_rollups(
+            db,
+            chain.from_iterable(sorted_increments(group[index]) for index in group_inserted)
+        )
+        await apply_stock(
+            db,
+            chain.from_iterable(sorted_stock(group[index]) for index in group_inserted),
+            enforce=False
+        )
+        inserted += group_inserted
+        write_errors += group_errors
+    return bulk_result(len(records) + len(errors), inserted, errors + validation_errors + write_errors)
 
 @router.get("/sort", response_model=List[SortedWaste])
 async def get_sorted_waste(
     intake_id: str,
-    current_user: User = Depends(get_current_active_user)
+    limit: Optional[int] = Query(None, gt=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: UserClaims = Depends(get_current_active_claims)
 ) -> Any:
-    sorted_wastes = await mongodb.get_db()["sorted_waste"].find(
-        {"intake_id": intake_id}
-    ).to_list(length=None)
-    return [SortedWaste(**waste) for waste in sorted_wastes]
+    query = {"intake_id": intake_id}
+    # The request names no MRF, so the partition is the one holding the intake's rows
+    collection = (await mongodb.find_tenant_db("sorted_waste", query))["sorted_waste"]
+    if stream:
+        return stream_ndjson(collection, query, SortedWaste, cursor)
+    if limit or cursor:
+        return await fetch_page(collection, query, SortedWaste, limit, cursor)
+    
+    sorted_wastes = await collection.find(query).to_list(length=None)
+    return rows_response(SortedWaste, sorted_wastes)
 
 @router.get("/categories", response_model=List[WasteCategory])
 async def get_waste_categories(
-    current_user: User = Depends(get_current_active_user)
+    request: Request,
+    limit: Optional[int] = Query(None, gt=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: UserClaims = Depends(get_current_active_claims)
 ) -> Any:
-    categories = await mongodb.get_db()["waste_categories"].find().to_list(length=None)
-    return [WasteCategory(**category) for category in categories]
+    # Categories have no date, so they page on _id alone
+    collection = mongodb.get_db()[CATEGORY_COLLECTION]
+    if stream:
+        return stream_ndjson(collection, {}, WasteCategory, cursor, keys=("_id",))
+    if limit or cursor:
+        return await fetch_page(collection, {}, WasteCategory, limit, cursor, keys=("_id",))
+    
+    # The whole list comes from the in-memory catalog, ordered by name
+    await category_catalog.ensure_loaded(mongodb.get_db())
+    headers = {"ETag": category_catalog.etag, "Cache-Control": "private, no-cache"}
+    if category_catalog.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if _encoded_categories["version"] != category_catalog.version:
+        _encoded_categories.update(
+            version=category_catalog.version, body=encode_rows(WasteCategory, category_catalog.rows)
+        )
+    return Response(content=_encoded_categories["body"], media_type="application/json", headers=headers)
 
 @router.post("/categories", response_model=WasteCategory)
 async def create_waste_category(
@@ -90,6 +252,14 @@ async def create_waste_category(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only managers can create waste categories"
         )
-    result = await mongodb.get_db()["waste_categories"].insert_one(category.dict())
-    created_category = await mongodb.get_db()["waste_categories"].find_one({"_id": result.inserted_id})
-    return WasteCategory(**created_category) 
\ No newline at end of file
+    category.updated_at = datetime.utcnow()
+    try:
+        await mongodb.get_db()[CATEGORY_COLLECTION].insert_one(category.dict())
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A waste category with this name already exists"
+        )
+    # Other workers pick the new category up through the refresh loop or change stream
+    await category_catalog.load(mongodb.get_db())
+    return category 
\ No newline at end of file
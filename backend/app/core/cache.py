@@ -0,0 +1,189 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable, Optional
+from app.core.config import settings
+
+class TTLCache:
+    # Bounded LRU cache whose entries also expire after a time-to-live
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+# Report backends count invalidations in a generation. A report is computed after reading
+# the generation and stored only if it has not moved since, so a compute that overlapped
+# a write never caches what it read before that write
+
+class MemoryReportBackend:
+    # In-process LRU of report bodies, each tagged with the MRF and day range it covers.
+    # Only writes made by this process invalidate it; with several workers use redis
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._scopes = {}
+        self._generation = 0
+
+    async def generation(self) -> int:
+        return self._generation
+
+    async def get(self, key: str) -> Optional[tuple]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: tuple, scope: tuple, generation: int) -> None:
+        if generation != self._generation:
+            return
+        self._entries.set(key, value)
+        self._scopes[key] = scope
+        # Forget scopes of entries the LRU has already dropped
+        if len(self._scopes) > 2 * max(self._entries.maxsize, 1):
+            self._scopes = {k: v for k, v in self._scopes.items() if k in self._entries}
+
+    async def invalidate(self, mrf_id: Optional[str], day: datetime) -> None:
+        self._generation += 1
+        for key, (scope_mrf, start, end) in list(self._scopes.items()):
+            if scope_mrf in (None, mrf_id) and start <= day <= end:
+                self._entries.invalidate(key)
+                del self._scopes[key]
+
+    async def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        self._scopes.clear()
+
+class RedisReportBackend:
+    # Shares cached reports, and their invalidation, between workers and the CLIs; scopes
+    # are kept in one set per MRF
+    GENERATION_KEY = "report-generation"
+
+    def __init__(self, url: str, ttl: float):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._ttl = int(ttl)
+
+    @staticmethod
+    def _scope_key(mrf_id: Optional[str]) -> str:
+        return f"report-scopes:{mrf_id if mrf_id is not None else '*'}"
+
+    async def generation(self) -> int:
+        return int(await self._redis.get(self.GENERATION_KEY) or 0)
+
+    async def get(self, key: str) -> Optional[tuple]:
+        value = await self._redis.get(f"report:{key}")
+        if value is None:
+            return None
+        etag, body = value.split(b"\n", 1)
+        return etag.decode(), body
+
+    async def set(self, key: str, value: tuple, scope: tuple, generation: int) -> None:
+        from redis.exceptions import WatchError
+
+        etag, body = value
+        scope_mrf, start, end = scope
+        scope_key = self._scope_key(scope_mrf)
+        # WATCH makes the write fail if another worker invalidates before it commits
+        async with self._redis.pipeline(transaction=True) as pipe:
+            await pipe.watch(self.GENERATION_KEY)
+            if int(await pipe.get(self.GENERATION_KEY) or 0) != generation:
+                return
+            pipe.multi()
+            pipe.set(f"report:{key}", etag.encode() + b"\n" + body, ex=self._ttl)
+            pipe.sadd(scope_key, f"{start.isoformat()}|{end.isoformat()}|{key}")
+            pipe.expire(scope_key, self._ttl)
+            try:
+                await pipe.execute()
+            except WatchError:
+                pass
+
+    async def invalidate(self, mrf_id: Optional[str], day: datetime) -> None:
+        await self._redis.incr(self.GENERATION_KEY)
+        for scope_key in {self._scope_key(mrf_id), self._scope_key(None)}:
+            for member in await self._redis.smembers(scope_key):
+                start, end, key = member.decode().split("|", 2)
+                if datetime.fromisoformat(start) <= day <= datetime.fromisoformat(end):
+                    await self._redis.delete(f"report:{key}")
+                    await self._redis.srem(scope_key, member)
+
+    async def clear(self) -> None:
+        await self._redis.incr(self.GENERATION_KEY)
+        async for key in self._redis.scan_iter(match="report:*"):
+            await self._redis.delete(key)
+        async for key in self._redis.scan_iter(match="report-scopes:*"):
+            await self._redis.delete(key)
+
+class NullReportBackend:
+    async def generation(self) -> int:
+        return 0
+
+    async def get(self, key: str) -> Optional[tuple]:
+        return None
+
+    async def set(self, key: str, value: tuple, scope: tuple, generation: int) -> None:
+        pass
+
+    async def invalidate(self, mrf_id: Optional[str], day: datetime) -> None:
+        pass
+
+    async def clear(self) -> None:
+        pass
+
+def build_report_cache():
+    if settings.REPORT_CACHE_BACKEND == "redis":
+        return RedisReportBackend(settings.REDIS_URL, settings.REPORT_CACHE_TTL_SECONDS)
+    if settings.REPORT_CACHE_BACKEND == "memory":
+        return MemoryReportBackend(settings.REPORT_CACHE_SIZE, settings.REPORT_CACHE_TTL_SECONDS)
+    return NullReportBackend()
+
+report_cache = build_report_cache()
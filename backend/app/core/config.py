@@ -43,7 +43,7 @@
 # settings = Settings() /
 # app/core/config.py
 
-from typing import List, Union
+from typing import Dict, List, Optional, Union
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import AnyHttpUrl, validator
 
@@ -66,12 +66,83 @@ class Settings(BaseSettings):
     # MongoDB Configuration
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "mrf_digitrack"
+    MONGODB_MAX_POOL_SIZE: int = 100
+    MONGODB_MIN_POOL_SIZE: int = 0
+    MONGODB_MAX_IDLE_TIME_MS: Optional[int] = None
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = None  # None waits for a free connection indefinitely
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 30000
+    MONGODB_CONNECT_TIMEOUT_MS: int = 20000
+    MONGODB_COMPRESSORS: str = ""  # e.g. "zstd,snappy,zlib"; zstd and snappy need their packages
+    # Reports and exports read through this preference; everything else uses the primary.
+    # A secondary can lag the write that just invalidated a cached report, and the
+    # recomputed report would then be cached stale until REPORT_CACHE_TTL_SECONDS, so only
+    # move reads off the primary with REPORT_CACHE_BACKEND=none or tolerance for that lag
+    MONGODB_REPORT_READ_PREFERENCE: str = "primary"
+    MONGODB_REPORT_MAX_STALENESS_SECONDS: int = -1  # -1 means no limit
+    MONGODB_WARMUP_CONNECTIONS: int = 10
+    # Tenant partitions: MRFs listed in MONGODB_TENANT_PARTITIONS live in their own database
+    # or cluster; every other MRF, and the global collections, stay on MONGODB_URL
+    MONGODB_PARTITIONS: Dict[str, str] = {}  # partition name -> MongoDB URL; a database in the path overrides MONGODB_DB_NAME
+    MONGODB_TENANT_PARTITIONS: Dict[str, str] = {}  # mrf_id -> partition name
 
     # JWT Configuration
     SECRET_KEY: str = "your-secret-key-here"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
 
+    # Password hashing pool ("thread" or "process")
+    PASSWORD_HASH_EXECUTOR: str = "thread"
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64  # running + queued before answering 503
+
+    # Authenticated-user cache
+    USER_CACHE_SIZE: int = 1024
+    USER_CACHE_TTL_SECONDS: float = 60
+    USER_CACHE_CHANGE_STREAM: bool = False  # needs a replica set
+    TOKEN_CACHE_SIZE: int = 4096
+    TOKEN_REVOCATION_REFRESH_SECONDS: float = 30
+
+    # Reports
+    REPORT_TIMEOUT_SECONDS: float = 10
+    # "memory", "redis" or "none". A memory cache is per worker and only sees that worker's
+    # writes (and no CLI rebuild or archive run); with several workers use redis
+    REPORT_CACHE_BACKEND: str = "memory"
+    REPORT_CACHE_SIZE: int = 512
+    REPORT_CACHE_TTL_SECONDS: float = 300
+    REDIS_URL: str = "redis://localhost:6379/0"
+
+    # Inventory ledger
+    INVENTORY_ENFORCE_STOCK: bool = False  # reject sales that would take stock below zero
+    INVENTORY_DRIFT_CHECK_SECONDS: float = 0  # 0 disables the periodic drift check
+
+    # Waste category catalog
+    SALE_PRICE_POLICY: str = "trust"  # "trust", "category", "price" or "catalog", see db/categories.py
+    CATEGORY_REFRESH_SECONDS: float = 60  # reload interval for categories written by other workers; 0 disables
+    CATEGORY_CHANGE_STREAM: bool = False  # needs a replica set
+
+    # Live event feed
+    EVENTS_CHANGE_STREAM: bool = False  # needs a replica set; otherwise events are published in-process
+    EVENTS_QUEUE_SIZE: int = 100
+    EVENTS_MAX_SUBSCRIBERS: int = 5000
+    EVENTS_HEARTBEAT_SECONDS: float = 15
+
+    # Instrumentation
+    METRICS_ENABLED: bool = True
+    SLOW_REQUEST_MS: float = 0  # log requests slower than this with their query shapes; 0 disables
+
+    # Response serialization
+    TRUST_DB_READS: bool = False  # encode list reads straight from MongoDB without validating them
+
+    # Delta sync
+    SYNC_BATCH_SIZE: int = 500  # changed rows per collection per response
+    SYNC_SETTLE_SECONDS: float = 5  # rows newer than this wait for the next sync, so in-flight writes are not skipped
+
+    # Cold storage for closed months (python -m app.db.archive run)
+    ARCHIVE_DIR: str = ""  # empty disables archiving and archive reads; only reports read archived months
+    ARCHIVE_HOT_MONTHS: int = 3  # whole months kept in MongoDB before the current one
+    ARCHIVE_COMPRESSION: str = "zstd"  # "zstd", "lz4" or "none"; uncompressed files are read zero-copy
+    ARCHIVE_TABLE_CACHE_SIZE: int = 64  # archived files kept open in memory
+
     # Environment
     ENVIRONMENT: str = "development"
     DEBUG: bool = True
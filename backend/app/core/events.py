@@ -0,0 +1,100 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+from fastapi.encoders import jsonable_encoder
+from app.core.config import settings
+
+class TooManySubscribers(Exception):
+    pass
+
+class Subscription:
+    # Bounded queue of encoded events; when a slow client falls behind, the oldest
+    # events are dropped and the client is told to resync
+    def __init__(self, mrf_id: Optional[str], maxsize: int):
+        self.mrf_id = mrf_id
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.lagged = False
+
+    def push(self, message: str) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.lagged = True
+        self.queue.put_nowait(message)
+
+class EventBroker:
+    # Fans ledger changes out to live subscribers and keeps today's running totals per MRF
+    def __init__(self, queue_size: int, max_subscribers: int):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: Dict[Optional[str], Set[Subscription]] = {}
+        self._totals: Dict[str, dict] = {}
+        # Days that began while we were listening have been observed in full
+        self._watching_since = datetime.utcnow()
+
+    def subscribe(self, mrf_id: Optional[str] = None) -> Subscription:
+        if self.subscriber_count() >= self.max_subscribers:
+            raise TooManySubscribers()
+        subscription = Subscription(mrf_id, self.queue_size)
+        self._subscribers.setdefault(mrf_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.mrf_id, set())
+        subscribers.discard(subscription)
+        if not subscribers:
+            self._subscribers.pop(subscription.mrf_id, None)
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def seed_totals(self, day: datetime, totals: Dict[str, dict]) -> None:
+        # Totals read from the rollups; ones already being tracked are more recent
+        for mrf_id, counters in totals.items():
+            current = self._totals.get(mrf_id)
+            if current is None or current["day"] < day:
+                self._totals[mrf_id] = {"day": day, **counters}
+
+    def day_totals(self, day: datetime) -> Dict[str, dict]:
+        return {mrf_id: totals for mrf_id, totals in self._totals.items() if totals["day"] == day}
+
+    def _add_to_totals(self, mrf_id: str, day: datetime, counters: dict) -> Optional[dict]:
+        current = self._totals.get(mrf_id)
+        if current is None or current["day"] < day:
+            if day < self._watching_since:
+                return None
+            current = self._totals[mrf_id] = {"day": day}
+        elif current["day"] > day:
+            return None
+        for field, value in counters.items():
+            current[field] = current.get(field, 0) + value
+        return current
+
+    def publish(self, increments: Iterable[Tuple[tuple, dict]]) -> None:
+        # increments are rollup (key, counters) pairs, see app.db.rollups
+        for (mrf_id, day, category), counters in increments:
+            totals = self._add_to_totals(mrf_id, day, counters)
+            if not (self._subscribers.get(mrf_id) or self._subscribers.get(None)):
+                continue
+
+            kind = next(iter(counters)).split("_", 1)[0]
+            # Encoded once, however many clients receive it
+            message = format_event("ledger", {
+                "type": kind,
+                "mrf_id": mrf_id,
+                "day": day,
+                "category": category,
+                "delta": counters,
+                "totals": totals
+            })
+            for subscription in self._subscribers.get(mrf_id, ()):
+                subscription.push(message)
+            for subscription in self._subscribers.get(None, ()):
+                subscription.push(message)
+
+def format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+event_broker = EventBroker(settings.EVENTS_QUEUE_SIZE, settings.EVENTS_MAX_SUBSCRIBERS)
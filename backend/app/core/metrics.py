@@ -0,0 +1,218 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+from pymongo import monitoring
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+MAX_SHAPES = 20
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+class RequestStats:
+    # Database work done on behalf of one request; appended to from Motor's executor threads
+    __slots__ = ("commands",)
+
+    def __init__(self):
+        self.commands: List[Tuple[float, Optional[str]]] = []
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+class MetricsRegistry:
+    def __init__(self):
+        self.in_flight = 0
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.response_size: Dict[Tuple[str, str], Histogram] = {}
+        self.db_time: Dict[Tuple[str, str], Histogram] = {}
+        self.db_operations: Dict[Tuple[str, str], int] = {}
+        # Command events arrive on Motor's worker threads
+        self._command_lock = threading.Lock()
+        self.commands: Dict[Tuple[str, str], List[float]] = {}
+
+    def observe_request(
+        self, method: str, route: str, status: int, duration: float, size: int, stats: RequestStats
+    ) -> None:
+        key = (method, route)
+        self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+        self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(duration)
+        self.response_size.setdefault(key, Histogram(SIZE_BUCKETS)).observe(size)
+        self.db_time.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(
+            sum(seconds for seconds, _ in stats.commands)
+        )
+        self.db_operations[key] = self.db_operations.get(key, 0) + len(stats.commands)
+
+    def observe_command(self, command: str, collection: str, duration: float, failed: bool) -> None:
+        with self._command_lock:
+            totals = self.commands.setdefault((command, collection), [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] += failed
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being served",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_requests_total Requests served",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+        for name, help_text, histograms in (
+            ("http_request_duration_seconds", "Request latency", self.latency),
+            ("http_response_size_bytes", "Response body size", self.response_size),
+            ("http_request_db_seconds", "Time spent in MongoDB commands per request", self.db_time),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (method, route), histogram in sorted(histograms.items()):
+                lines += histogram.render(name, f'method="{method}",route="{route}"')
+
+        lines += [
+            "# HELP http_request_db_operations_total MongoDB commands issued by requests",
+            "# TYPE http_request_db_operations_total counter",
+        ]
+        for (method, route), count in sorted(self.db_operations.items()):
+            lines.append(f'http_request_db_operations_total{{method="{method}",route="{route}"}} {count}')
+
+        with self._command_lock:
+            commands = sorted((key, list(totals)) for key, totals in self.commands.items())
+        lines += ["# HELP mongodb_commands_total MongoDB commands", "# TYPE mongodb_commands_total counter"]
+        lines += [f'mongodb_commands_total{{command="{c}",collection="{n}"}} {t[0]}' for (c, n), t in commands]
+        lines += ["# HELP mongodb_command_seconds_total Time spent in MongoDB commands", "# TYPE mongodb_command_seconds_total counter"]
+        lines += [f'mongodb_command_seconds_total{{command="{c}",collection="{n}"}} {t[1]}' for (c, n), t in commands]
+        lines += ["# HELP mongodb_command_failures_total Failed MongoDB commands", "# TYPE mongodb_command_failures_total counter"]
+        lines += [f'mongodb_command_failures_total{{command="{c}",collection="{n}"}} {t[2]}' for (c, n), t in commands]
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+def _shape(value, depth: int = 0):
+    # Field names and operators of a query with every literal replaced by "?"
+    if isinstance(value, dict) and depth < 4:
+        return {key: _shape(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, list) and depth < 4:
+        return [_shape(item, depth + 1) for item in value[:5]]
+    return "?"
+
+def query_shape(command_name: str, command: dict) -> str:
+    if command_name == "aggregate":
+        body = _shape(command.get("pipeline", []))
+    elif command_name in ("update", "delete"):
+        body = _shape([op.get("q") for op in command.get(f"{command_name}s", [])[:1]])
+    else:
+        body = _shape(command.get("filter", command.get("query", {})))
+    return f"{command_name} {command.get(command_name)} {json.dumps(body)[:300]}"
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._pending: Dict[Tuple, Tuple[Optional[RequestStats], str, Optional[str]]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        shape = None
+        if settings.SLOW_REQUEST_MS > 0:
+            shape = query_shape(event.command_name, event.command)
+        self._pending[(event.connection_id, event.request_id)] = (
+            current_request.get(), collection if isinstance(collection, str) else "", shape
+        )
+
+    def _finish(self, event, failed: bool) -> None:
+        stats, collection, shape = self._pending.pop((event.connection_id, event.request_id), (None, "", None))
+        duration = event.duration_micros / 1_000_000
+        metrics.observe_command(event.command_name, collection, duration, failed)
+        if stats is not None:
+            stats.commands.append((duration, shape))
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, failed=True)
+
+command_metrics = CommandMetrics()
+
+class MetricsMiddleware:
+    # Plain ASGI middleware, so streaming responses pass through untouched
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[object, str] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._routes:
+            # Label by path template rather than the raw path to keep cardinality bounded
+            for route in getattr(scope.get("app"), "routes", []):
+                if getattr(route, "endpoint", None) is endpoint:
+                    self._routes[endpoint] = route.path
+                    break
+            else:
+                self._routes[endpoint] = getattr(endpoint, "__name__", "unknown")
+        return self._routes[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code, size = 500, 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            metrics.in_flight -= 1
+            current_request.reset(token)
+            route = self._route(scope)
+            metrics.observe_request(scope["method"], route, status_code, duration, size, stats)
+            if settings.SLOW_REQUEST_MS > 0 and duration * 1000 >= settings.SLOW_REQUEST_MS:
+                logger.warning(
+                    "Slow request %s %s: %.0fms, status %d, %d MongoDB commands taking %.0fms: %s",
+                    scope["method"], route, duration * 1000, status_code, len(stats.commands),
+                    sum(seconds for seconds, _ in stats.commands) * 1000,
+                    [shape for _, shape in stats.commands[:MAX_SHAPES]]
+                )
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from bson import ObjectId
+from pymongo import DeleteOne, UpdateOne
+from dateutil.relativedelta import relativedelta
+from app.core.cache import report_cache
+from app.core.config import settings
+from app.db.mongodb import mongodb
+from app.db.rollups import MONTHLY_ROLLUP_COLLECTION, ROLLUP_COLLECTION, ROLLUP_FIELDS, month_start, naive_utc
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = 5000
+MANIFEST = "manifest.json"
+
+# Column name and kind ("string", "float", "int" or "datetime") per ledger collection
+LEDGER_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "waste_intake": [
+        ("_id", "string"),
+        ("mrf_id", "string"),
+        ("vehicle_id", "string"),
+        ("weight", "float"),
+        ("date", "datetime"),
+        ("operator_id", "string"),
+        ("notes", "string"),
+        ("created_at", "datetime"),
+        ("updated_at", "datetime"),
+    ],
+    "sorted_waste": [
+        ("_id", "string"),
+        ("intake_id", "string"),
+        ("mrf_id", "string"),
+        ("category", "string"),
+        ("weight", "float"),
+        ("date", "datetime"),
+        ("operator_id", "string"),
+        ("notes", "string"),
+        ("created_at", "datetime"),
+        ("updated_at", "datetime"),
+    ],
+    "waste_sales": [
+        ("_id", "string"),
+        ("mrf_id", "string"),
+        ("category", "string"),
+        ("weight", "float"),
+        ("unit_price", "float"),
+        ("total_amount", "float"),
+        ("buyer_name", "string"),
+        ("buyer_contact", "string"),
+        ("date", "datetime"),
+        ("operator_id", "string"),
+        ("notes", "string"),
+        ("created_at", "datetime"),
+        ("updated_at", "datetime"),
+    ],
+}
+
+ROLLUP_COLLECTIONS = (ROLLUP_COLLECTION, MONTHLY_ROLLUP_COLLECTION)
+_ROLLUP_COUNTERS = [(field, "int" if field.endswith("_count") else "float") for field in ROLLUP_FIELDS]
+ARCHIVE_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    **LEDGER_COLUMNS,
+    ROLLUP_COLLECTION: [("mrf_id", "string"), ("day", "datetime"), ("category", "string")] + _ROLLUP_COUNTERS,
+    MONTHLY_ROLLUP_COLLECTION: [("mrf_id", "string"), ("month", "datetime"), ("category", "string")] + _ROLLUP_COUNTERS,
+}
+# Field that places a row in a month
+DATE_FIELDS = {
+    "waste_intake": "date",
+    "sorted_waste": "date",
+    "waste_sales": "date",
+    ROLLUP_COLLECTION: "day",
+    MONTHLY_ROLLUP_COLLECTION: "month",
+}
+
+def arrow_schema(pa, columns: List[Tuple[str, str]]):
+    types = {"string": pa.string(), "float": pa.float64(), "int": pa.int64(), "datetime": pa.timestamp("ms")}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+def column_value(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+def columns_of(batch: List[dict], columns: List[Tuple[str, str]]) -> Dict[str, list]:
+    return {name: [column_value(document.get(name)) for document in batch] for name, _ in columns}
+
+class ArchiveStore:
+    # Closed months on local disk. Each archive run of a month writes a segment
+    # directory named YYYY-MM.N with one Arrow IPC file per collection; its manifest is
+    # written last and the directory renamed into place, so readers never see half a segment
+    def __init__(self, directory: str, cache_size: int):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._tables: "OrderedDict[str, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def segments(self) -> List[Tuple[datetime, str]]:
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        segments = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.exists(os.path.join(path, MANIFEST)):
+                segments.append((datetime.strptime(name.split(".")[0], "%Y-%m"), path))
+        return sorted(segments)
+
+    def covers(self, start: datetime, end: datetime) -> List[Tuple[datetime, str]]:
+        # Segments whose month overlaps [start, end]
+        start, end = naive_utc(start), naive_utc(end)
+        return [
+            (month, path) for month, path in self.segments()
+            if month <= end and month + relativedelta(months=1) > start
+        ]
+
+    def table(self, path: str, collection: str):
+        import pyarrow as pa
+
+        file_path = os.path.join(path, f"{collection}.arrow")
+        mtime = os.stat(file_path).st_mtime_ns
+        with self._lock:
+            cached = self._tables.get(file_path)
+            if cached and cached[0] == mtime:
+                self._tables.move_to_end(file_path)
+                return cached[1]
+
+        # Memory-mapped, so pages come from the OS page cache on demand; uncompressed
+        # files are used zero-copy, compressed ones are decompressed once and kept here
+        table = pa.ipc.open_file(pa.memory_map(file_path)).read_all()
+        with self._lock:
+            self._tables[file_path] = (mtime, table)
+            while len(self._tables) > self.cache_size:
+                self._tables.popitem(last=False)
+        return table
+
+    def scan(
+        self,
+        collection: str,
+        start: datetime,
+        end: datetime,
+        filters: Optional[Dict[str, Sequence]] = None,
+    ):
+        # Archived rows with their date field in [start, end]; a filter keeps rows whose
+        # column is one of the values, None standing for a missing value
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        field = DATE_FIELDS[collection]
+        start, end = naive_utc(start), naive_utc(end)
+        tables = []
+        for _, path in self.covers(start, end):
+            table = self.table(path, collection)
+            mask = pc.and_(pc.greater_equal(table[field], start), pc.less_equal(table[field], end))
+            for column, values in (filters or {}).items():
+                if values is None:
+                    continue
+                present = [value for value in values if value is not None]
+                matches = pc.is_in(table[column], value_set=pa.array(present, pa.string()))
+                if len(present) < len(values):
+                    matches = pc.or_(matches, pc.is_null(table[column]))
+                mask = pc.and_(mask, matches)
+            tables.append(table.filter(mask))
+        if not tables:
+            return arrow_schema(pa, ARCHIVE_COLUMNS[collection]).empty_table()
+        return pa.concat_tables(tables)
+
+    def rows(self, collection: str, start: datetime, end: datetime, filters: Optional[Dict[str, Sequence]] = None) -> List[dict]:
+        return [
+            {name: value for name, value in row.items() if value is not None}
+            for row in self.scan(collection, start, end, filters).to_pylist()
+        ]
+
+    def archived_ids(self, collection: str, ids: Sequence[str]) -> Set[str]:
+        # Which of ids were moved here; asked only after a live lookup misses
+        if not ids or not self.segments():
+            return set()
+        return set(self.scan(collection, datetime.min, datetime.max, {"_id": list(ids)})["_id"].to_pylist())
+
+    def aggregate(
+        self,
+        collection: str,
+        start: datetime,
+        end: datetime,
+        filters: Optional[Dict[str, Sequence]],
+        keys: Sequence[str],
+        sums: Dict[str, Optional[str]],
+        floor: Optional[str] = None,
+    ) -> List[dict]:
+        # The archive's answer to a $match + $group: rows shaped {"_id": {key: value}, output: sum}.
+        # sums maps output fields to columns, None counting rows; floor truncates the
+        # date field to that unit first, as $dateTrunc would
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        table = self.scan(collection, start, end, filters)
+        if not table.num_rows:
+            return []
+        field = DATE_FIELDS[collection]
+        if floor:
+            floored = pc.floor_temporal(table[field], unit=floor, week_starts_monday=True)
+            table = table.set_column(table.schema.get_field_index(field), field, floored)
+        table = table.append_column("_rows", pa.array([1] * table.num_rows, pa.int64()))
+
+        columns = list(dict.fromkeys(column or "_rows" for column in sums.values()))
+        grouped = table.group_by(list(keys)).aggregate([(column, "sum") for column in columns])
+        return [
+            {
+                "_id": {key: row[key] for key in keys},
+                **{output: row[f"{column or '_rows'}_sum"] or 0 for output, column in sums.items()}
+            }
+            for row in grouped.to_pylist()
+        ]
+
+archive_store = ArchiveStore(settings.ARCHIVE_DIR, settings.ARCHIVE_TABLE_CACHE_SIZE)
+
+def _segment_path(store: ArchiveStore, month: datetime) -> str:
+    existing = [path for segment, path in store.segments() if segment == month]
+    return os.path.join(store.directory, f"{month:%Y-%m}.{len(existing)}")
+
+def archived_counters(collection: str, document: dict) -> Optional[dict]:
+    if collection not in ROLLUP_COLLECTIONS:
+        return None
+    return {field: document.get(field) for field in ROLLUP_FIELDS}
+
+async def delete_archived(db, archived: Dict[str, Dict[Any, Optional[dict]]]) -> None:
+    # archived maps each collection's copied _ids to their counters (None for ledgers).
+    # A rollup row is deleted only while it still holds the copied counters; one a late
+    # $inc reached in between stays live with the copied amounts taken off, so it and
+    # the archive still add up to the total
+    for collection, rows in archived.items():
+        ids = list(rows)
+        for start in range(0, len(ids), ARCHIVE_BATCH_SIZE):
+            batch = ids[start:start + ARCHIVE_BATCH_SIZE]
+            if collection not in ROLLUP_COLLECTIONS:
+                await db[collection].delete_many({"_id": {"$in": batch}})
+                continue
+            await db[collection].bulk_write(
+                [DeleteOne({"_id": _id, **rows[_id]}) for _id in batch], ordered=False
+            )
+            changed = await db[collection].find({"_id": {"$in": batch}}, {"_id": 1}).to_list(length=None)
+            updates = [
+                UpdateOne({"_id": row["_id"]}, {"$inc": {field: -value for field, value in rows[row["_id"]].items() if value}})
+                for row in changed
+                if any(rows[row["_id"]].values())
+            ]
+            if updates:
+                await db[collection].bulk_write(updates, ordered=False)
+
+async def archive_month(db, store: ArchiveStore, month: datetime) -> Dict[str, int]:
+    # Copy a closed month of ledgers and rollups to a new segment, then delete exactly
+    # what was copied; rows written to the month later stay live and add up in reports.
+    # Only the reports read segments: the ledger lists, /sales/summary, /export and /sync
+    # see live rows alone, and writes that name an archived row are refused with a 409
+    import pyarrow as pa
+
+    next_month = month + relativedelta(months=1)
+    path = _segment_path(store, month)
+    staging = path + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    options = pa.ipc.IpcWriteOptions(
+        compression=None if settings.ARCHIVE_COMPRESSION == "none" else settings.ARCHIVE_COMPRESSION
+    )
+
+    counts, archived = {}, {}
+    for collection, columns in ARCHIVE_COLUMNS.items():
+        field = DATE_FIELDS[collection]
+        schema = arrow_schema(pa, columns)
+        cursor = db[collection].find({field: {"$gte": month, "$lt": next_month}}).sort(
+            [(field, 1), ("_id", 1)]
+        ).batch_size(ARCHIVE_BATCH_SIZE)
+        rows = archived[collection] = {}
+        with pa.ipc.new_file(os.path.join(staging, f"{collection}.arrow"), schema, options=options) as writer:
+            while True:
+                batch = await cursor.to_list(length=ARCHIVE_BATCH_SIZE)
+                if not batch:
+                    break
+                rows.update((document["_id"], archived_counters(collection, document)) for document in batch)
+                record_batch = pa.record_batch(list(columns_of(batch, columns).values()), schema=schema)
+                await asyncio.to_thread(writer.write_batch, record_batch)
+        counts[collection] = len(rows)
+
+    if not any(counts.values()):
+        shutil.rmtree(staging)
+        return counts
+
+    with open(os.path.join(staging, MANIFEST), "w") as manifest:
+        json.dump({
+            "month": f"{month:%Y-%m}",
+            "archived_at": datetime.utcnow().isoformat(),
+            "compression": settings.ARCHIVE_COMPRESSION,
+            "counts": counts
+        }, manifest)
+    os.rename(staging, path)
+
+    # Until these deletes finish the month is counted twice; the cache is cleared after
+    await delete_archived(db, archived)
+    logger.info("Archived %s to %s: %s", f"{month:%Y-%m}", path, counts)
+    return counts
+
+async def _oldest_live_month(db) -> Optional[datetime]:
+    oldest = None
+    for collection, field in DATE_FIELDS.items():
+        document = await db[collection].find_one({}, {field: 1}, sort=[(field, 1)])
+        if document and document.get(field) and (oldest is None or document[field] < oldest):
+            oldest = document[field]
+    return month_start(oldest) if oldest else None
+
+async def archive_closed_months(db, store: ArchiveStore, hot_months: int) -> List[Tuple[datetime, Dict[str, int]]]:
+    # Every month before the current one and the hot_months before it moves to disk
+    cutoff = month_start(datetime.utcnow()) - relativedelta(months=hot_months)
+    month = await _oldest_live_month(db)
+    archived = []
+    while month is not None and month < cutoff:
+        counts = await archive_month(db, store, month)
+        if any(counts.values()):
+            archived.append((month, counts))
+        month += relativedelta(months=1)
+    if archived:
+        # Reaches running workers only through the redis backend
+        await report_cache.clear()
+    return archived
+
+async def _main(command: str, hot_months: int) -> int:
+    if not settings.ARCHIVE_DIR:
+        print("ARCHIVE_DIR is not set")
+        return 1
+    if command == "list":
+        for month, path in archive_store.segments():
+            with open(os.path.join(path, MANIFEST)) as manifest:
+                print(f"{month:%Y-%m} {path} {json.load(manifest)['counts']}")
+        return 0
+
+    await mongodb.connect_to_mongodb()
+    try:
+        archived = []
+        for partition in mongodb.partition_names():
+            months = await archive_closed_months(mongodb.get_partition_db(partition), archive_store, hot_months)
+            for month, counts in months:
+                print(f"{partition} {month:%Y-%m} {counts}")
+            archived += months
+        print(f"Archived {len(archived)} months")
+        return 0
+    finally:
+        await mongodb.close_mongodb_connection()
+
+if __name__ == "__main__":
+    # Run from one place only (e.g. cron); concurrent runs would archive the same rows twice
+    parser = argparse.ArgumentParser(description="Move closed months of ledgers and rollups to ARCHIVE_DIR")
+    parser.add_argument("command", choices=["run", "list"])
+    parser.add_argument("--hot-months", type=int, default=settings.ARCHIVE_HOT_MONTHS)
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.command, args.hot_months)))
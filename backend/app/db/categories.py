@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional
+from bson import json_util
+from pymongo.errors import PyMongoError
+from app.core.config import settings
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_COLLECTION = "waste_categories"
+PRICE_TOLERANCE = 1e-6
+
+class RejectedSale(Exception):
+    pass
+
+class CategoryCatalog:
+    # Every waste category keyed by name, read once per process and reloaded after a
+    # change. version counts the reloads that changed something; etag is a digest of
+    # the contents, so every worker holding the same categories agrees on it
+    def __init__(self):
+        self.categories: Dict[str, dict] = {}
+        self.rows: List[dict] = []
+        self.version = 0
+        self.etag: Optional[str] = None
+
+    async def load(self, db) -> bool:
+        rows = await db[CATEGORY_COLLECTION].find().sort("name", 1).to_list(length=None)
+        etag = f'"{hashlib.sha1(json_util.dumps(rows).encode()).hexdigest()}"'
+        if etag == self.etag:
+            return False
+        self.rows = rows
+        self.categories = {row["name"]: row for row in rows}
+        self.etag = etag
+        self.version += 1
+        return True
+
+    async def ensure_loaded(self, db) -> None:
+        if self.etag is None:
+            await self.load(db)
+
+    def get(self, name: str) -> Optional[dict]:
+        return self.categories.get(name)
+
+    def clear(self) -> None:
+        # The next read loads again; version keeps counting so stale encodings are not reused
+        self.categories, self.rows, self.etag = {}, [], None
+
+category_catalog = CategoryCatalog()
+
+async def sale_unit_price(category: str, unit_price: float) -> float:
+    # SALE_PRICE_POLICY: "trust" keeps the client's price; "category" requires a known
+    # category; "price" also requires the catalog price; "catalog" charges the catalog price
+    policy = settings.SALE_PRICE_POLICY
+    if policy == "trust":
+        return unit_price
+    await category_catalog.ensure_loaded(mongodb.get_db())
+    entry = category_catalog.get(category)
+    if entry is None:
+        raise RejectedSale(f"Unknown waste category {category!r}")
+    catalog_price = entry.get("unit_price", 0.0)
+    if policy == "catalog":
+        return catalog_price
+    if policy == "price" and abs(unit_price - catalog_price) > PRICE_TOLERANCE:
+        raise RejectedSale(f"Unit price for {category} is {catalog_price}, not {unit_price}")
+    return unit_price
+
+async def refresh_category_catalog() -> None:
+    # Picks up categories written by other workers
+    while True:
+        await asyncio.sleep(settings.CATEGORY_REFRESH_SECONDS)
+        try:
+            await category_catalog.load(mongodb.get_db())
+        except PyMongoError as exc:
+            logger.error("Could not refresh the category catalog: %s", exc)
+
+async def watch_category_changes() -> None:
+    # Reload as soon as any worker changes a category
+    try:
+        async with mongodb.get_db()[CATEGORY_COLLECTION].watch() as stream:
+            async for _ in stream:
+                await category_catalog.load(mongodb.get_db())
+    except PyMongoError as exc:
+        logger.warning("Category catalog change stream stopped: %s", exc)
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from pymongo import ASCENDING, HASHED, IndexModel
+from pymongo.errors import OperationFailure
+from app.db.mongodb import DEFAULT_PARTITION, mongodb
+from app.db.inventory import INVENTORY_COLLECTION, INVENTORY_KEY
+from app.db.rollups import MONTHLY_ROLLUP_COLLECTION, MONTHLY_ROLLUP_KEY, ROLLUP_COLLECTION, ROLLUP_KEY
+from app.db.sync import SYNC_KEYS
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("mrf_id", ASCENDING)]),
+    ],
+    # Trailing _id keys let keyset pagination walk the index without an in-memory sort
+    "waste_intake": [
+        IndexModel([("mrf_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("mrf_id", ASCENDING)] + [(key, ASCENDING) for key in SYNC_KEYS]),
+    ],
+    "sorted_waste": [
+        IndexModel([("intake_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("mrf_id", ASCENDING), ("category", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("mrf_id", ASCENDING)] + [(key, ASCENDING) for key in SYNC_KEYS]),
+    ],
+    "waste_sales": [
+        IndexModel([("mrf_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("mrf_id", ASCENDING), ("category", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("mrf_id", ASCENDING)] + [(key, ASCENDING) for key in SYNC_KEYS]),
+    ],
+    "waste_categories": [
+        IndexModel([("name", ASCENDING)], unique=True),
+        IndexModel([(key, ASCENDING) for key in SYNC_KEYS]),
+    ],
+    ROLLUP_COLLECTION: [
+        IndexModel([(field, ASCENDING) for field in ROLLUP_KEY], unique=True),
+        IndexModel([("day", ASCENDING)]),
+    ],
+    MONTHLY_ROLLUP_COLLECTION: [
+        IndexModel([(field, ASCENDING) for field in MONTHLY_ROLLUP_KEY], unique=True),
+        IndexModel([("month", ASCENDING)]),
+    ],
+    INVENTORY_COLLECTION: [
+        IndexModel([(field, ASCENDING) for field in INVENTORY_KEY], unique=True),
+        IndexModel([("mrf_id", ASCENDING)] + [(key, ASCENDING) for key in SYNC_KEYS]),
+    ],
+}
+
+# Shard keys for running a partition on a sharded cluster (python -m app.db.indexes shard).
+# The ledgers hash mrf_id, spreading MRFs over the shards while each MRF's queries still
+# target one; collections upserted through a unique key are sharded on that key, since a
+# unique index has to start with the shard key
+SHARD_KEYS: Dict[str, list] = {
+    "waste_intake": [("mrf_id", HASHED), ("_id", ASCENDING)],
+    "sorted_waste": [("mrf_id", HASHED), ("_id", ASCENDING)],
+    "waste_sales": [("mrf_id", HASHED), ("_id", ASCENDING)],
+    ROLLUP_COLLECTION: [(field, ASCENDING) for field in ROLLUP_KEY],
+    MONTHLY_ROLLUP_COLLECTION: [(field, ASCENDING) for field in MONTHLY_ROLLUP_KEY],
+    INVENTORY_COLLECTION: [(field, ASCENDING) for field in INVENTORY_KEY],
+}
+
+_SAMPLE_DATE = datetime(2024, 1, 1)
+_SAMPLE_RANGE = {"$gte": _SAMPLE_DATE, "$lte": datetime(2024, 1, 31)}
+
+# One entry per query shape the endpoints issue, as explain-able commands
+QUERY_SHAPES: Dict[str, dict] = {
+    "auth.login": {"find": "users", "filter": {"email": "user@example.com"}},
+    "users.read_users": {"find": "users", "filter": {"mrf_id": "mrf"}},
+    "waste.get_waste_intakes": {"find": "waste_intake", "filter": {"mrf_id": "mrf", "date": _SAMPLE_RANGE}},
+    "waste.get_sorted_waste": {"find": "sorted_waste", "filter": {"intake_id": "intake"}},
+    "sales.get_sales": {
+        "find": "waste_sales",
+        "filter": {"mrf_id": "mrf", "date": _SAMPLE_RANGE, "category": "pet"},
+    },
+    "sales.get_sales_summary": {
+        "aggregate": "waste_sales",
+        "pipeline": [
+            {"$match": {"mrf_id": "mrf", "date": _SAMPLE_RANGE}},
+            {"$group": {"_id": "$category", "total_weight": {"$sum": "$weight"}}},
+        ],
+        "cursor": {},
+    },
+    "inventory.get_inventory": {"find": INVENTORY_COLLECTION, "filter": {"mrf_id": "mrf", "category": "pet"}},
+    "sync.get_changes": {
+        "find": "waste_sales",
+        "filter": {"mrf_id": "mrf", "updated_at": {"$gt": _SAMPLE_DATE, "$lte": datetime(2024, 1, 31)}},
+        "sort": {"updated_at": 1, "_id": 1},
+    },
+    "reports.get_daily_report": {"find": ROLLUP_COLLECTION, "filter": {"mrf_id": "mrf", "day": _SAMPLE_DATE}},
+    "reports.get_monthly_report": {"find": ROLLUP_COLLECTION, "filter": {"mrf_id": "mrf", "day": _SAMPLE_RANGE}},
+    "reports.get_panchayat_report": {
+        "aggregate": MONTHLY_ROLLUP_COLLECTION,
+        "pipeline": [
+            {"$match": {"month": _SAMPLE_RANGE}},
+            {"$group": {"_id": {"mrf_id": "$mrf_id", "category": "$category"}, "intake_weight": {"$sum": "$intake_weight"}}},
+        ],
+        "cursor": {},
+    },
+    "reports.get_panchayat_report.edge_days": {
+        "aggregate": ROLLUP_COLLECTION,
+        "pipeline": [
+            {"$match": {"$or": [{"day": _SAMPLE_RANGE}, {"day": _SAMPLE_RANGE}]}},
+            {"$group": {"_id": {"mrf_id": "$mrf_id", "category": "$category"}, "intake_weight": {"$sum": "$intake_weight"}}},
+        ],
+        "cursor": {},
+    },
+    "reports.get_reconciliation_report": {
+        "aggregate": "waste_intake",
+        "pipeline": [
+            {"$match": {"mrf_id": {"$in": ["mrf"]}, "date": _SAMPLE_RANGE}},
+            {"$addFields": {"intake_key": {"$toString": "$_id"}}},
+            {"$lookup": {"from": "sorted_waste", "localField": "intake_key", "foreignField": "intake_id", "as": "sorted"}},
+        ],
+        "cursor": {},
+    },
+    "reports.get_timeseries_report": {
+        "aggregate": "waste_sales",
+        "pipeline": [
+            {"$match": {"mrf_id": {"$in": ["mrf"]}, "date": _SAMPLE_RANGE, "category": {"$in": ["pet"]}}},
+            {"$group": {"_id": {"$dateTrunc": {"date": "$date", "unit": "hour"}}, "sales_weight": {"$sum": "$weight"}}},
+        ],
+        "cursor": {},
+    },
+}
+
+async def ensure_indexes(db, collections: Optional[Iterable[str]] = None) -> None:
+    # create_indexes is a no-op for indexes that already exist. A unique index that cannot
+    # be built (existing duplicates, say) is fatal: writes rely on it to reject duplicates
+    for collection in collections or INDEXES:
+        for index in INDEXES[collection]:
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as exc:
+                logger.error("Could not ensure index %s on %s: %s", index.document["name"], collection, exc)
+                if index.document.get("unique"):
+                    raise
+
+async def shard_collections(db) -> None:
+    # Needs mongos; collections that are already sharded on the same key are left alone
+    admin = db.client.admin
+    try:
+        await admin.command("enableSharding", db.name)
+    except OperationFailure as exc:
+        logger.error("Could not enable sharding on %s: %s", db.name, exc)
+        return
+    for collection, key in SHARD_KEYS.items():
+        try:
+            # Non-empty collections need an index supporting the shard key first
+            await db[collection].create_index(key)
+            await admin.command("shardCollection", f"{db.name}.{collection}", key=dict(key))
+        except OperationFailure as exc:
+            logger.error("Could not shard %s: %s", collection, exc)
+
+def _plan_stages(plan) -> Iterable[str]:
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+async def find_collection_scans(db) -> List[str]:
+    collscans = []
+    for name, command in QUERY_SHAPES.items():
+        explain = await db.command("explain", command, verbosity="queryPlanner")
+        if "COLLSCAN" in _plan_stages(explain):
+            collscans.append(name)
+    return collscans
+
+async def _main(command: str) -> int:
+    await mongodb.connect_to_mongodb()
+    try:
+        collscans = []
+        for partition in mongodb.partition_names():
+            db = mongodb.get_partition_db(partition)
+            await ensure_indexes(db)
+            if command == "shard":
+                await shard_collections(db)
+            elif command == "explain":
+                collscans += [
+                    name if partition == DEFAULT_PARTITION else f"{name}@{partition}"
+                    for name in await find_collection_scans(db)
+                ]
+        if command != "explain":
+            return 0
+        for name in collscans:
+            print(f"COLLSCAN: {name}")
+        print(f"{len(collscans)} of {len(QUERY_SHAPES) * len(mongodb.partition_names())} query shapes fall back to a collection scan")
+        return 1 if collscans else 0
+    finally:
+        await mongodb.close_mongodb_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ensure indexes, check query plans for collection scans or shard on mrf_id")
+    parser.add_argument("command", choices=["ensure", "explain", "shard"])
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.command)))
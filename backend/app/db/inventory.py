@@ -0,0 +1,209 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+from app.core.config import settings
+from app.db.mongodb import DEFAULT_PARTITION, mongodb
+from app.db.archive import archive_store
+from app.db.rollups import ROLLUP_COLLECTION, with_intake_mrf_id
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_COLLECTION = "inventory"
+INVENTORY_KEY = ("mrf_id", "category")
+INVENTORY_FIELDS = ("sorted_weight", "sales_weight", "stock_weight")
+# Weights are floats, so allow for rounding when comparing against stock
+STOCK_TOLERANCE = 1e-6
+
+class InsufficientStock(Exception):
+    def __init__(self, mrf_id: str, category: str, requested: float, available: float):
+        super().__init__(f"Only {available} of {category} in stock at {mrf_id}, {requested} requested")
+        self.mrf_id = mrf_id
+        self.category = category
+        self.requested = requested
+        self.available = available
+
+def stock_key(mrf_id: Optional[str], category: str) -> tuple:
+    return (mrf_id, category)
+
+def sorted_stock(sorted_waste: dict) -> List[Tuple[tuple, dict]]:
+    key = stock_key(sorted_waste["mrf_id"], sorted_waste["category"])
+    return [(key, {"sorted_weight": sorted_waste["weight"], "stock_weight": sorted_waste["weight"]})]
+
+def sale_stock(sale: dict, sign: int = 1) -> List[Tuple[tuple, dict]]:
+    key = stock_key(sale.get("mrf_id"), sale["category"])
+    return [(key, {"sales_weight": sign * sale["weight"], "stock_weight": -sign * sale["weight"]})]
+
+def sale_change_stock(before: dict, after: dict) -> List[Tuple[tuple, dict]]:
+    return sale_stock(before, sign=-1) + sale_stock(after)
+
+def _merge(increments: Iterable[Tuple[tuple, dict]]) -> Dict[tuple, dict]:
+    merged = {}
+    for key, counters in increments:
+        totals = merged.setdefault(key, {})
+        for field, value in counters.items():
+            totals[field] = totals.get(field, 0) + value
+    return {key: counters for key, counters in merged.items() if any(counters.values())}
+
+def _update(counters: dict) -> dict:
+    return {"$inc": counters, "$set": {"updated_at": datetime.utcnow()}}
+
+async def apply_stock(db, increments: Iterable[Tuple[tuple, dict]], enforce: Optional[bool] = None) -> None:
+    # With enforcement on, rows that would lose stock are taken one at a time with a
+    # conditional $inc; a shortfall undoes what was already taken and raises
+    if enforce is None:
+        enforce = settings.INVENTORY_ENFORCE_STOCK
+    collection = db[INVENTORY_COLLECTION]
+    merged = _merge(increments)
+
+    taken = []
+    if enforce:
+        for key, counters in merged.items():
+            needed = -counters.get("stock_weight", 0)
+            if needed <= 0:
+                continue
+            query = dict(zip(INVENTORY_KEY, key))
+            result = await collection.update_one(
+                {**query, "stock_weight": {"$gte": needed - STOCK_TOLERANCE}}, _update(counters)
+            )
+            if not result.matched_count:
+                await apply_stock(db, [(k, {f: -v for f, v in c.items()}) for k, c in taken], enforce=False)
+                current = await collection.find_one(query)
+                raise InsufficientStock(
+                    key[0], key[1], needed, current.get("stock_weight", 0) if current else 0
+                )
+            taken.append((key, counters))
+
+    taken_keys = {key for key, _ in taken}
+    updates = [
+        UpdateOne(dict(zip(INVENTORY_KEY, key)), _update(counters), upsert=True)
+        for key, counters in merged.items()
+        if key not in taken_keys
+    ]
+    if updates:
+        await collection.bulk_write(updates, ordered=False)
+
+async def take_sale_stock(db, sale: dict) -> None:
+    await apply_stock(db, sale_stock(sale))
+
+async def release_sale_stock(db, sale: dict) -> None:
+    await apply_stock(db, sale_stock(sale, sign=-1), enforce=False)
+
+async def record_sorted_stock(db, sorted_waste: dict) -> None:
+    await apply_stock(db, sorted_stock(sorted_waste), enforce=False)
+
+def raw_inventory_pipelines() -> dict:
+    # Stock per (mrf_id, category) recomputed from the raw ledgers
+    return {
+        "sorted_waste": with_intake_mrf_id() + [
+            {
+                "$group": {
+                    "_id": {"mrf_id": "$mrf_id", "category": "$category"},
+                    "sorted_weight": {"$sum": "$weight"}
+                }
+            }
+        ],
+        "waste_sales": [
+            {
+                "$group": {
+                    "_id": {"mrf_id": "$mrf_id", "category": "$category"},
+                    "sales_weight": {"$sum": "$weight"}
+                }
+            }
+        ],
+    }
+
+async def _raw_inventory(db, partition: str = DEFAULT_PARTITION) -> Dict[tuple, dict]:
+    expected = {}
+    for source, pipeline in raw_inventory_pipelines().items():
+        async for row in db[source].aggregate(pipeline):
+            key = stock_key(row["_id"]["mrf_id"], row["_id"]["category"])
+            totals = expected.setdefault(key, {"sorted_weight": 0, "sales_weight": 0})
+            totals.update({field: row[field] for field in ("sorted_weight", "sales_weight") if field in row})
+
+    # Archived months left MongoDB, but their stock did not; their rollups hold the same totals
+    if archive_store.segments():
+        archived = await asyncio.to_thread(
+            archive_store.aggregate, ROLLUP_COLLECTION, datetime.min, datetime.max, None,
+            ("mrf_id", "category"), {"sorted_weight": "sorted_weight", "sales_weight": "sales_weight"}
+        )
+        for row in archived:
+            # The archive holds every partition's MRFs
+            if row["_id"]["category"] is None or mongodb.partition_of(row["_id"]["mrf_id"]) != partition:
+                continue
+            totals = expected.setdefault(
+                stock_key(row["_id"]["mrf_id"], row["_id"]["category"]), {"sorted_weight": 0, "sales_weight": 0}
+            )
+            totals["sorted_weight"] += row["sorted_weight"]
+            totals["sales_weight"] += row["sales_weight"]
+    for totals in expected.values():
+        totals["stock_weight"] = totals["sorted_weight"] - totals["sales_weight"]
+    return expected
+
+async def rebuild_inventory(db, partition: str = DEFAULT_PARTITION) -> None:
+    await db[INVENTORY_COLLECTION].create_index(
+        [(field, ASCENDING) for field in INVENTORY_KEY], unique=True
+    )
+    await db[INVENTORY_COLLECTION].delete_many({})
+    now = datetime.utcnow()
+    updates = [
+        UpdateOne(dict(zip(INVENTORY_KEY, key)), {"$set": {**totals, "updated_at": now}}, upsert=True)
+        for key, totals in (await _raw_inventory(db, partition)).items()
+    ]
+    if updates:
+        await db[INVENTORY_COLLECTION].bulk_write(updates, ordered=False)
+
+async def verify_inventory(db, partition: str = DEFAULT_PARTITION) -> List[dict]:
+    expected = await _raw_inventory(db, partition)
+
+    mismatches = []
+    async for item in db[INVENTORY_COLLECTION].find({}, {"_id": 0}):
+        key = stock_key(item.get("mrf_id"), item.get("category"))
+        raw = expected.pop(key, {})
+        for field in INVENTORY_FIELDS:
+            if abs(item.get(field, 0) - raw.get(field, 0)) > STOCK_TOLERANCE:
+                mismatches.append({"key": key, "field": field, "inventory": item.get(field, 0), "raw": raw.get(field, 0)})
+
+    for key, raw in expected.items():
+        for field in INVENTORY_FIELDS:
+            if raw.get(field):
+                mismatches.append({"key": key, "field": field, "inventory": 0, "raw": raw[field]})
+    return mismatches
+
+async def watch_inventory_drift() -> None:
+    # Periodically compare the ledger with the raw collections and log any drift
+    while True:
+        await asyncio.sleep(settings.INVENTORY_DRIFT_CHECK_SECONDS)
+        for partition in mongodb.partition_names():
+            try:
+                mismatches = await verify_inventory(mongodb.get_partition_db(partition), partition)
+            except PyMongoError as exc:
+                logger.error("Inventory drift check failed on partition %s: %s", partition, exc)
+                continue
+            for mismatch in mismatches:
+                logger.warning("Inventory drift: %s", mismatch)
+
+async def _main(command: str) -> int:
+    await mongodb.connect_to_mongodb()
+    try:
+        mismatches = []
+        for partition in mongodb.partition_names():
+            db = mongodb.get_partition_db(partition)
+            if command == "rebuild":
+                await rebuild_inventory(db, partition)
+            mismatches += await verify_inventory(db, partition)
+        for mismatch in mismatches:
+            print(mismatch)
+        print(f"{len(mismatches)} inventory mismatches")
+        return 1 if mismatches else 0
+    finally:
+        await mongodb.close_mongodb_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or verify the inventory collection")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.command)))
@@ -1,19 +1,171 @@
+import asyncio
+import logging
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 from app.core.config import settings
+from app.core.metrics import command_metrics
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+# MONGODB_URL and MONGODB_DB_NAME; holds every MRF without a partition of its own and
+# the global collections (users, waste_categories)
+DEFAULT_PARTITION = "default"
+
+def report_read_preference():
+    mode = READ_PREFERENCES[settings.MONGODB_REPORT_READ_PREFERENCE]
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=settings.MONGODB_REPORT_MAX_STALENESS_SECONDS)
+
+def connect_client(url: str) -> AsyncIOMotorClient:
+    options = {
+        "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": settings.MONGODB_CONNECT_TIMEOUT_MS,
+    }
+    if settings.MONGODB_COMPRESSORS:
+        options["compressors"] = settings.MONGODB_COMPRESSORS
+    event_listeners = [command_metrics] if settings.METRICS_ENABLED else []
+    return AsyncIOMotorClient(
+        url,
+        event_listeners=event_listeners,
+        **{name: value for name, value in options.items() if value is not None}
+    )
 
 class MongoDB:
     client: AsyncIOMotorClient = None
     db = None
+    report_db = None
+    # Tenant partitions other than the default one: name -> (db, report_db)
+    partitions: Dict[str, tuple] = {}
+    clients: Dict[str, AsyncIOMotorClient] = {}
 
     async def connect_to_mongodb(self):
-        self.client = AsyncIOMotorClient(settings.MONGODB_URL)
+        unknown = set(settings.MONGODB_TENANT_PARTITIONS.values()) - set(settings.MONGODB_PARTITIONS) - {DEFAULT_PARTITION}
+        if unknown:
+            raise ValueError(f"MONGODB_TENANT_PARTITIONS names unknown partitions: {', '.join(sorted(unknown))}")
+
+        self.client = connect_client(settings.MONGODB_URL)
+        self.clients = {settings.MONGODB_URL: self.client}
         self.db = self.client[settings.MONGODB_DB_NAME]
+        # Same database, but aggregations for reports can be served by secondaries
+        self.report_db = self.client.get_database(
+            settings.MONGODB_DB_NAME, read_preference=report_read_preference()
+        )
+
+        self.partitions = {}
+        for name, url in settings.MONGODB_PARTITIONS.items():
+            # Partitions on the same cluster share its connection pool
+            if url not in self.clients:
+                self.clients[url] = connect_client(url)
+            client = self.clients[url]
+            db_name = client.get_default_database(settings.MONGODB_DB_NAME).name
+            self.partitions[name] = (
+                client[db_name], client.get_database(db_name, read_preference=report_read_preference())
+            )
+
+    async def warmup(self):
+        # Concurrent pings make the pools for the primary and for report reads open
+        # that many connections before traffic arrives
+        count = max(settings.MONGODB_WARMUP_CONNECTIONS, 1)
+        pings = []
+        for name in self.partition_names():
+            db, report_db = self.get_partition_db(name), self.get_partition_report_db(name)
+            pings += [db.command("ping") for _ in range(count)]
+            pings += [
+                report_db.command("ping", read_preference=report_db.read_preference)
+                for _ in range(count)
+            ]
+        try:
+            await asyncio.gather(*pings)
+        except PyMongoError as exc:
+            logger.error("MongoDB warmup failed: %s", exc)
+
+    async def ping(self) -> bool:
+        try:
+            await asyncio.gather(*(self.get_partition_db(name).command("ping") for name in self.partition_names()))
+        except PyMongoError:
+            return False
+        return True
 
     async def close_mongodb_connection(self):
-        if self.client:
-            self.client.close()
+        for client in self.clients.values() or [self.client]:
+            if client:
+                client.close()
 
     def get_db(self):
         return self.db
 
-mongodb = MongoDB() 
\ No newline at end of file
+    def get_report_db(self):
+        return self.report_db
+
+    # Tenant routing: collections keyed by mrf_id (the ledgers, rollups and inventory)
+    # are read and written through the partition their MRF is assigned to
+
+    def partition_names(self) -> List[str]:
+        return [DEFAULT_PARTITION, *self.partitions]
+
+    def partition_of(self, mrf_id: Optional[str]) -> str:
+        return settings.MONGODB_TENANT_PARTITIONS.get(mrf_id, DEFAULT_PARTITION)
+
+    def get_partition_db(self, partition: str):
+        return self.partitions[partition][0] if partition in self.partitions else self.db
+
+    def get_partition_report_db(self, partition: str):
+        return self.partitions[partition][1] if partition in self.partitions else self.report_db
+
+    def get_tenant_db(self, mrf_id: Optional[str]):
+        return self.get_partition_db(self.partition_of(mrf_id))
+
+    def get_tenant_report_db(self, mrf_id: Optional[str]):
+        return self.get_partition_report_db(self.partition_of(mrf_id))
+
+    def tenant_groups(self, mrf_ids: Optional[Iterable[str]]) -> Dict[str, Optional[List[str]]]:
+        # Partition -> the MRFs of mrf_ids assigned to it; no MRFs means all of them,
+        # so every partition is asked with no MRF filter
+        if not mrf_ids:
+            return dict.fromkeys(self.partition_names())
+        groups = {}
+        for mrf_id in mrf_ids:
+            groups.setdefault(self.partition_of(mrf_id), []).append(mrf_id)
+        return groups
+
+    async def find_tenant_document(
+        self, collection: str, query: dict, projection: Optional[dict] = None
+    ) -> Tuple[Any, Optional[dict]]:
+        # For lookups that carry no mrf_id: every partition is asked at once, and the
+        # database holding the match comes back with it (the default one if none does)
+        if not self.partitions:
+            return self.db, await self.db[collection].find_one(query, projection)
+        dbs = [self.get_partition_db(name) for name in self.partition_names()]
+        documents = await asyncio.gather(*(db[collection].find_one(query, projection) for db in dbs))
+        return next(((db, document) for db, document in zip(dbs, documents) if document), (self.db, None))
+
+    async def find_tenant_db(self, collection: str, query: dict):
+        # find_tenant_document when only the database matters; no query with one partition
+        if not self.partitions:
+            return self.db
+        db, _ = await self.find_tenant_document(collection, query, {"_id": 1})
+        return db
+
+    async def find_in_partitions(self, collection: str, query: dict, projection: Optional[dict] = None) -> List[dict]:
+        dbs = [self.get_partition_db(name) for name in self.partition_names()]
+        results = await asyncio.gather(*(
+            db[collection].find(query, projection).to_list(length=None) for db in dbs
+        ))
+        return list(chain.from_iterable(results))
+
+mongodb = MongoDB()
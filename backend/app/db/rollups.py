@@ -0,0 +1,377 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import PyMongoError
+from app.core.cache import report_cache
+from app.core.config import settings
+from app.core.events import event_broker
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "daily_rollups"
+ROLLUP_KEY = ("mrf_id", "day", "category")
+# Same counters summed per calendar month, so long-range reports read one row per
+# MRF and category for every whole month
+MONTHLY_ROLLUP_COLLECTION = "monthly_rollups"
+MONTHLY_ROLLUP_KEY = ("mrf_id", "month", "category")
+ROLLUP_FIELDS = (
+    "intake_weight",
+    "intake_count",
+    "sorted_weight",
+    "sorted_count",
+    "sales_weight",
+    "sales_amount",
+    "sales_count",
+)
+REBUILD_BATCH_SIZE = 1000
+# Rebuilds write here and are renamed over the live collection when complete
+REBUILD_SUFFIX = "_rebuild"
+
+def naive_utc(value: datetime) -> datetime:
+    # Stored dates are naive UTC; a query parameter may carry an offset
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def day_start(value: datetime) -> datetime:
+    return datetime.combine(value.date(), datetime.min.time())
+
+def month_start(value: datetime) -> datetime:
+    return day_start(value).replace(day=1)
+
+def rollup_key(mrf_id: Optional[str], date: datetime, category: Optional[str]) -> tuple:
+    # Intake is not categorised, so its counters live under category None
+    return (mrf_id, day_start(date), category)
+
+def monthly_increments(increments: Iterable[Tuple[tuple, dict]]) -> List[Tuple[tuple, dict]]:
+    return [((mrf_id, month_start(day), category), counters) for (mrf_id, day, category), counters in increments]
+
+def rollup_updates(increments: Iterable[Tuple[tuple, dict]], key_fields: tuple = ROLLUP_KEY) -> List[UpdateOne]:
+    # Merge increments that land on the same rollup row into a single upsert
+    merged = {}
+    for key, counters in increments:
+        totals = merged.setdefault(key, {})
+        for field, value in counters.items():
+            totals[field] = totals.get(field, 0) + value
+
+    return [
+        UpdateOne(dict(zip(key_fields, key)), {"$inc": counters}, upsert=True)
+        for key, counters in merged.items()
+        if any(counters.values())
+    ]
+
+async def apply_rollups(db, increments: Iterable[Tuple[tuple, dict]]) -> None:
+    increments = list(increments)
+    updates = rollup_updates(increments)
+    if updates:
+        await db[ROLLUP_COLLECTION].bulk_write(updates, ordered=False)
+        await db[MONTHLY_ROLLUP_COLLECTION].bulk_write(
+            rollup_updates(monthly_increments(increments), MONTHLY_ROLLUP_KEY), ordered=False
+        )
+
+    # Cached reports covering any touched (mrf_id, day) are now stale
+    for mrf_id, day in {key[:2] for key, _ in increments}:
+        await report_cache.invalidate(mrf_id, day)
+
+    # With a change stream the watcher publishes instead, for writes from every worker
+    if not settings.EVENTS_CHANGE_STREAM:
+        event_broker.publish(increments)
+
+def intake_increments(intake: dict) -> List[Tuple[tuple, dict]]:
+    key = rollup_key(intake["mrf_id"], intake["date"], None)
+    return [(key, {"intake_weight": intake["weight"], "intake_count": 1})]
+
+def sorted_increments(sorted_waste: dict) -> List[Tuple[tuple, dict]]:
+    key = rollup_key(sorted_waste["mrf_id"], sorted_waste["date"], sorted_waste["category"])
+    return [(key, {"sorted_weight": sorted_waste["weight"], "sorted_count": 1})]
+
+def sale_increments(sale: dict, sign: int = 1) -> List[Tuple[tuple, dict]]:
+    key = rollup_key(sale.get("mrf_id"), sale["date"], sale["category"])
+    return [(key, {
+        "sales_weight": sign * sale["weight"],
+        "sales_amount": sign * sale["total_amount"],
+        "sales_count": sign,
+    })]
+
+def sale_change_increments(before: dict, after: dict) -> List[Tuple[tuple, dict]]:
+    # Opposite increments on an unchanged key cancel out to a plain delta
+    return sale_increments(before, sign=-1) + sale_increments(after)
+
+async def record_intake(db, intake: dict) -> None:
+    await apply_rollups(db, intake_increments(intake))
+
+async def record_sorted(db, sorted_waste: dict) -> None:
+    await apply_rollups(db, sorted_increments(sorted_waste))
+
+async def record_sale(db, sale: dict) -> None:
+    await apply_rollups(db, sale_increments(sale))
+
+async def record_sale_update(db, before: dict, after: dict) -> None:
+    await apply_rollups(db, sale_change_increments(before, after))
+
+def change_increments(change: dict) -> List[Tuple[tuple, dict]]:
+    # Rollup increments for one change stream event; updates and deletes need the
+    # collection's pre-images (changeStreamPreAndPostImages) to be counted
+    collection = change["ns"]["coll"]
+    after = change.get("fullDocument")
+    before = change.get("fullDocumentBeforeChange")
+    builders = {
+        "waste_intake": intake_increments,
+        "sorted_waste": sorted_increments,
+        "waste_sales": sale_increments,
+    }
+    if change["operationType"] == "insert" and after:
+        return builders[collection](after)
+    if collection == "waste_sales" and before:
+        return sale_change_increments(before, after) if after else sale_increments(before, sign=-1)
+    return []
+
+async def watch_ledger_changes() -> None:
+    # One change stream per partition, all feeding the same broker
+    await asyncio.gather(*(
+        _watch_partition_ledgers(mongodb.get_partition_db(partition)) for partition in mongodb.partition_names()
+    ))
+
+async def _watch_partition_ledgers(db) -> None:
+    pipeline = [{
+        "$match": {
+            "ns.coll": {"$in": ["waste_intake", "sorted_waste", "waste_sales"]},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+        }
+    }]
+    resume_token = None
+    while True:
+        try:
+            async with db.watch(
+                pipeline,
+                full_document="updateLookup",
+                full_document_before_change="whenAvailable",
+                resume_after=resume_token
+            ) as stream:
+                async for change in stream:
+                    event_broker.publish(change_increments(change))
+                    resume_token = stream.resume_token
+        except PyMongoError as exc:
+            logger.error("Ledger change stream failed, reconnecting: %s", exc)
+            await asyncio.sleep(1)
+
+def _day_trunc(field: str = "$date") -> dict:
+    return {"$dateTrunc": {"date": field, "unit": "day"}}
+
+def with_intake_mrf_id() -> List[dict]:
+    # Older sorted_waste rows carry no mrf_id, so take it from their intake
+    return [
+        {
+            "$addFields": {
+                "intake_oid": {
+                    "$convert": {"input": "$intake_id", "to": "objectId", "onError": None, "onNull": None}
+                }
+            }
+        },
+        {
+            "$lookup": {
+                "from": "waste_intake",
+                "localField": "intake_oid",
+                "foreignField": "_id",
+                "as": "intake"
+            }
+        },
+        {"$addFields": {"mrf_id": {"$ifNull": ["$mrf_id", {"$first": "$intake.mrf_id"}]}}},
+    ]
+
+def raw_rollup_pipelines(match: Optional[dict] = None) -> dict:
+    # Aggregations that recompute rollup rows from the raw ledgers
+    match = match or {}
+    intake_pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {"mrf_id": "$mrf_id", "day": _day_trunc()},
+                "intake_weight": {"$sum": "$weight"},
+                "intake_count": {"$sum": 1}
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "mrf_id": "$_id.mrf_id",
+                "day": "$_id.day",
+                "category": {"$literal": None},
+                "intake_weight": 1,
+                "intake_count": 1
+            }
+        }
+    ]
+
+    sorted_pipeline = [{"$match": match}] + with_intake_mrf_id() + [
+        {
+            "$group": {
+                "_id": {
+                    "mrf_id": "$mrf_id",
+                    "day": _day_trunc(),
+                    "category": "$category"
+                },
+                "sorted_weight": {"$sum": "$weight"},
+                "sorted_count": {"$sum": 1}
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "mrf_id": "$_id.mrf_id",
+                "day": "$_id.day",
+                "category": "$_id.category",
+                "sorted_weight": 1,
+                "sorted_count": 1
+            }
+        }
+    ]
+
+    sales_pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {"mrf_id": "$mrf_id", "day": _day_trunc(), "category": "$category"},
+                "sales_weight": {"$sum": "$weight"},
+                "sales_amount": {"$sum": "$total_amount"},
+                "sales_count": {"$sum": 1}
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "mrf_id": "$_id.mrf_id",
+                "day": "$_id.day",
+                "category": "$_id.category",
+                "sales_weight": 1,
+                "sales_amount": 1,
+                "sales_count": 1
+            }
+        }
+    ]
+
+    return {
+        "waste_intake": intake_pipeline,
+        "sorted_waste": sorted_pipeline,
+        "waste_sales": sales_pipeline,
+    }
+
+async def _staging_collection(db, name: str, key: Tuple[str, ...]):
+    # An empty copy of the collection's indexes, so reports keep reading complete rows
+    # until the rebuilt ones are renamed over them
+    staging = db[name + REBUILD_SUFFIX]
+    await staging.drop()
+    unique = IndexModel([(field, ASCENDING) for field in key], unique=True)
+    indexes = {unique.document["name"]: unique}
+    for index_name, info in (await db[name].index_information()).items():
+        if index_name != "_id_":
+            indexes.setdefault(index_name, IndexModel(info["key"], name=index_name, unique=info.get("unique", False)))
+    await staging.create_indexes(list(indexes.values()))
+    return staging
+
+async def rebuild_rollups(db) -> None:
+    # Run with writes stopped: an increment applied to the live collection while the
+    # rebuild reads the ledgers is discarded by the rename, or counted twice if the
+    # ledger row was read too. verify afterwards reports anything that slipped through
+    staging = await _staging_collection(db, ROLLUP_COLLECTION, ROLLUP_KEY)
+
+    # The three sources write disjoint counters, so their rows upsert into the same documents
+    for source, pipeline in raw_rollup_pipelines().items():
+        updates = []
+        async for row in db[source].aggregate(pipeline):
+            key = {field: row[field] for field in ROLLUP_KEY}
+            counters = {field: row[field] for field in ROLLUP_FIELDS if field in row}
+            updates.append(UpdateOne(key, {"$set": counters}, upsert=True))
+            if len(updates) >= REBUILD_BATCH_SIZE:
+                await staging.bulk_write(updates, ordered=False)
+                updates = []
+        if updates:
+            await staging.bulk_write(updates, ordered=False)
+    await staging.rename(ROLLUP_COLLECTION, dropTarget=True)
+    await rebuild_monthly_rollups(db)
+    # Reaches running workers only through the redis backend
+    await report_cache.clear()
+
+async def _monthly_from_daily(db) -> dict:
+    totals = {}
+    async for row in db[ROLLUP_COLLECTION].find({}, {"_id": 0}):
+        key = (row.get("mrf_id"), month_start(row["day"]), row.get("category"))
+        counters = totals.setdefault(key, {})
+        for field in ROLLUP_FIELDS:
+            counters[field] = counters.get(field, 0) + row.get(field, 0)
+    return totals
+
+async def rebuild_monthly_rollups(db) -> None:
+    staging = await _staging_collection(db, MONTHLY_ROLLUP_COLLECTION, MONTHLY_ROLLUP_KEY)
+    rows = [
+        {**dict(zip(MONTHLY_ROLLUP_KEY, key)), **counters}
+        for key, counters in (await _monthly_from_daily(db)).items()
+    ]
+    for start in range(0, len(rows), REBUILD_BATCH_SIZE):
+        await staging.insert_many(rows[start:start + REBUILD_BATCH_SIZE], ordered=False)
+    await staging.rename(MONTHLY_ROLLUP_COLLECTION, dropTarget=True)
+
+async def verify_rollups(db) -> List[dict]:
+    expected = {}
+    for source, pipeline in raw_rollup_pipelines().items():
+        async for row in db[source].aggregate(pipeline):
+            key = tuple(row[field] for field in ROLLUP_KEY)
+            expected.setdefault(key, {}).update(
+                {field: row[field] for field in ROLLUP_FIELDS if field in row}
+            )
+
+    mismatches = []
+    async for rollup in db[ROLLUP_COLLECTION].find({}, {"_id": 0}):
+        key = tuple(rollup.get(field) for field in ROLLUP_KEY)
+        raw = expected.pop(key, {})
+        for field in ROLLUP_FIELDS:
+            if abs(rollup.get(field, 0) - raw.get(field, 0)) > 1e-6:
+                mismatches.append({"key": key, "field": field, "rollup": rollup.get(field, 0), "raw": raw.get(field, 0)})
+
+    # Whatever is left exists in the raw data but has no rollup row at all
+    for key, raw in expected.items():
+        for field, value in raw.items():
+            if value:
+                mismatches.append({"key": key, "field": field, "rollup": 0, "raw": value})
+
+    # Monthly rows must add up to the daily rows of their month
+    expected = await _monthly_from_daily(db)
+    async for rollup in db[MONTHLY_ROLLUP_COLLECTION].find({}, {"_id": 0}):
+        key = tuple(rollup.get(field) for field in MONTHLY_ROLLUP_KEY)
+        daily = expected.pop(key, {})
+        for field in ROLLUP_FIELDS:
+            if abs(rollup.get(field, 0) - daily.get(field, 0)) > 1e-6:
+                mismatches.append({"key": key, "field": field, "rollup": rollup.get(field, 0), "daily": daily.get(field, 0)})
+    for key, daily in expected.items():
+        for field, value in daily.items():
+            if value:
+                mismatches.append({"key": key, "field": field, "rollup": 0, "daily": value})
+    return mismatches
+
+async def _main(command: str) -> int:
+    await mongodb.connect_to_mongodb()
+    try:
+        mismatches = []
+        for partition in mongodb.partition_names():
+            db = mongodb.get_partition_db(partition)
+            if command == "rebuild":
+                await rebuild_rollups(db)
+            mismatches += await verify_rollups(db)
+        for mismatch in mismatches:
+            print(mismatch)
+        print(f"{len(mismatches)} rollup mismatches")
+        return 1 if mismatches else 0
+    finally:
+        await mongodb.close_mongodb_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild or verify the daily_rollups and monthly_rollups collections; rebuild with writes stopped"
+    )
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.command)))
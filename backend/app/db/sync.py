@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict
+from pymongo.errors import PyMongoError
+from app.db.inventory import INVENTORY_COLLECTION
+from app.db.mongodb import mongodb
+
+logger = logging.getLogger(__name__)
+
+# Collections offered to delta sync, ordered by (updated_at, _id) so the pair is a
+# strictly increasing watermark
+SYNC_KEYS = ("updated_at", "_id")
+SYNC_COLLECTIONS = ("waste_intake", "sorted_waste", "waste_sales", INVENTORY_COLLECTION, "waste_categories")
+GLOBAL_COLLECTIONS = ("waste_categories",)
+# Rows written before updated_at existed sort first, so only a full sync picks them up
+SYNC_EPOCH = datetime(1970, 1, 1)
+
+async def backfill_updated_at(db) -> Dict[str, int]:
+    # A one-off migration for rows written before updated_at existed; new rows always
+    # carry it. Nothing indexes a missing field, so each collection is scanned in full
+    backfilled = {}
+    for collection in SYNC_COLLECTIONS:
+        try:
+            result = await db[collection].update_many(
+                {"updated_at": {"$exists": False}}, {"$set": {"updated_at": SYNC_EPOCH}}
+            )
+        except PyMongoError as exc:
+            logger.error("Could not backfill updated_at on %s: %s", collection, exc)
+            continue
+        backfilled[collection] = result.modified_count
+    return backfilled
+
+async def _main() -> int:
+    await mongodb.connect_to_mongodb()
+    try:
+        for partition in mongodb.partition_names():
+            backfilled = await backfill_updated_at(mongodb.get_partition_db(partition))
+            print(f"{partition} {backfilled}")
+        return 0
+    finally:
+        await mongodb.close_mongodb_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Give rows written before /sync existed an updated_at")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+    raise SystemExit(asyncio.run(_main()))
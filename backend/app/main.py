@@ -1,8 +1,17 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.metrics import MetricsMiddleware, metrics
+from app.core.security import PasswordHasherBusy, shutdown_hash_executor
 from app.api.v1.api import api_router
+from app.api.deps import load_token_revocations, refresh_token_revocations, watch_user_changes
 from app.db.mongodb import mongodb
+from app.db.categories import RejectedSale, category_catalog, refresh_category_catalog, watch_category_changes
+from app.db.indexes import ensure_indexes
+from app.db.inventory import InsufficientStock, watch_inventory_drift
+from app.db.rollups import watch_ledger_changes
 
 app = FastAPI(
     title="MRF DigiTrack API",
@@ -19,17 +28,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many concurrent authentication requests, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(RejectedSale)
+async def rejected_sale_handler(request: Request, exc: RejectedSale):
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content={"detail": str(exc)},
+    )
+
+@app.exception_handler(InsufficientStock)
+async def insufficient_stock_handler(request: Request, exc: InsufficientStock):
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"detail": str(exc), "available": exc.available},
+    )
+
 # Include API router
 app.include_router(api_router, prefix="/api/v1")
 
+background_tasks = set()
+
 @app.on_event("startup")
 async def startup_db_client():
     await mongodb.connect_to_mongodb()
+    await mongodb.warmup()
+    for partition in mongodb.partition_names():
+        await ensure_indexes(mongodb.get_partition_db(partition))
+    await load_token_revocations()
+    await category_catalog.load(mongodb.get_db())
+    background_tasks.add(asyncio.create_task(refresh_token_revocations()))
+    if settings.USER_CACHE_CHANGE_STREAM:
+        background_tasks.add(asyncio.create_task(watch_user_changes()))
+    if settings.CATEGORY_REFRESH_SECONDS > 0:
+        background_tasks.add(asyncio.create_task(refresh_category_catalog()))
+    if settings.CATEGORY_CHANGE_STREAM:
+        background_tasks.add(asyncio.create_task(watch_category_changes()))
+    if settings.INVENTORY_DRIFT_CHECK_SECONDS > 0:
+        background_tasks.add(asyncio.create_task(watch_inventory_drift()))
+    if settings.EVENTS_CHANGE_STREAM:
+        background_tasks.add(asyncio.create_task(watch_ledger_changes()))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
+    shutdown_hash_executor()
     await mongodb.close_mongodb_connection()
 
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    if not await mongodb.ping():
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "unavailable", "database": False},
+        )
+    return {"status": "ok", "database": True}
+
 @app.get("/")
 async def root():
     return {
@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional, Annotated
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
+from pydantic import BaseModel, BeforeValidator, EmailStr, Field, ConfigDict
 from bson import ObjectId
 
 class PyObjectId(ObjectId):
@@ -50,11 +50,18 @@ class UserInDB(UserBase):
     )
 
 class User(UserBase):
-    id: str = Field(..., alias="_id")
+    id: Annotated[str, BeforeValidator(str)] = Field(..., alias="_id")
     created_at: datetime
     updated_at: datetime
 
     model_config = ConfigDict(
         populate_by_name=True,
         json_encoders={ObjectId: str}
-    ) 
\ No newline at end of file
+    ) 
+
+class UserClaims(BaseModel):
+    # Identity carried in the access token, enough to authorize without a user lookup
+    id: str
+    role: str
+    mrf_id: Optional[str] = None
+    is_active: bool = True
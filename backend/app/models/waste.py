@@ -1,13 +1,13 @@
 from datetime import datetime
 from typing import Optional, List
-from pydantic import BaseModel, Field
-from bson import ObjectId
+from pydantic import BaseModel, ConfigDict, Field
 from app.models.user import PyObjectId
 
 class WasteCategory(BaseModel):
     name: str
     description: Optional[str] = None
     unit_price: float = 0.0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class WasteIntake(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
@@ -20,14 +20,15 @@ class WasteIntake(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
-    class Config:
-        allow_population_by_field_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True
+    )
 
 class SortedWaste(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     intake_id: str
+    mrf_id: Optional[str] = None
     category: str
     weight: float
     operator_id: str
@@ -36,13 +37,15 @@ class SortedWaste(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
-    class Config:
-        allow_population_by_field_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True
+    )
 
 class WasteSale(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    # Sales recorded before MRFs were tracked have none; new sales must name one
+    mrf_id: Optional[str] = None
     category: str
     weight: float
     unit_price: float
@@ -55,7 +58,15 @@ class WasteSale(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
-    class Config:
-        allow_population_by_field_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str} 
\ No newline at end of file
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True
+    )
+
+class InventoryItem(BaseModel):
+    mrf_id: str
+    category: str
+    stock_weight: float = 0.0
+    sorted_weight: float = 0.0
+    sales_weight: float = 0.0
+    updated_at: Optional[datetime] = None
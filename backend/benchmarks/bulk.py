@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import time
+from datetime import datetime
+
+from benchmarks.run import _git_commit, _intake, _sale, _sorted, connect, login, reset_state
+
+# Records/sec writing the same number of records through the single-record endpoints,
+# one request per record, and through the bulk endpoints in batches
+
+PATHS = {
+    "waste_intake": ("/waste/intake", "/waste/intake/bulk", _intake),
+    "sorted_waste": ("/waste/sort", "/waste/sort/bulk", _sorted),
+    "waste_sales": ("/sales/", "/sales/bulk", _sale),
+}
+
+async def post_all(client, path: str, bodies: list, headers: dict, concurrency: int) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def one(body) -> None:
+        nonlocal failed
+        async with semaphore:
+            response = await client.post("/api/v1" + path, json=body, headers=headers)
+            if response.status_code >= 400:
+                failed += 1
+
+    await asyncio.gather(*(one(body) for body in bodies))
+    return failed
+
+async def _main(args) -> dict:
+    import httpx
+    from app.main import app
+    from benchmarks import datagen
+
+    db = await connect(args.backend)
+    await reset_state()
+    seeded = await datagen.seed(db, args.mrfs, args.days, intakes_per_day=args.intakes_per_day, seed=args.seed)
+    ctx = {
+        "start": seeded["start"],
+        "mrf_id": seeded["mrf_ids"][0],
+        "intake_id": str(seeded["sample"]["waste_intake"]["_id"]),
+    }
+
+    results = []
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        headers = (await login(client))["operator"]
+        for collection in args.collections:
+            single_path, bulk_path, record = PATHS[collection]
+            records = [record(ctx, i) for i in range(args.records)]
+            batches = [records[start:start + args.batch_size] for start in range(0, len(records), args.batch_size)]
+            for name, path, bodies in (("single", single_path, records), ("bulk", bulk_path, batches)):
+                started = time.perf_counter()
+                failed = await post_all(client, path, bodies, headers, args.concurrency)
+                wall_time = time.perf_counter() - started
+                records_per_second = len(records) / wall_time if wall_time else 0.0
+                print(
+                    f"  {collection:<14} {name:<7} {len(records)} records in {len(bodies)} requests"
+                    f"  {wall_time:>7.2f}s  {records_per_second:>9.0f} records/s  failed requests {failed}"
+                )
+                results.append({
+                    "collection": collection, "path": name, "records": len(records), "requests": len(bodies),
+                    "failed_requests": failed, "wall_time_s": wall_time, "records_per_second": records_per_second
+                })
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": args.backend,
+        "records": args.records,
+        "batch_size": args.batch_size,
+        "concurrency": args.concurrency,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare records/sec of the single-record and bulk write endpoints")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--collections", nargs="+", choices=list(PATHS), default=list(PATHS))
+    parser.add_argument("--records", type=int, default=2000, help="records written through each path")
+    parser.add_argument("--batch-size", type=int, default=100, help="records per bulk request")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mrfs", type=int, default=2)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--intakes-per-day", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db-name", default="mrf_benchmark")
+    parser.add_argument("--output", default="bulk-results.json")
+    args = parser.parse_args()
+
+    # Settings are read on import, so these go in before anything from app is loaded
+    os.environ["MONGODB_DB_NAME"] = args.db_name
+    os.environ["REPORT_CACHE_BACKEND"] = "none"
+    os.environ.setdefault("METRICS_ENABLED", "false")
+
+    report = asyncio.run(_main(args))
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
@@ -0,0 +1,46 @@
+import argparse
+import json
+import sys
+
+def _index(report: dict) -> dict:
+    results = {(result["size"], result["route"]): result for result in report["results"]}
+    results.update({("micro", name): result for name, result in report.get("micro", {}).items()})
+    return results
+
+def compare(baseline: dict, current: dict, threshold: float, metric: str) -> list:
+    # A route regresses when its latency grows, or its throughput drops, by more than threshold
+    regressions = []
+    before = _index(baseline)
+    for key, result in sorted(_index(current).items()):
+        previous = before.get(key)
+        if previous is None or not previous[metric]:
+            continue
+        latency_change = result[metric] / previous[metric] - 1
+        throughput_change = 0.0
+        if previous.get("throughput_rps") and key[0] != "micro":
+            throughput_change = 1 - result["throughput_rps"] / previous["throughput_rps"]
+        if latency_change > threshold or throughput_change > threshold:
+            regressions.append((key, previous, result, latency_change))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    args = parser.parse_args()
+
+    with open(args.baseline) as baseline, open(args.current) as current:
+        baseline, current = json.load(baseline), json.load(current)
+    if baseline.get("backend") != current.get("backend"):
+        print(f"Warning: comparing {baseline.get('backend')} results with {current.get('backend')} results")
+
+    regressions = compare(baseline, current, args.threshold, args.metric)
+    print(f"{baseline.get('commit') or 'baseline'} -> {current.get('commit') or 'current'}: {len(regressions)} regressions")
+    for (size, route), previous, result, change in regressions:
+        print(
+            f"  {size:<8} {route:<42} {args.metric} {previous[args.metric]:.1f} -> {result[args.metric]:.1f}ms"
+            f" ({change:+.0%}), {previous.get('throughput_rps', 0):.1f} -> {result.get('throughput_rps', 0):.1f} req/s"
+        )
+    sys.exit(1 if regressions else 0)
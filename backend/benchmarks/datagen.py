@@ -0,0 +1,148 @@
+import random
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Dict, List
+from bson import ObjectId
+from app.core.security import get_password_hash
+from app.db.inventory import apply_stock, sale_stock, sorted_stock
+from app.db.rollups import (
+    MONTHLY_ROLLUP_COLLECTION,
+    MONTHLY_ROLLUP_KEY,
+    ROLLUP_COLLECTION,
+    intake_increments,
+    monthly_increments,
+    rollup_updates,
+    sale_increments,
+    sorted_increments,
+)
+
+CATEGORIES = ["pet", "hdpe", "paper", "cardboard", "glass", "metal", "multilayer", "e-waste"]
+UNIT_PRICES = {"pet": 18.0, "hdpe": 22.0, "paper": 8.0, "cardboard": 6.0, "glass": 2.0, "metal": 30.0, "multilayer": 1.5, "e-waste": 45.0}
+PASSWORD = "benchmark"
+INSERT_BATCH_SIZE = 5000
+
+def mrf_ids(mrfs: int) -> List[str]:
+    return [f"mrf-{index:03d}" for index in range(mrfs)]
+
+def ledger_documents(mrfs: int, days: int, intakes_per_day: int, start: datetime, rnd: random.Random):
+    # Every intake is partly sorted; roughly half of what is sorted gets sold
+    for day in range(days):
+        date = start + timedelta(days=day)
+        for mrf_id in mrf_ids(mrfs):
+            for _ in range(intakes_per_day):
+                at = date + timedelta(minutes=rnd.randrange(6 * 60, 20 * 60))
+                intake = {
+                    "_id": ObjectId(),
+                    "mrf_id": mrf_id,
+                    "vehicle_id": f"KL-{rnd.randrange(1, 99):02d}-{rnd.randrange(1000, 9999)}",
+                    "weight": round(rnd.uniform(200, 2000), 1),
+                    "date": at,
+                    "operator_id": "benchmark",
+                    "notes": None,
+                    "created_at": at,
+                    "updated_at": at,
+                }
+                yield "waste_intake", intake
+
+                remaining = intake["weight"] * rnd.uniform(0.6, 0.95)
+                for category in rnd.sample(CATEGORIES, rnd.randrange(2, 5)):
+                    weight = round(remaining * rnd.uniform(0.2, 0.5), 1)
+                    remaining -= weight
+                    sorted_at = at + timedelta(hours=rnd.randrange(1, 4))
+                    yield "sorted_waste", {
+                        "_id": ObjectId(),
+                        "intake_id": str(intake["_id"]),
+                        "mrf_id": mrf_id,
+                        "category": category,
+                        "weight": weight,
+                        "operator_id": "benchmark",
+                        "date": sorted_at,
+                        "notes": None,
+                        "created_at": sorted_at,
+                        "updated_at": sorted_at,
+                    }
+                    if rnd.random() < 0.5:
+                        sold = round(weight * rnd.uniform(0.5, 1.0), 1)
+                        yield "waste_sales", {
+                            "_id": ObjectId(),
+                            "mrf_id": mrf_id,
+                            "category": category,
+                            "weight": sold,
+                            "unit_price": UNIT_PRICES[category],
+                            "total_amount": sold * UNIT_PRICES[category],
+                            "buyer_name": f"Buyer {rnd.randrange(1, 40)}",
+                            "buyer_contact": None,
+                            "date": sorted_at + timedelta(hours=1),
+                            "operator_id": "benchmark",
+                            "notes": None,
+                            "created_at": sorted_at,
+                            "updated_at": sorted_at,
+                        }
+
+async def seed(db, mrfs: int, days: int, intakes_per_day: int = 5, seed: int = 42, start: datetime = None) -> Dict:
+    # Writes the ledgers plus the rollups and inventory derived from them, the way the
+    # write endpoints would have left them
+    rnd = random.Random(seed)
+    start = start or datetime(2024, 1, 1)
+    counts = {"waste_intake": 0, "sorted_waste": 0, "waste_sales": 0}
+    increments = {"waste_intake": intake_increments, "sorted_waste": sorted_increments, "waste_sales": sale_increments}
+    stock = {"sorted_waste": sorted_stock, "waste_sales": sale_stock}
+    sample = {}
+
+    batches = {collection: [] for collection in counts}
+
+    async def flush(collection: str) -> None:
+        documents = batches[collection]
+        if not documents:
+            return
+        await db[collection].insert_many(documents, ordered=False)
+        changes = list(chain.from_iterable(increments[collection](document) for document in documents))
+        updates = rollup_updates(changes)
+        if updates:
+            await db[ROLLUP_COLLECTION].bulk_write(updates, ordered=False)
+            await db[MONTHLY_ROLLUP_COLLECTION].bulk_write(
+                rollup_updates(monthly_increments(changes), MONTHLY_ROLLUP_KEY), ordered=False
+            )
+        if collection in stock:
+            await apply_stock(db, chain.from_iterable(stock[collection](document) for document in documents), enforce=False)
+        counts[collection] += len(documents)
+        batches[collection] = []
+
+    for collection, document in ledger_documents(mrfs, days, intakes_per_day, start, rnd):
+        sample.setdefault(collection, document)
+        batches[collection].append(document)
+        if len(batches[collection]) >= INSERT_BATCH_SIZE:
+            await flush(collection)
+    for collection in batches:
+        await flush(collection)
+
+    await db["waste_categories"].insert_many([
+        {"name": category, "description": None, "unit_price": price} for category, price in UNIT_PRICES.items()
+    ])
+
+    hashed_password = get_password_hash(PASSWORD)
+    users = {}
+    for role in ("manager", "operator", "panchayat"):
+        now = datetime.utcnow()
+        user = {
+            "_id": ObjectId(),
+            "email": f"{role}@benchmark.example.com",
+            "full_name": f"Benchmark {role}",
+            "role": role,
+            "mrf_id": mrf_ids(mrfs)[0],
+            "is_active": True,
+            "hashed_password": hashed_password,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await db["users"].insert_one(user)
+        users[role] = user
+
+    return {
+        "counts": counts,
+        "mrf_ids": mrf_ids(mrfs),
+        "start": start,
+        "end": start + timedelta(days=days),
+        "sample": sample,
+        "users": users,
+    }
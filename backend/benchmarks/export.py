@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+from typing import List
+
+from benchmarks.run import _git_commit, connect, login, reset_state, summarize
+
+# Rows/sec pulling one MRF's whole ledger through the JSON list endpoints the analysts
+# used before, and through each /export format
+
+LIST_PATHS = {"waste_intake": "/waste/intake", "waste_sales": "/sales/"}
+
+def variants(collection: str) -> List[tuple]:
+    found = []
+    if collection in LIST_PATHS:
+        found += [
+            ("json_list", LIST_PATHS[collection], {}),
+            ("ndjson_stream", LIST_PATHS[collection], {"stream": "true"}),
+        ]
+    return found + [(f"export_{name}", f"/export/{collection}", {"format": name}) for name in ("csv", "arrow", "parquet")]
+
+async def pull(client, path: str, params: dict, headers: dict) -> int:
+    size = 0
+    async with client.stream("GET", "/api/v1" + path, params=params, headers=headers) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_raw():
+            size += len(chunk)
+    return size
+
+async def _main(args) -> dict:
+    import httpx
+    from app.main import app
+    from benchmarks import datagen
+
+    db = await connect(args.backend)
+    await reset_state()
+    seeded = await datagen.seed(db, args.mrfs, args.days, intakes_per_day=args.intakes_per_day, seed=args.seed)
+    mrf_id = seeded["mrf_ids"][0]
+
+    results = []
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        headers = (await login(client))["operator"]
+        for collection in args.collections:
+            rows = await db[collection].count_documents({"mrf_id": mrf_id})
+            for name, path, params in variants(collection):
+                params = {"mrf_id": mrf_id, **params}
+                latencies = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    size = await pull(client, path, params, headers)
+                    latencies.append(time.perf_counter() - started)
+                peak = None
+                if args.trace_memory:
+                    # A separate pass, since tracing slows everything down
+                    tracemalloc.start()
+                    await pull(client, path, params, headers)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                summary = summarize(latencies, sum(latencies), 0, {})
+                summary.pop("throughput_rps")
+                rows_per_second = rows / (summary["p50_ms"] / 1000) if summary["p50_ms"] else 0.0
+                print(
+                    f"  {collection:<14} {name:<16} {rows} rows  p50 {summary['p50_ms']:>9.1f}ms  {rows_per_second:>10.0f} rows/s"
+                    f"  {size / 1e6:>7.1f} MB" + (f"  peak {peak / 1e6:.1f} MB" if peak is not None else "")
+                )
+                results.append({
+                    "collection": collection, "variant": name, "rows": rows, "bytes": size,
+                    "rows_per_second": rows_per_second, "peak_memory_bytes": peak, **summary
+                })
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": args.backend,
+        "mrfs": args.mrfs,
+        "days": args.days,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare rows/sec of the JSON list endpoints and /export")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--collections", nargs="+", choices=["waste_intake", "sorted_waste", "waste_sales"],
+                        default=["waste_intake", "sorted_waste", "waste_sales"])
+    parser.add_argument("--mrfs", type=int, default=2)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--intakes-per-day", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--trace-memory", action="store_true", help="also report peak Python allocations per variant")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db-name", default="mrf_benchmark")
+    parser.add_argument("--output", default="export-results.json")
+    args = parser.parse_args()
+
+    # Settings are read on import, so these go in before anything from app is loaded
+    os.environ["MONGODB_DB_NAME"] = args.db_name
+    os.environ.setdefault("METRICS_ENABLED", "false")
+
+    report = asyncio.run(_main(args))
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
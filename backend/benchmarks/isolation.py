@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+from datetime import datetime
+from typing import List
+
+from benchmarks.run import _day, _git_commit, _intake, _range, connect, login, measure, reset_state, route, send
+
+# Tenant latency isolation: a quiet MRF is measured alone, then again while a noisy MRF
+# hammers heavy routes, once with both in the default database ("shared") and once with
+# the noisy MRF routed to a partition of its own ("partitioned")
+
+QUIET_ROUTES = [
+    route("reports.get_daily_report", "GET", "/reports/daily", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "date": _day(ctx, i % ctx["days"])}),
+    route("waste.get_waste_intakes.page", "GET", "/waste/intake", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "limit": 100}),
+    route("sales.get_sales_summary", "GET", "/sales/summary", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], **_range(ctx)}),
+    route("inventory.get_inventory", "GET", "/inventory/", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"]}),
+]
+
+NOISY_ROUTES = [
+    route("sales.get_sales.range", "GET", "/sales/", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], **_range(ctx)}),
+    route("export.export_collection.csv", "GET", "/export/waste_sales", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "format": "csv"}),
+    route("sales.get_sales_summary", "GET", "/sales/summary", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], **_range(ctx)}),
+    route("waste.create_waste_intakes_bulk", "POST", "/waste/intake/bulk", role="operator",
+          json=lambda ctx, i: [_intake(ctx, i * 100 + n) for n in range(100)]),
+]
+
+async def partition_db(args):
+    from app.db.indexes import ensure_indexes
+    from app.db.mongodb import connect_client
+
+    name = f"{args.db_name}_noisy"
+    if args.backend == "mongomock":
+        from mongomock_motor import AsyncMongoMockClient
+
+        return AsyncMongoMockClient()[name]
+    client = connect_client(args.noisy_url or os.environ.get("MONGODB_URL", "mongodb://localhost:27017"))
+    await client.drop_database(name)
+    await ensure_indexes(client[name])
+    return client[name]
+
+async def move_tenant(source, target, mrf_id: str) -> int:
+    # What an operator would do when giving an MRF its own partition
+    from app.db.inventory import INVENTORY_COLLECTION
+    from app.db.rollups import MONTHLY_ROLLUP_COLLECTION, ROLLUP_COLLECTION
+    from benchmarks.datagen import INSERT_BATCH_SIZE
+
+    moved = 0
+    for collection in ("waste_intake", "sorted_waste", "waste_sales", ROLLUP_COLLECTION, MONTHLY_ROLLUP_COLLECTION, INVENTORY_COLLECTION):
+        batch = []
+        async for document in source[collection].find({"mrf_id": mrf_id}):
+            batch.append(document)
+            if len(batch) >= INSERT_BATCH_SIZE:
+                await target[collection].insert_many(batch, ordered=False)
+                moved += len(batch)
+                batch = []
+        if batch:
+            await target[collection].insert_many(batch, ordered=False)
+            moved += len(batch)
+        await source[collection].delete_many({"mrf_id": mrf_id})
+    return moved
+
+async def hammer(client, ctx: dict, concurrency: int, stop: asyncio.Event) -> int:
+    # The noisy tenant cycles through NOISY_ROUTES until the quiet one has been measured
+    sent = 0
+
+    async def worker(iteration: int) -> None:
+        nonlocal sent
+        while not stop.is_set():
+            await send(client, NOISY_ROUTES[iteration % len(NOISY_ROUTES)], ctx, iteration)
+            sent += 1
+            iteration += concurrency
+            # In-process backends never block, so give the quiet requests a turn
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    return sent
+
+async def run_mode(args, mode: str) -> List[dict]:
+    import httpx
+    from app.core.config import settings
+    from app.db.mongodb import mongodb
+    from app.main import app
+    from benchmarks import datagen
+
+    settings.MONGODB_TENANT_PARTITIONS = {}
+    mongodb.partitions = {}
+    db = await connect(args.backend)
+    await reset_state()
+    seeded = await datagen.seed(db, 2, args.days, intakes_per_day=args.intakes_per_day, seed=args.seed)
+    quiet_mrf, noisy_mrf = seeded["mrf_ids"]
+    if mode == "partitioned":
+        noisy_db = await partition_db(args)
+        moved = await move_tenant(db, noisy_db, noisy_mrf)
+        mongodb.partitions = {"noisy": (noisy_db, noisy_db)}
+        settings.MONGODB_TENANT_PARTITIONS = {noisy_mrf: "noisy"}
+        print(f"{mode}: moved {moved} documents of {noisy_mrf} to its own partition")
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        base = {"run": mode, "headers": await login(client), "start": seeded["start"], "end": seeded["end"], "days": args.days}
+        quiet, noisy = {**base, "mrf_id": quiet_mrf}, {**base, "mrf_id": noisy_mrf}
+
+        results = []
+        for spec in QUIET_ROUTES:
+            alone = await measure(client, spec, quiet, args.requests, args.concurrency)
+            stop = asyncio.Event()
+            noise = asyncio.ensure_future(hammer(client, noisy, args.noisy_concurrency, stop))
+            loaded = await measure(client, spec, quiet, args.requests, args.concurrency)
+            stop.set()
+            noisy_requests = await noise
+            slowdown = loaded["p95_ms"] / alone["p95_ms"] if alone["p95_ms"] else 0.0
+            print(
+                f"  {mode:<12} {spec['name']:<32} p95 alone {alone['p95_ms']:>8.1f}ms"
+                f"  with noise {loaded['p95_ms']:>8.1f}ms  x{slowdown:.2f}  ({noisy_requests} noisy requests)"
+            )
+            results.append({
+                "mode": mode, "route": spec["name"], "alone": alone, "noisy": loaded,
+                "p95_slowdown": slowdown, "noisy_requests": noisy_requests
+            })
+    return results
+
+async def _main(args) -> dict:
+    results = []
+    for mode in args.modes:
+        results += await run_mode(args, mode)
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": args.backend,
+        "noisy_url": args.noisy_url,
+        "days": args.days,
+        "requests_per_route": args.requests,
+        "concurrency": args.concurrency,
+        "noisy_concurrency": args.noisy_concurrency,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure one MRF's latency while another MRF is under heavy load")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod",
+                        help="mongod uses MONGODB_URL; mongomock runs in-process and so shows no isolation")
+    parser.add_argument("--noisy-url", help="MongoDB URL for the noisy MRF's partition; a separate server isolates it fully")
+    parser.add_argument("--modes", nargs="+", choices=["shared", "partitioned"], default=["shared", "partitioned"])
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--intakes-per-day", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="quiet requests per route and phase")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--noisy-concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db-name", default="mrf_benchmark")
+    parser.add_argument("--output", default="isolation-results.json")
+    args = parser.parse_args()
+
+    # Settings are read on import, so these go in before anything from app is loaded
+    os.environ["MONGODB_DB_NAME"] = args.db_name
+    os.environ["REPORT_CACHE_BACKEND"] = "none"
+    os.environ.setdefault("METRICS_ENABLED", "false")
+
+    report = asyncio.run(_main(args))
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, default=str)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+from datetime import datetime
+from typing import Dict, List
+
+from benchmarks.run import _day, _git_commit, _range, connect, login, measure, reset_state, route, send
+
+# Latency of ordinary requests while a shift change logs everyone in at once. Each
+# hasher mode is measured alone and next to the storm: "inline" is bcrypt on the event
+# loop as it used to run, "thread" and "process" are the PASSWORD_HASH_EXECUTOR pools
+
+BYSTANDER_ROUTES = [
+    route("users.read_user_me", "GET", "/users/me", role="operator"),
+    route("reports.get_daily_report", "GET", "/reports/daily", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "date": _day(ctx, i % ctx["days"])}),
+    route("sales.get_sales_summary", "GET", "/sales/summary", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], **_range(ctx)}),
+]
+
+LOGIN = route("auth.login", "POST", "/auth/login", role=None,
+              data=lambda ctx, i: {"username": "operator@benchmark.example.com", "password": "benchmark"})
+
+async def _inline_hash(func, *args):
+    return func(*args)
+
+_pooled_hash = None
+
+def use_hasher(mode: str, workers: int) -> None:
+    from app.core import security
+    from app.core.config import settings
+
+    global _pooled_hash
+    if _pooled_hash is None:
+        _pooled_hash = security._run_hash
+    security.shutdown_hash_executor()
+    security._run_hash = _inline_hash if mode == "inline" else _pooled_hash
+    settings.PASSWORD_HASH_EXECUTOR = "thread" if mode == "inline" else mode
+    settings.PASSWORD_HASH_WORKERS = workers
+
+async def storm(client, ctx: dict, concurrency: int, stop: asyncio.Event) -> Dict[int, int]:
+    # Every worker logs in again as soon as its previous login is answered
+    statuses: Dict[int, int] = {}
+
+    async def worker(iteration: int) -> None:
+        while not stop.is_set():
+            response = await send(client, LOGIN, ctx, iteration)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            iteration += concurrency
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    return statuses
+
+async def run_mode(args, client, ctx: dict, mode: str) -> List[dict]:
+    use_hasher(mode, args.workers)
+    results = []
+    for spec in BYSTANDER_ROUTES:
+        alone = await measure(client, spec, ctx, args.requests, args.concurrency)
+        stop = asyncio.Event()
+        logins = asyncio.ensure_future(storm(client, ctx, args.storm_concurrency, stop))
+        loaded = await measure(client, spec, ctx, args.requests, args.concurrency)
+        stop.set()
+        login_statuses = await logins
+        slowdown = loaded["p99_ms"] / alone["p99_ms"] if alone["p99_ms"] else 0.0
+        print(
+            f"  {mode:<8} {spec['name']:<28} p99 alone {alone['p99_ms']:>8.1f}ms  during storm {loaded['p99_ms']:>8.1f}ms"
+            f"  x{slowdown:.2f}  logins {dict(sorted(login_statuses.items()))}"
+        )
+        results.append({
+            "mode": mode, "route": spec["name"], "alone": alone, "storm": loaded, "p99_slowdown": slowdown,
+            "login_statuses": {str(code): count for code, count in sorted(login_statuses.items())}
+        })
+    return results
+
+async def _main(args) -> dict:
+    import httpx
+    from app.main import app
+    from benchmarks import datagen
+
+    db = await connect(args.backend)
+    await reset_state()
+    seeded = await datagen.seed(db, 2, args.days, seed=args.seed)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        ctx = {
+            "headers": await login(client), "start": seeded["start"], "end": seeded["end"],
+            "days": args.days, "mrf_id": seeded["mrf_ids"][0]
+        }
+        results = []
+        for mode in args.modes:
+            results += await run_mode(args, client, ctx, mode)
+    use_hasher("thread", args.workers)
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": args.backend,
+        "hash_workers": args.workers,
+        "max_pending": int(os.environ["PASSWORD_HASH_MAX_PENDING"]),
+        "requests_per_route": args.requests,
+        "concurrency": args.concurrency,
+        "storm_concurrency": args.storm_concurrency,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure ordinary request latency during a login storm")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--modes", nargs="+", choices=["inline", "thread", "process"], default=["inline", "thread", "process"])
+    parser.add_argument("--workers", type=int, default=4, help="PASSWORD_HASH_WORKERS")
+    parser.add_argument("--max-pending", type=int, default=64, help="PASSWORD_HASH_MAX_PENDING")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--requests", type=int, default=100, help="bystander requests per route and phase")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--storm-concurrency", type=int, default=100, help="operators logging in at once")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db-name", default="mrf_benchmark")
+    parser.add_argument("--output", default="login-storm-results.json")
+    args = parser.parse_args()
+
+    # Settings are read on import, so these go in before anything from app is loaded
+    os.environ["MONGODB_DB_NAME"] = args.db_name
+    os.environ["REPORT_CACHE_BACKEND"] = "none"
+    os.environ["PASSWORD_HASH_MAX_PENDING"] = str(args.max_pending)
+    os.environ.setdefault("METRICS_ENABLED", "false")
+
+    report = asyncio.run(_main(args))
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
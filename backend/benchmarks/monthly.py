@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.run import _git_commit, connect, login, operation_counter, operations_per_request, reset_state, summarize
+
+# /reports/monthly against the loop it replaced: get_daily_report's three aggregations,
+# awaited one day after another for every day of the month
+
+def _day_match(day: datetime) -> dict:
+    return {"$gte": datetime.combine(day.date(), datetime.min.time()), "$lte": datetime.combine(day.date(), datetime.max.time())}
+
+async def legacy_daily_report(db, mrf_id: str, day: datetime) -> dict:
+    intake_summary = await db["waste_intake"].aggregate([
+        {"$match": {"mrf_id": mrf_id, "date": _day_match(day)}},
+        {"$group": {"_id": None, "total_weight": {"$sum": "$weight"}, "count": {"$sum": 1}}}
+    ]).to_list(length=None)
+    sorted_summary = await db["sorted_waste"].aggregate([
+        {"$match": {"date": _day_match(day)}},
+        {"$group": {"_id": "$category", "total_weight": {"$sum": "$weight"}}}
+    ]).to_list(length=None)
+    sales_summary = await db["waste_sales"].aggregate([
+        {"$match": {"mrf_id": mrf_id, "date": _day_match(day)}},
+        {"$group": {
+            "_id": "$category", "total_weight": {"$sum": "$weight"},
+            "total_amount": {"$sum": "$total_amount"}, "count": {"$sum": 1}
+        }}
+    ]).to_list(length=None)
+    return {
+        "date": day.date(),
+        "waste_intake": intake_summary[0] if intake_summary else {"total_weight": 0, "count": 0},
+        "sorted_waste": sorted_summary,
+        "sales": sales_summary
+    }
+
+async def legacy_monthly_report(db, mrf_id: str, year: int, month: int) -> dict:
+    day = datetime(year, month, 1)
+    daily_summaries = []
+    while day.month == month:
+        daily_summaries.append(await legacy_daily_report(db, mrf_id, day))
+        day += timedelta(days=1)
+    return {
+        "year": year,
+        "month": month,
+        "daily_summaries": daily_summaries,
+        "monthly_totals": {
+            "total_intake_weight": sum(day["waste_intake"]["total_weight"] for day in daily_summaries),
+            "total_intake_count": sum(day["waste_intake"]["count"] for day in daily_summaries),
+        }
+    }
+
+async def timed(call, requests: int) -> dict:
+    latencies = []
+    operations = operation_counter.count
+    for _ in range(requests):
+        started = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - started)
+    summary = summarize(latencies, sum(latencies), 0, {})
+    summary["db_operations_per_request"] = operations_per_request(operations, requests)
+    return summary
+
+async def _main(args) -> dict:
+    import httpx
+    from app.db.mongodb import mongodb
+    from app.main import app
+    from benchmarks import datagen
+
+    db = await connect(args.backend)
+    await reset_state()
+    start = datetime(args.year, args.month, 1)
+    days = ((start + timedelta(days=32)).replace(day=1) - start).days
+    seeded = await datagen.seed(db, args.mrfs, days, intakes_per_day=args.intakes_per_day, seed=args.seed, start=start)
+    mrf_id = seeded["mrf_ids"][0]
+    print(f"{args.mrfs} MRFs x {days} days: seeded {seeded['counts']}")
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        headers = (await login(client))["operator"]
+
+        async def current():
+            response = await client.get("/api/v1/reports/monthly", headers=headers, params={
+                "mrf_id": mrf_id, "year": args.year, "month": args.month
+            })
+            response.raise_for_status()
+
+        results = {
+            "legacy_daily_loop": await timed(lambda: legacy_monthly_report(mongodb.get_db(), mrf_id, args.year, args.month), args.requests),
+            "monthly_report": await timed(current, args.requests),
+        }
+    for name, summary in results.items():
+        operations = summary["db_operations_per_request"]
+        print(
+            f"  {name:<20} p50 {summary['p50_ms']:>8.1f}ms  p95 {summary['p95_ms']:>8.1f}ms"
+            f"  {'n/a' if operations is None else f'{operations:.0f}'} db round-trips/request"
+        )
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": args.backend,
+        "mrfs": args.mrfs,
+        "days": days,
+        "requests": args.requests,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare /reports/monthly with the per-day loop it replaced")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod",
+                        help="round-trips are only counted against mongod")
+    parser.add_argument("--mrfs", type=int, default=10)
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--month", type=int, default=1)
+    parser.add_argument("--intakes-per-day", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db-name", default="mrf_benchmark")
+    parser.add_argument("--output", default="monthly-results.json")
+    args = parser.parse_args()
+
+    # Settings are read on import, so these go in before anything from app is loaded
+    os.environ["MONGODB_DB_NAME"] = args.db_name
+    os.environ["REPORT_CACHE_BACKEND"] = "none"
+    os.environ.setdefault("METRICS_ENABLED", "false")
+
+    report = asyncio.run(_main(args))
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, default=str)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from pymongo import monitoring
+
+# Routes that are not request/response shaped and so are left out
+SKIPPED_ROUTES = {"events.stream": "long-lived SSE stream"}
+
+def route(name: str, method: str, path, role: Optional[str] = "manager", **request) -> dict:
+    # path, params, json and data may be callables of (ctx, iteration)
+    return {"name": name, "method": method, "path": path, "role": role, **request}
+
+def _day(ctx, offset: int = 0) -> str:
+    return (ctx["start"] + timedelta(days=offset)).isoformat()
+
+def _range(ctx) -> dict:
+    return {"start_date": _day(ctx), "end_date": ctx["end"].isoformat()}
+
+def _intake(ctx, i) -> dict:
+    return {"mrf_id": ctx["mrf_id"], "vehicle_id": f"BENCH-{i}", "weight": 500.0, "operator_id": "benchmark", "date": _day(ctx, 1)}
+
+def _sorted(ctx, i) -> dict:
+    return {"intake_id": ctx["intake_id"], "category": "pet", "weight": 1.0, "operator_id": "benchmark", "date": _day(ctx, 1)}
+
+def _sale(ctx, i) -> dict:
+    return {
+        "mrf_id": ctx["mrf_id"], "category": "pet", "weight": 0.1, "unit_price": 18.0, "total_amount": 0,
+        "buyer_name": "Benchmark buyer", "operator_id": "benchmark", "date": _day(ctx, 1)
+    }
+
+def _user(ctx, i, prefix: str) -> dict:
+    return {
+        "email": f"{prefix}-{ctx['run']}-{i}@benchmark.example.com", "full_name": "Benchmark user",
+        "role": "operator", "mrf_id": ctx["mrf_id"], "password": "benchmark"
+    }
+
+ROUTES = [
+    route("auth.login", "POST", "/auth/login", role=None,
+          data=lambda ctx, i: {"username": "operator@benchmark.example.com", "password": "benchmark"}),
+    route("auth.register", "POST", "/auth/register", role=None, json=lambda ctx, i: _user(ctx, i, "register")),
+    route("users.read_user_me", "GET", "/users/me", role="operator"),
+    route("users.update_user_me", "PUT", "/users/me", role="panchayat",
+          json=lambda ctx, i: {**_user(ctx, 0, "me"), "email": "panchayat@benchmark.example.com", "role": "panchayat"}),
+    route("users.read_users", "GET", "/users/", params=lambda ctx, i: {"mrf_id": ctx["mrf_id"]}),
+    route("users.create_user", "POST", "/users/", json=lambda ctx, i: _user(ctx, i, "create")),
+    route("users.read_user_cache_stats", "GET", "/users/cache/stats"),
+    route("users.read_user", "GET", lambda ctx, i: f"/users/{ctx['operator_id']}"),
+    route("users.update_user", "PUT", lambda ctx, i: f"/users/{ctx['victims'][i]}",
+          json=lambda ctx, i: {**_user(ctx, i, "victim"), "full_name": f"Renamed {i}"}),
+    route("users.delete_user", "DELETE", lambda ctx, i: f"/users/{ctx['victims'][i]}"),
+    route("waste.create_waste_intake", "POST", "/waste/intake", role="operator", json=_intake),
+    route("waste.create_waste_intakes_bulk", "POST", "/waste/intake/bulk", role="operator",
+          json=lambda ctx, i: [_intake(ctx, i * 100 + n) for n in range(100)]),
+    route("waste.get_waste_intakes.day", "GET", "/waste/intake", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "start_date": _day(ctx), "end_date": _day(ctx, 1)}),
+    route("waste.get_waste_intakes.page", "GET", "/waste/intake", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "limit": 100}),
+    route("waste.create_sorted_waste", "POST", "/waste/sort", role="operator", json=_sorted),
+    route("waste.create_sorted_waste_bulk", "POST", "/waste/sort/bulk", role="operator",
+          json=lambda ctx, i: [_sorted(ctx, n) for n in range(100)]),
+    route("waste.get_sorted_waste", "GET", "/waste/sort", role="operator",
+          params=lambda ctx, i: {"intake_id": ctx["intake_id"]}),
+    route("waste.get_waste_categories", "GET", "/waste/categories", role="operator"),
+    route("waste.create_waste_category", "POST", "/waste/categories",
+          json=lambda ctx, i: {"name": f"bench-{ctx['run']}-{i}", "unit_price": 1.0}),
+    route("sales.create_sale", "POST", "/sales/", role="operator", json=_sale),
+    route("sales.create_sales_bulk", "POST", "/sales/bulk", role="operator",
+          json=lambda ctx, i: [_sale(ctx, n) for n in range(100)]),
+    route("sales.get_sales.range", "GET", "/sales/", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], **_range(ctx)}),
+    route("sales.get_sales.page", "GET", "/sales/", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "limit": 100}),
+    route("sales.get_sales_summary", "GET", "/sales/summary", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], **_range(ctx)}),
+    route("sales.update_sale", "PUT", lambda ctx, i: f"/sales/{ctx['sale_id']}",
+          json=lambda ctx, i: {**_sale(ctx, i), "weight": 0.1 + (i % 2) / 10}),
+    route("reports.get_daily_report", "GET", "/reports/daily", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "date": _day(ctx, i % ctx["days"])}),
+    route("reports.get_monthly_report", "GET", "/reports/monthly", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "year": ctx["start"].year, "month": ctx["start"].month}),
+    route("reports.get_panchayat_report", "GET", "/reports/panchayat", role="panchayat", params=lambda ctx, i: _range(ctx)),
+    route("reports.get_timeseries_report", "GET", "/reports/timeseries", role="panchayat",
+          params=lambda ctx, i: {**_range(ctx), "granularity": "week"}),
+    route("reports.get_reconciliation_report", "GET", "/reports/reconciliation", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], **_range(ctx)}),
+    route("export.export_collection.csv", "GET", "/export/waste_sales", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "format": "csv"}),
+    route("export.export_collection.parquet", "GET", "/export/waste_sales", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "format": "parquet"}),
+    route("inventory.get_inventory", "GET", "/inventory/", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"]}),
+    route("inventory.get_category_stock", "GET", "/inventory/pet", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"]}),
+    route("inventory.get_inventory_drift", "GET", "/inventory/drift"),
+    route("sync.get_changes", "GET", "/sync/", role="operator",
+          params=lambda ctx, i: {"mrf_id": ctx["mrf_id"], "limit": 500}),
+]
+
+class OperationCounter(monitoring.CommandListener):
+    # MongoDB round-trips, counted from command events; only mongod produces them
+    def __init__(self):
+        self.active = False
+        self.count = 0
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        self.count += 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+operation_counter = OperationCounter()
+
+def operations_per_request(before: int, requests: int) -> Optional[float]:
+    if not operation_counter.active or not requests:
+        return None
+    return (operation_counter.count - before) / requests
+
+def _value(value, ctx: dict, iteration: int):
+    return value(ctx, iteration) if callable(value) else value
+
+def summarize(latencies: List[float], wall_time: float, errors: int, statuses: Dict[int, int]) -> dict:
+    import numpy as np
+
+    values = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "throughput_rps": len(latencies) / wall_time if wall_time else 0.0,
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+async def send(client, spec: dict, ctx: dict, iteration: int):
+    response = await client.request(
+        spec["method"],
+        "/api/v1" + _value(spec["path"], ctx, iteration),
+        params=_value(spec.get("params"), ctx, iteration),
+        json=_value(spec.get("json"), ctx, iteration),
+        data=_value(spec.get("data"), ctx, iteration),
+        headers=ctx["headers"].get(spec["role"], {}),
+    )
+    await response.aread()
+    return response
+
+async def measure(client, spec: dict, ctx: dict, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def one(iteration: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            response = await send(client, spec, ctx, iteration)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    operations = operation_counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(one(iteration) for iteration in range(requests)))
+    wall_time = time.perf_counter() - started
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    summary = summarize(latencies, wall_time, errors, statuses)
+    summary["db_operations_per_request"] = operations_per_request(operations, requests)
+    return summary
+
+def micro_benchmarks(iterations: int) -> Dict[str, dict]:
+    # Auth overhead per request: full JWT verification versus the verified-token cache
+    from app.core.security import create_access_token, token_cache, verify_token
+
+    token = create_access_token({"sub": "0" * 24, "role": "operator", "mrf_id": "mrf-000", "is_active": True})
+    results = {}
+    for name, clear in (("auth.verify_token.uncached", True), ("auth.verify_token.cached", False)):
+        latencies = []
+        for _ in range(iterations):
+            if clear:
+                token_cache.clear()
+            started = time.perf_counter()
+            verify_token(token)
+            latencies.append(time.perf_counter() - started)
+        results[name] = summarize(latencies, sum(latencies), 0, {})
+    return results
+
+async def connect(backend: str):
+    from app.db.indexes import ensure_indexes
+    from app.db.mongodb import mongodb
+
+    if backend == "mongomock":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("The mongomock backend needs mongomock-motor installed")
+        mongodb.client = AsyncMongoMockClient()
+        mongodb.db = mongodb.client[os.environ["MONGODB_DB_NAME"]]
+        mongodb.report_db = mongodb.db
+    else:
+        if not operation_counter.active:
+            # Listeners registered this way apply to every client created afterwards
+            monitoring.register(operation_counter)
+            operation_counter.active = True
+        await mongodb.connect_to_mongodb()
+        await mongodb.client.drop_database(os.environ["MONGODB_DB_NAME"])
+        await ensure_indexes(mongodb.get_db())
+    return mongodb.get_db()
+
+async def login(client) -> Dict[Optional[str], dict]:
+    from benchmarks import datagen
+
+    headers = {None: {}}
+    for role in ("manager", "operator", "panchayat"):
+        response = await client.post("/api/v1/auth/login", data={
+            "username": f"{role}@benchmark.example.com", "password": datagen.PASSWORD
+        })
+        headers[role] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return headers
+
+async def reset_state() -> None:
+    from app.api.deps import user_cache
+    from app.core.cache import report_cache
+    from app.core.security import token_cache, token_revocations
+    from app.db.categories import category_catalog
+
+    user_cache.clear()
+    category_catalog.clear()
+    token_cache.clear()
+    token_revocations.clear()
+    await report_cache.clear()
+
+async def run_size(args, mrfs: int, days: int, routes: List[dict]) -> List[dict]:
+    import httpx
+    from bson import ObjectId
+    from app.main import app
+    from benchmarks import datagen
+
+    db = await connect(args.backend)
+    await reset_state()
+    started = time.perf_counter()
+    seeded = await datagen.seed(db, mrfs, days, intakes_per_day=args.intakes_per_day, seed=args.seed)
+    seed_seconds = time.perf_counter() - started
+    print(f"{mrfs} MRFs x {days} days: seeded {seeded['counts']} in {seed_seconds:.1f}s")
+
+    victims = [ObjectId() for _ in range(args.requests)]
+    await db["users"].insert_many([
+        {**seeded["users"]["operator"], "_id": victim, "email": f"victim-{victim}@benchmark.example.com"}
+        for victim in victims
+    ])
+
+    # Server errors come back as 500s so one unsupported route does not end the run
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        ctx = {
+            "run": f"{mrfs}x{days}",
+            "headers": await login(client),
+            "start": seeded["start"],
+            "end": seeded["end"],
+            "days": days,
+            "mrf_id": seeded["mrf_ids"][0],
+            "intake_id": str(seeded["sample"]["waste_intake"]["_id"]),
+            "sale_id": str(seeded["sample"]["waste_sales"]["_id"]),
+            "operator_id": str(seeded["users"]["operator"]["_id"]),
+            "victims": [str(victim) for victim in victims],
+        }
+
+        results = []
+        for spec in routes:
+            summary = await measure(client, spec, ctx, args.requests, args.concurrency)
+            operations = summary["db_operations_per_request"]
+            print(
+                f"  {spec['name']:<42} {summary['throughput_rps']:>8.1f} req/s  p50 {summary['p50_ms']:>8.1f}ms"
+                f"  p95 {summary['p95_ms']:>8.1f}ms  p99 {summary['p99_ms']:>8.1f}ms  errors {summary['errors']}"
+                + (f"  {operations:.1f} db ops/req" if operations is not None else "")
+            )
+            results.append({"size": ctx["run"], "mrfs": mrfs, "days": days, "route": spec["name"], **summary})
+    return results
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_size(value: str) -> tuple:
+    mrfs, days = value.lower().split("x")
+    return int(mrfs), int(days)
+
+async def _main(args) -> dict:
+    routes = [spec for spec in ROUTES if not args.route or any(name in spec["name"] for name in args.route)]
+    results = []
+    for mrfs, days in args.sizes:
+        results += await run_size(args, mrfs, days, routes)
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": args.backend,
+        "requests_per_route": args.requests,
+        "concurrency": args.concurrency,
+        "report_cache": os.environ["REPORT_CACHE_BACKEND"],
+        "skipped_routes": SKIPPED_ROUTES,
+        "results": results,
+        "micro": micro_benchmarks(args.micro_iterations),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every API route against a seeded database")
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod",
+                        help="mongod uses MONGODB_URL; mongomock needs mongomock-motor and no server")
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[(2, 30), (10, 90)],
+                        help="dataset sizes as MRFSxDAYS")
+    parser.add_argument("--intakes-per-day", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=50, help="requests per route and size")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--route", action="append", help="only routes whose name contains this")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--micro-iterations", type=int, default=2000)
+    parser.add_argument("--report-cache", action="store_true", help="keep the report cache on")
+    parser.add_argument("--db-name", default="mrf_benchmark")
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args()
+
+    # Settings are read on import, so these go in before anything from app is loaded
+    os.environ["MONGODB_DB_NAME"] = args.db_name
+    os.environ["REPORT_CACHE_BACKEND"] = "memory" if args.report_cache else "none"
+    os.environ.setdefault("METRICS_ENABLED", "false")
+
+    report = asyncio.run(_main(args))
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, List
+
+# Response encoding for large list reads (get_sales, get_waste_intakes), without the
+# database: the path the handlers used to take against the ones in app.api.serialization
+
+def _rows(collection: str, count: int, seed: int) -> List[dict]:
+    from benchmarks.datagen import ledger_documents
+
+    documents = ledger_documents(10, 10_000, 5, datetime(2024, 1, 1), random.Random(seed))
+    return list(islice((document for name, document in documents if name == collection), count))
+
+def _variants(model) -> Dict[str, Callable[[List[dict]], bytes]]:
+    from typing import List as ListType
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from app.api.serialization import encode_rows
+    from app.core.config import settings
+
+    field = create_response_field(name="response", type_=ListType[model])
+
+    def models_then_response_model(documents: List[dict]) -> bytes:
+        # Models built in the handler, then validated and encoded again by FastAPI
+        content = asyncio.run(serialize_response(field=field, response_content=[model(**document) for document in documents]))
+        return JSONResponse(content).body
+
+    def type_adapter(documents: List[dict]) -> bytes:
+        settings.TRUST_DB_READS = False
+        return encode_rows(model, documents)
+
+    def trusted_orjson(documents: List[dict]) -> bytes:
+        settings.TRUST_DB_READS = True
+        try:
+            return encode_rows(model, documents)
+        finally:
+            settings.TRUST_DB_READS = False
+
+    return {
+        "models_then_response_model": models_then_response_model,
+        "type_adapter": type_adapter,
+        "trusted_orjson": trusted_orjson,
+    }
+
+def run(rows: int, repeat: int, seed: int) -> List[dict]:
+    from app.models.waste import WasteIntake, WasteSale
+    from benchmarks.run import summarize
+
+    results = []
+    for route, collection, model in (
+        ("sales.get_sales", "waste_sales", WasteSale),
+        ("waste.get_waste_intakes", "waste_intake", WasteIntake),
+    ):
+        documents = _rows(collection, rows, seed)
+        for name, encode in _variants(model).items():
+            encode(documents[:100])  # first call builds validators and adapters
+            latencies = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                body = encode(documents)
+                latencies.append(time.perf_counter() - started)
+            summary = summarize(latencies, sum(latencies), 0, {})
+            summary.pop("throughput_rps")
+            results.append({"route": route, "variant": name, "rows": len(documents), "bytes": len(body), **summary})
+            print(f"{route:<26} {name:<28} {len(documents)} rows  p50 {summary['p50_ms']:>8.1f}ms  p95 {summary['p95_ms']:>8.1f}ms")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure response serialization cost for large list reads")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    os.environ.setdefault("METRICS_ENABLED", "false")
+    results = run(args.rows, args.repeat, args.seed)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"rows": args.rows, "repeat": args.repeat, "results": results}, output, indent=2)
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from datetime import datetime
+from functools import wraps
+from typing import List, Tuple
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from mongomock.collection import Collection
+from mongomock_motor import AsyncMongoMockClient
+
+from app.api.deps import token_claims, user_cache
+from app.core.cache import report_cache
+from app.core.security import create_access_token, token_cache, token_revocations
+from app.db.categories import category_catalog
+from app.db.indexes import ensure_indexes
+from app.db.mongodb import mongodb
+from app.main import app
+
+# Collection methods that are one round-trip each against a real server
+COUNTED_OPERATIONS = (
+    "aggregate",
+    "bulk_write",
+    "count_documents",
+    "delete_many",
+    "delete_one",
+    "find",
+    "find_one",
+    "find_one_and_delete",
+    "find_one_and_replace",
+    "find_one_and_update",
+    "insert_many",
+    "insert_one",
+    "replace_one",
+    "update_many",
+    "update_one",
+)
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+class OperationLog:
+    # (collection, operation) for every database call; mongomock calls its own public
+    # methods internally, so only the outermost call on each thread is recorded
+    def __init__(self):
+        self.operations: List[Tuple[str, str]] = []
+        self._depth = threading.local()
+
+    def clear(self) -> None:
+        self.operations = []
+
+    def on(self, collection: str) -> List[str]:
+        return [operation for name, operation in self.operations if name == collection]
+
+    def wrap(self, method_name: str):
+        method = getattr(Collection, method_name)
+        log = self
+
+        @wraps(method)
+        def counted(collection, *args, **kwargs):
+            depth = getattr(log._depth, "value", 0)
+            if depth == 0:
+                log.operations.append((collection.name, method_name))
+            log._depth.value = depth + 1
+            try:
+                return method(collection, *args, **kwargs)
+            finally:
+                log._depth.value = depth
+
+        return counted
+
+@pytest.fixture
+def db():
+    mongo_client = AsyncMongoMockClient()
+    mongodb.client = mongo_client
+    mongodb.clients = {}
+    mongodb.partitions = {}
+    mongodb.db = mongo_client["mrf_test"]
+    mongodb.report_db = mongodb.db
+    run(ensure_indexes(mongodb.db))
+    user_cache.clear()
+    token_cache.clear()
+    token_revocations.clear()
+    category_catalog.clear()
+    run(report_cache.clear())
+    return mongodb.db
+
+@pytest.fixture
+def client(db):
+    # Not entered as a context manager, so startup does not connect to a real server
+    return TestClient(app)
+
+@pytest.fixture
+def db_operations(monkeypatch):
+    log = OperationLog()
+    for method_name in COUNTED_OPERATIONS:
+        monkeypatch.setattr(Collection, method_name, log.wrap(method_name))
+    return log
+
+def make_user(db, role: str = "manager", mrf_id: str = "mrf-001") -> dict:
+    now = datetime.utcnow()
+    user = {
+        "_id": ObjectId(),
+        "email": f"{role}-{ObjectId()}@example.com",
+        "full_name": f"Test {role}",
+        "role": role,
+        "mrf_id": mrf_id,
+        "is_active": True,
+        "hashed_password": "not-a-hash",
+        "created_at": now,
+        "updated_at": now,
+    }
+    run(db["users"].insert_one(user))
+    return user
+
+def auth_headers(user: dict) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(token_claims(user))}"}
+
+@pytest.fixture
+def manager(db) -> dict:
+    return auth_headers(make_user(db, "manager"))
+
+@pytest.fixture
+def operator(db) -> dict:
+    return auth_headers(make_user(db, "operator"))
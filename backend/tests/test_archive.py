@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import pytest
+
+from app.core.cache import report_cache
+from app.db import archive
+from app.db.archive import archive_month, archive_store
+from app.db.rollups import MONTHLY_ROLLUP_COLLECTION, ROLLUP_COLLECTION, apply_rollups, intake_increments
+from tests.conftest import auth_headers, make_user, run
+
+MONTH = datetime(2024, 1, 1)
+INTAKE = {"mrf_id": "mrf-001", "vehicle_id": "KL-01-1234", "weight": 100.0, "operator_id": "x"}
+
+@pytest.fixture
+def archived_to(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_store, "directory", str(tmp_path))
+    return archive_store
+
+@pytest.fixture
+def seeded(client, manager):
+    for day in (3, 17, 31):
+        date = datetime(2024, 1, day, 10).isoformat()
+        intake = client.post("/api/v1/waste/intake", json={**INTAKE, "date": date}, headers=manager).json()
+        client.post("/api/v1/waste/sort", json={
+            "intake_id": intake["_id"], "category": "pet", "weight": 40.0, "date": date, "operator_id": "x"
+        }, headers=manager)
+        client.post("/api/v1/sales/", json={
+            "mrf_id": "mrf-001", "category": "pet", "weight": 10.0, "unit_price": 18.0, "total_amount": 0,
+            "buyer_name": "Buyer", "date": date, "operator_id": "x"
+        }, headers=manager)
+    return manager
+
+def reports(client, db, manager) -> tuple:
+    run(report_cache.clear())
+    monthly = client.get("/api/v1/reports/monthly", params={"mrf_id": "mrf-001", "year": 2024, "month": 1}, headers=manager)
+    panchayat = client.get("/api/v1/reports/panchayat", params={
+        "start_date": "2024-01-01T00:00:00", "end_date": "2024-01-31T23:59:59"
+    }, headers=auth_headers(make_user(db, "panchayat")))
+    assert monthly.status_code == 200 and panchayat.status_code == 200
+    return monthly.json(), panchayat.json()
+
+def test_archiving_a_month_keeps_its_report_totals(client, db, seeded, archived_to):
+    before = reports(client, db, seeded)
+
+    counts = run(archive_month(db, archived_to, MONTH))
+
+    assert counts["waste_intake"] == 3 and counts[ROLLUP_COLLECTION] == 6
+    assert run(db["waste_intake"].count_documents({})) == 0
+    assert run(db[MONTHLY_ROLLUP_COLLECTION].count_documents({})) == 0
+    assert reports(client, db, seeded) == before
+
+def test_increment_between_copy_and_delete_is_kept(client, db, seeded, archived_to, monkeypatch):
+    late = {"_id": "late", "mrf_id": "mrf-001", "date": datetime(2024, 1, 17, 12), "weight": 5.0}
+    delete_archived = archive.delete_archived
+
+    async def with_late_increment(db, archived):
+        # An intake recorded after the month was copied but before its rows are deleted
+        await apply_rollups(db, intake_increments(late))
+        await delete_archived(db, archived)
+
+    monkeypatch.setattr(archive, "delete_archived", with_late_increment)
+    monthly, panchayat = reports(client, db, seeded)
+
+    run(archive_month(db, archived_to, MONTH))
+
+    after_monthly, after_panchayat = reports(client, db, seeded)
+    assert after_monthly["monthly_totals"]["total_intake_weight"] == monthly["monthly_totals"]["total_intake_weight"] + 5.0
+    assert after_panchayat["mrf_summary"]["mrf-001"]["total_intake_weight"] == (
+        panchayat["mrf_summary"]["mrf-001"]["total_intake_weight"] + 5.0
+    )
+
+def test_writes_to_archived_rows_are_conflicts(client, db, seeded, archived_to):
+    intake_id = str(run(db["waste_intake"].find_one({}))["_id"])
+    sale = run(db["waste_sales"].find_one({}))
+    run(archive_month(db, archived_to, MONTH))
+
+    sorted_row = {"intake_id": intake_id, "category": "pet", "weight": 1.0, "operator_id": "x"}
+    response = client.post("/api/v1/waste/sort", json=sorted_row, headers=seeded)
+    bulk = client.post("/api/v1/waste/sort/bulk", json=[sorted_row], headers=seeded).json()
+    update = client.put(f"/api/v1/sales/{sale['_id']}", json={
+        "mrf_id": "mrf-001", "category": "pet", "weight": 5.0, "unit_price": 18.0, "total_amount": 0,
+        "buyer_name": "Buyer", "operator_id": "x"
+    }, headers=seeded)
+
+    assert response.status_code == 409
+    assert bulk["errors"][0]["detail"] == response.json()["detail"]
+    assert update.status_code == 409
+
+def test_reports_over_archived_months_accept_dates_with_an_offset(client, db, seeded, archived_to):
+    run(archive_month(db, archived_to, MONTH))
+    panchayat = auth_headers(make_user(db, "panchayat"))
+
+    response = client.get("/api/v1/reports/panchayat", params={
+        "start_date": "2024-01-01T00:00:00+05:30", "end_date": "2024-01-31T23:59:59Z"
+    }, headers=panchayat)
+
+    assert response.status_code == 200
+    assert response.json()["mrf_summary"]["mrf-001"]["total_intake_weight"] == 300.0
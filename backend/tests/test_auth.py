@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+
+from jose import jwt
+
+from app.core import security
+from app.core.security import create_access_token, is_token_revoked, revocation_time, token_revocations
+from tests.conftest import auth_headers, make_user
+
+REVOKED_AT = datetime(2024, 1, 1, 12, 0, 0, 200000)
+
+def issued_at(monkeypatch, offset: float) -> dict:
+    instant = REVOKED_AT.replace(tzinfo=timezone.utc).timestamp() + offset
+    monkeypatch.setattr(security.time, "time", lambda: instant)
+    return jwt.get_unverified_claims(create_access_token({"sub": "user"}))
+
+def test_revocation_is_compared_below_the_second(monkeypatch):
+    token_revocations["user"] = revocation_time(REVOKED_AT)
+
+    assert is_token_revoked(issued_at(monkeypatch, -0.1))
+    assert not is_token_revoked(issued_at(monkeypatch, 0.5))
+
+def test_login_right_after_a_role_change_is_accepted(client, db, manager):
+    user = make_user(db, "operator")
+    old_token = auth_headers(user)
+    response = client.put(f"/api/v1/users/{user['_id']}", json={
+        "email": user["email"], "full_name": user["full_name"], "role": "manager", "mrf_id": "mrf-001",
+        "password": "secret"
+    }, headers=manager)
+    assert response.status_code == 200
+
+    # Issued straight away, most likely within the same second as the revocation
+    new_token = auth_headers({**user, "role": "manager"})
+
+    assert client.get("/api/v1/users/me", headers=old_token).status_code == 401
+    assert client.get("/api/v1/users/me", headers=new_token).status_code == 200
@@ -0,0 +1,55 @@
+import pytest
+
+from app.core.config import settings
+
+SALE = {
+    "mrf_id": "mrf-001", "category": "pet", "weight": 20.0, "unit_price": 18.0, "total_amount": 0,
+    "buyer_name": "Buyer", "operator_id": "x"
+}
+
+@pytest.fixture
+def stocked(client, manager):
+    # 30 of pet sorted at mrf-001
+    intake = client.post("/api/v1/waste/intake", json={
+        "mrf_id": "mrf-001", "vehicle_id": "KL-01-1234", "weight": 100.0, "operator_id": "x"
+    }, headers=manager).json()
+    client.post("/api/v1/waste/sort", json={
+        "intake_id": intake["_id"], "category": "pet", "weight": 30.0, "operator_id": "x"
+    }, headers=manager)
+    return manager
+
+@pytest.fixture
+def enforced(monkeypatch):
+    monkeypatch.setattr(settings, "INVENTORY_ENFORCE_STOCK", True)
+
+def stock(client, headers) -> float:
+    return client.get("/api/v1/inventory/pet", params={"mrf_id": "mrf-001"}, headers=headers).json()["stock_weight"]
+
+def test_shortfall_is_a_conflict(client, stocked, enforced):
+    assert client.post("/api/v1/sales/", json=SALE, headers=stocked).status_code == 200
+
+    response = client.post("/api/v1/sales/", json=SALE, headers=stocked)
+
+    assert response.status_code == 409
+    assert response.json()["available"] == 10.0
+    assert stock(client, stocked) == 10.0
+
+def test_bulk_reports_shortfalls_per_row(client, stocked, enforced):
+    response = client.post("/api/v1/sales/bulk", json=[
+        {**SALE, "weight": 3.0}, {**SALE, "weight": 40.0}, {**SALE, "weight": 5.0}
+    ], headers=stocked)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["inserted"] == 2
+    assert [error["index"] for error in body["errors"]] == [1]
+    assert stock(client, stocked) == 22.0
+
+def test_bulk_without_enforcement_takes_stock_in_one_write(client, stocked, db_operations):
+    db_operations.clear()
+
+    response = client.post("/api/v1/sales/bulk", json=[{**SALE, "weight": 1.0}] * 50, headers=stocked)
+
+    assert response.json()["inserted"] == 50
+    assert db_operations.on("inventory") == ["bulk_write"]
+    assert stock(client, stocked) == -20.0
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from app.core.cache import MemoryReportBackend
+from tests.conftest import auth_headers, make_user, run
+
+SCOPE = ("mrf-001", datetime(2024, 1, 1), datetime(2024, 1, 31))
+
+def test_write_inside_the_scope_evicts_the_entry():
+    async def scenario():
+        cache = MemoryReportBackend(maxsize=8, ttl=60)
+        await cache.set("monthly", ("etag", b"{}"), SCOPE, await cache.generation())
+        await cache.invalidate("mrf-002", datetime(2024, 1, 5))
+        kept = await cache.get("monthly")
+        await cache.invalidate("mrf-001", datetime(2024, 1, 5))
+        return kept, await cache.get("monthly")
+
+    kept, evicted = run(scenario())
+    assert kept == ("etag", b"{}")
+    assert evicted is None
+
+def test_compute_overlapping_an_invalidation_is_not_cached():
+    async def scenario():
+        cache = MemoryReportBackend(maxsize=8, ttl=60)
+        generation = await cache.generation()
+        # A write lands while the report is being computed from pre-write data
+        await cache.invalidate("mrf-001", datetime(2024, 1, 5))
+        await cache.set("monthly", ("stale", b"{}"), SCOPE, generation)
+        return await cache.get("monthly")
+
+    assert run(scenario()) is None
+
+def test_report_with_an_aware_end_date_is_still_invalidated(client, db, manager):
+    panchayat = auth_headers(make_user(db, "panchayat"))
+    params = {"start_date": "2024-01-01T00:00:00Z", "end_date": "2024-01-31T00:00:00Z"}
+    before = client.get("/api/v1/reports/panchayat", params=params, headers=panchayat).json()
+
+    response = client.post("/api/v1/waste/intake", json={
+        "mrf_id": "mrf-001", "vehicle_id": "KL-01-1234", "weight": 100.0, "operator_id": "x", "date": "2024-01-10T10:00:00"
+    }, headers=manager)
+
+    assert response.status_code == 200
+    after = client.get("/api/v1/reports/panchayat", params=params, headers=panchayat).json()
+    assert after["total_mrfs"] == before["total_mrfs"] + 1
@@ -0,0 +1,25 @@
+import pytest
+
+from app.api.v1.endpoints.reports import merge_reconciliation_facets, reconciliation_pipeline
+from tests.conftest import auth_headers, make_user
+
+@pytest.fixture
+def panchayat(db) -> dict:
+    return auth_headers(make_user(db, "panchayat"))
+
+@pytest.mark.parametrize("offset", ["Z", "+05:30"])
+def test_timeseries_accepts_dates_with_an_offset(client, panchayat, offset):
+    response = client.get("/api/v1/reports/timeseries", params={
+        "start_date": f"2024-01-01T00:00:00{offset}", "end_date": f"2024-01-31T00:00:00{offset}", "granularity": "day"
+    }, headers=panchayat)
+
+    assert response.status_code == 200
+    assert len(response.json()["buckets"]) == 31
+
+def test_reconciliation_with_limit_zero_leaves_out_the_intake_rows():
+    # mongod rejects {"$limit": 0}, so the totals-only request must not send one
+    facets = reconciliation_pipeline({}, 0, unsorted_only=True)[-1]["$facet"]
+
+    assert set(facets) == {"mrfs", "categories"}
+    assert "intakes" in reconciliation_pipeline({}, 5, unsorted_only=True)[-1]["$facet"]
+    assert merge_reconciliation_facets([{"mrfs": [], "categories": []}], 0)["intakes"] == []
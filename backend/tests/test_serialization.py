@@ -0,0 +1,25 @@
+import orjson
+import pytest
+from bson import ObjectId
+
+from app.api.serialization import encode_rows
+from app.core.config import settings
+from app.models.waste import WasteCategory, WasteSale
+
+LEGACY_SALE = {
+    "_id": ObjectId(), "category": "pet", "weight": 2.0, "unit_price": 18.0, "total_amount": 36.0,
+    "buyer_name": "Buyer", "operator_id": "x"
+}
+
+@pytest.mark.parametrize("trusted", [False, True])
+def test_missing_fields_are_filled_the_same_way_on_both_paths(monkeypatch, trusted):
+    monkeypatch.setattr(settings, "TRUST_DB_READS", trusted)
+
+    [sale] = orjson.loads(encode_rows(WasteSale, [LEGACY_SALE]))
+    [category] = orjson.loads(encode_rows(WasteCategory, [{"name": "pet"}]))
+
+    assert sale["_id"] == str(LEGACY_SALE["_id"])
+    assert sale["mrf_id"] is None
+    assert sale["created_at"] is not None and sale["updated_at"] is not None
+    assert category["updated_at"] is not None
+    assert category["unit_price"] == 0.0
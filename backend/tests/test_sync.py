@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+
+SALE = {
+    "mrf_id": "mrf-001", "category": "pet", "weight": 2.0, "unit_price": 18.0, "total_amount": 0,
+    "buyer_name": "Buyer", "operator_id": "x"
+}
+
+def sync(client, headers, watermark=None) -> dict:
+    params = {"mrf_id": "mrf-001", "collection": "waste_sales"}
+    if watermark:
+        params["watermark"] = watermark
+    response = client.get("/api/v1/sync/", params=params, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+def sale_ids(body: dict) -> list:
+    return [row["_id"] for row in body["changes"]["waste_sales"]]
+
+@pytest.fixture
+def settled(monkeypatch):
+    monkeypatch.setattr(settings, "SYNC_SETTLE_SECONDS", 0)
+
+def test_client_timestamps_do_not_slip_behind_the_watermark(client, manager, settled):
+    client.post("/api/v1/sales/", json=SALE, headers=manager)
+    first = sync(client, manager)
+
+    # A device with its clock behind stamps the sale before the watermark already handed out
+    stale = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    late = client.post("/api/v1/sales/", json={**SALE, "created_at": stale, "updated_at": stale}, headers=manager).json()
+
+    assert late["updated_at"] > stale
+    assert sale_ids(sync(client, manager, first["watermark"])) == [late["_id"]]
+
+def test_rows_inside_the_settle_window_wait_for_the_next_sync(client, manager, monkeypatch):
+    monkeypatch.setattr(settings, "SYNC_SETTLE_SECONDS", 60)
+    sale = client.post("/api/v1/sales/", json=SALE, headers=manager).json()
+
+    early = sync(client, manager)
+    assert sale_ids(early) == []
+
+    monkeypatch.setattr(settings, "SYNC_SETTLE_SECONDS", 0)
+    assert sale_ids(sync(client, manager, early["watermark"])) == [sale["_id"]]
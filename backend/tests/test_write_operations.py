@@ -0,0 +1,108 @@
+import pytest
+from pymongo.errors import OperationFailure
+
+from app.db.indexes import ensure_indexes
+from tests.conftest import make_user, run
+
+# Write endpoints answer from the validated model: one write per ledger document and no
+# read of it afterwards
+
+INTAKE = {"mrf_id": "mrf-001", "vehicle_id": "KL-01-1234", "weight": 100.0, "operator_id": "x"}
+SALE = {
+    "mrf_id": "mrf-001", "category": "pet", "weight": 2.0, "unit_price": 18.0, "total_amount": 0,
+    "buyer_name": "Buyer", "operator_id": "x"
+}
+
+def _user(email: str) -> dict:
+    return {"email": email, "full_name": "New user", "role": "operator", "mrf_id": "mrf-001", "password": "secret"}
+
+def test_create_waste_intake_writes_once(client, operator, db_operations):
+    client.get("/api/v1/users/me", headers=operator)
+    db_operations.clear()
+
+    response = client.post("/api/v1/waste/intake", json=INTAKE, headers=operator)
+
+    assert response.status_code == 200
+    assert db_operations.on("waste_intake") == ["insert_one"]
+    assert db_operations.on("users") == []
+
+def test_create_sorted_waste_reads_only_the_intake(client, operator, db_operations):
+    intake_id = client.post("/api/v1/waste/intake", json=INTAKE, headers=operator).json()["_id"]
+    db_operations.clear()
+
+    response = client.post("/api/v1/waste/sort", json={
+        "intake_id": intake_id, "category": "pet", "weight": 10.0, "operator_id": "x"
+    }, headers=operator)
+
+    assert response.status_code == 200
+    assert response.json()["mrf_id"] == "mrf-001"
+    assert db_operations.on("waste_intake") == ["find_one"]
+    assert db_operations.on("sorted_waste") == ["insert_one"]
+
+def test_create_sale_writes_once(client, operator, db_operations):
+    client.get("/api/v1/users/me", headers=operator)
+    db_operations.clear()
+
+    response = client.post("/api/v1/sales/", json=SALE, headers=operator)
+
+    assert response.status_code == 200
+    assert response.json()["total_amount"] == 36.0
+    assert db_operations.on("waste_sales") == ["insert_one"]
+
+def test_update_sale_is_a_single_find_one_and_update(client, manager, db_operations):
+    sale_id = client.post("/api/v1/sales/", json=SALE, headers=manager).json()["_id"]
+    db_operations.clear()
+
+    response = client.put(f"/api/v1/sales/{sale_id}", json={**SALE, "weight": 3.0}, headers=manager)
+
+    assert response.status_code == 200
+    assert response.json()["total_amount"] == 54.0
+    assert db_operations.on("waste_sales") == ["find_one_and_update"]
+
+def test_create_waste_category_writes_once(client, manager, db_operations):
+    client.get("/api/v1/users/me", headers=manager)
+    db_operations.clear()
+
+    response = client.post("/api/v1/waste/categories", json={"name": "pet", "unit_price": 18.0}, headers=manager)
+
+    assert response.status_code == 200
+    assert db_operations.on("waste_categories").count("insert_one") == 1
+    assert "find_one" not in db_operations.on("waste_categories")
+
+def test_register_writes_once(client, db_operations):
+    response = client.post("/api/v1/auth/register", json=_user("new@example.com"))
+
+    assert response.status_code == 200
+    assert db_operations.on("users") == ["insert_one"]
+
+def test_register_rejects_duplicate_email(client):
+    assert client.post("/api/v1/auth/register", json=_user("twice@example.com")).status_code == 200
+    response = client.post("/api/v1/auth/register", json=_user("twice@example.com"))
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"
+
+def test_create_user_rejects_duplicate_email(client, manager):
+    assert client.post("/api/v1/users/", json=_user("dup@example.com"), headers=manager).status_code == 200
+    response = client.post("/api/v1/users/", json=_user("dup@example.com"), headers=manager)
+
+    assert response.status_code == 400
+
+def test_update_user_is_a_single_find_one_and_update(client, db, manager, db_operations):
+    user_id = str(make_user(db, "operator")["_id"])
+    client.get("/api/v1/users/me", headers=manager)
+    db_operations.clear()
+
+    response = client.put(f"/api/v1/users/{user_id}", json={**_user("renamed@example.com"), "full_name": "Renamed"}, headers=manager)
+
+    assert response.status_code == 200
+    assert response.json()["full_name"] == "Renamed"
+    assert db_operations.on("users") == ["find_one_and_update"]
+
+def test_unique_index_on_duplicates_is_fatal(db):
+    run(db["users"].drop_indexes())
+    duplicate = make_user(db, "operator")
+    run(db["users"].insert_one({**duplicate, "_id": None}))
+
+    with pytest.raises(OperationFailure):
+        run(ensure_indexes(db, ["users"]))